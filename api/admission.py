@@ -0,0 +1,295 @@
+"""
+Admission control for writes
+
+SQLite has a single writer. During a lunch rush every POST /orders used
+to open its own transaction in its own threadpool thread, and they all
+waited on the write lock in busy_timeout, sleeping and retrying; the
+slowest waited seconds, and the threads they held were missing for
+everything else.
+
+Orders and product changes now go to a per-database GroupCommitWriter
+instead. Each worker runs one writer task per database, which takes the
+queued writes, up to WRITE_BATCH_SIZE at a time, and runs them in one
+transaction (group commit): the write lock is taken once per batch with
+BEGIN IMMEDIATE, each write runs in its own savepoint so a failing one is
+rolled back alone, and one COMMIT makes the whole batch durable. A
+worker therefore never competes with itself for the lock, and the cost
+of a commit is shared by every order in the batch.
+
+The queue is bounded, and AdmissionMiddleware enforces the bound at the
+door: a write takes its place in the queue when the request arrives,
+before its body is read and validated, and gives it back when the
+response is sent. When the queue is full, or a client sends more writes
+than its token bucket allows (RateLimiter, off by default), the request is refused at
+once with 429 and a Retry-After header, instead of adding to a line of
+requests that the worker could only work through too late. Reads never
+go through the writer or the middleware, so browsing the catalog keeps
+its share of the worker during a burst of orders.
+
+Limits are per worker process: with API_WORKERS=4 a client may send
+four times the configured rate in total. The writer's SQL runs outside
+the requests, so it is not in their query metrics; write_batch_size
+shows how many writes each commit carried.
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+import metrics
+
+logger = logging.getLogger("admission")
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Write queue is full")
+        self.retry_after = retry_after
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    # Whole seconds, at least one
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class RateLimiter:
+    """
+    A token bucket per client: `burst` writes at once, then `rate` per
+    second. A rate of 0 admits everything.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # client -> (tokens, when counted)
+
+    def acquire(self, client: str, now: float = None) -> float:
+        """Take a token for `client`: 0 if admitted, else seconds until one is available."""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, counted = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - counted) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                return (1 - tokens) / self.rate
+            if client not in self._buckets and len(self._buckets) >= self.max_clients:
+                self._forget_idle(now)
+            self._buckets[client] = (tokens - 1, now)
+            return 0.0
+
+    def _forget_idle(self, now: float):
+        # Clients whose bucket has refilled are the same as new ones
+        refill = self.burst / self.rate
+        self._buckets = {
+            client: bucket for client, bucket in self._buckets.items() if now - bucket[1] < refill
+        }
+
+
+class GroupCommitWriter:
+    """
+    Runs write jobs against one database in batches, one transaction per
+    batch.
+
+    A job is a function called with a session on the writer's thread; it
+    writes without committing and returns its result. `submit` waits for
+    the batch the job ran in to commit. With `max_queue` 0 there is no
+    queue: every job runs and commits on its own, as before the writer.
+    """
+
+    def __init__(self, session_factory, max_queue: int, max_batch: int, on_batch=None):
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        # Called with the number of jobs of each batch that committed
+        self.on_batch = on_batch
+        self.pending = 0  # admitted writes not answered yet
+        self._queue = deque()  # (job, future)
+        self._wakeup = None
+        self._task = None
+        self._loop = None
+        self._closing = False
+        self._seconds_per_job = 0.0  # moving average, for Retry-After
+
+    def __len__(self):
+        return len(self._queue)
+
+    def admit(self) -> bool:
+        """Take a place for a write that will be submitted; False if the queue is full."""
+        if self.max_queue and self.pending >= self.max_queue:
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        self.pending -= 1
+
+    def retry_after(self) -> float:
+        """Seconds until the queue has drained at the recent pace."""
+        return max(self.pending, len(self._queue)) * self._seconds_per_job
+
+    async def submit(self, job):
+        if not self.max_queue:
+            # In the request threadpool, like any other endpoint
+            outcomes = await run_in_threadpool(self._run_batch, [job])
+            return self._unwrap(outcomes[0])
+        # Writes that were not admitted first can still overflow it
+        if len(self._queue) >= self.max_queue:
+            raise QueueFull(self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._start(loop)
+        future = loop.create_future()
+        self._queue.append((job, future))
+        self._wakeup.set()
+        return self._unwrap(await future)
+
+    def _start(self, loop):
+        # Jobs of another (finished) event loop can no longer be answered
+        self._queue.clear()
+        self._loop = loop
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        # A fresh context: the task must not keep the request context of
+        # whoever happened to submit first, e.g. its query metrics
+        self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def close(self):
+        """Finish the queued jobs and stop."""
+        if self._task is not None and not self._task.done():
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+            start = time.perf_counter()
+            try:
+                outcomes = await asyncio.to_thread(self._run_batch, [job for job, _ in batch])
+            except Exception as e:
+                # E.g. no session could be opened: the batch fails, the writer goes on
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            seconds = (time.perf_counter() - start) / len(batch)
+            self._seconds_per_job = seconds if not self._seconds_per_job else 0.8 * self._seconds_per_job + 0.2 * seconds
+            for (_, future), outcome in zip(batch, outcomes):
+                # The client may have disconnected; the write stands
+                if not future.done():
+                    future.set_result(outcome)
+
+    def _run_batch(self, jobs):
+        """(succeeded, result or exception) of each job, after committing the batch."""
+        outcomes = []
+        db = self.session_factory()
+        try:
+            # Take the write lock now rather than halfway through the batch,
+            # and start the transaction the savepoints are nested in
+            db.execute(text("BEGIN IMMEDIATE"))
+            for job in jobs:
+                try:
+                    with db.begin_nested():
+                        result = job(db)
+                    outcomes.append((True, result))
+                except Exception as e:
+                    outcomes.append((False, e))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # Nothing of the batch was written: jobs that had succeeded fail with the commit
+            failed = [(False, value if not succeeded else e) for succeeded, value in outcomes]
+            return failed + [(False, e)] * (len(jobs) - len(failed))
+        finally:
+            db.close()
+        if self.on_batch is not None:
+            try:
+                self.on_batch(len(jobs))
+            except Exception:
+                # The batch is committed whatever its metrics do
+                logger.exception("on_batch failed")
+        return outcomes
+
+    @staticmethod
+    def _unwrap(outcome):
+        succeeded, value = outcome
+        if not succeeded:
+            raise value
+        return value
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware refusing writes with 429 before their body is read.
+
+    `writes` are the (method, compiled path pattern) of the write routes,
+    `writer_for(scope)` is the GroupCommitWriter of the request's
+    database (None lets the request through), and `client_for(scope)`
+    tells clients apart for `limiter`; clients in `exempt` are not
+    limited.
+    """
+
+    def __init__(self, app, writes, writer_for, limiter: RateLimiter, client_for, exempt=()):
+        self.app = app
+        self.writes = writes
+        self.writer_for = writer_for
+        self.limiter = limiter
+        self.client_for = client_for
+        self.exempt = set(exempt)
+
+    def is_write(self, scope) -> bool:
+        return any(
+            scope["method"] == method and pattern.fullmatch(scope["path"])
+            for method, pattern in self.writes
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.is_write(scope):
+            await self.app(scope, receive, send)
+            return
+
+        client = self.client_for(scope)
+        if client not in self.exempt:
+            wait = self.limiter.acquire(client)
+            if wait:
+                await refuse(scope, receive, send, "rate_limit", wait, "Too many requests, try again later")
+                return
+
+        writer = self.writer_for(scope)
+        if writer is None:
+            await self.app(scope, receive, send)
+            return
+        if not writer.admit():
+            await refuse(scope, receive, send, "queue_full", writer.retry_after(), "Server is busy, try again later")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            writer.release()
+
+
+async def refuse(scope, receive, send, reason: str, retry_after: float, detail: str):
+    metrics.write_rejections.inc((reason,))
+    response = JSONResponse({"detail": detail}, status_code=429, headers=retry_after_header(retry_after))
+    await response(scope, receive, send)
@@ -0,0 +1,309 @@
+"""
+Cold archive for old completed and cancelled orders
+
+Orders in a final status stop changing, yet every scan of the hot tables
+keeps paying for them. The archival job moves those older than
+ARCHIVE_AFTER_DAYS into a separate SQLite file per branch, so the hot
+database only holds recent orders and stays roughly the same size: the
+pages freed by deleted orders are reused by new ones.
+
+Each archived order is one row holding the order exactly as the API
+returns it, as zlib-compressed JSON, so `GET /orders/{id}` can fall back
+to a single primary-key lookup. One order compresses poorly on its own,
+so rows are compressed against a preset dictionary made of the first
+archived orders and stored in the archive (about 3x smaller). A rollup
+table keeps per-status counts and totals so /stats can add the archive
+without scanning it. Rows also keep the customer's normalized phone,
+indexed, for customer histories.
+
+The two databases cannot commit together, so a batch moves in three
+idempotent steps: copy the orders into the archive, delete them from
+the hot database, then add them to the rollup. Every run first finishes
+batches an earlier run left half done. The API refuses new orders with
+an archived id; an old order whose id is somehow archived already is
+left in the hot database with a warning rather than deleted.
+
+Run it from cron, e.g. nightly:
+
+    python /srv/api/archive.py --days 90
+"""
+
+import argparse
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, create_engine, event, text
+
+from customers import normalize_phone
+
+logger = logging.getLogger("archive")
+
+BATCH_SIZE = 500
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS archived_orders (
+        id VARCHAR PRIMARY KEY,
+        status VARCHAR NOT NULL,
+        total INTEGER NOT NULL,
+        created_at DATETIME NOT NULL,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        summarized BOOLEAN NOT NULL DEFAULT 0,
+        dictionary_id INTEGER,
+        data BLOB NOT NULL,
+        phone VARCHAR
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS dictionaries (id INTEGER PRIMARY KEY, data BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_archived_orders_pending ON archived_orders (id) WHERE NOT summarized",
+    """
+    CREATE TABLE IF NOT EXISTS archive_summary (
+        status VARCHAR PRIMARY KEY,
+        orders INTEGER NOT NULL,
+        total INTEGER NOT NULL
+    )
+    """,
+]
+
+# After the phone column is added to archives created without it
+PHONE_INDEX = "CREATE INDEX IF NOT EXISTS ix_archived_orders_phone ON archived_orders (phone, created_at)"
+
+
+def set_archive_pragmas(dbapi_connection, connection_record):
+    # Workers read the archive while the archival job writes it
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+# zlib only looks back 32 KB, so a longer dictionary would not help
+DICTIONARY_SIZE = 32 * 1024
+
+
+def encode(order_json: str, dictionary: bytes) -> bytes:
+    compressor = zlib.compressobj(9, zdict=dictionary)
+    return compressor.compress(order_json.encode("utf-8")) + compressor.flush()
+
+
+def decode(data: bytes, dictionary: bytes) -> dict:
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    return json.loads(decompressor.decompress(data) + decompressor.flush())
+
+
+class OrderArchive:
+    """The archive database of one branch."""
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        event.listen(self.engine, "connect", set_archive_pragmas)
+        with self.engine.begin() as conn:
+            for statement in SCHEMA:
+                conn.exec_driver_sql(statement)
+            columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(archived_orders)")}
+            if "phone" not in columns:
+                conn.exec_driver_sql("ALTER TABLE archived_orders ADD COLUMN phone VARCHAR")
+            conn.exec_driver_sql(PHONE_INDEX)
+        self._dictionaries = {}
+
+    def _dictionary(self, conn, dictionary_id):
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            dictionary = conn.execute(
+                text("SELECT data FROM dictionaries WHERE id = :id"), {"id": dictionary_id}
+            ).scalar()
+            self._dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def get(self, order_id: str):
+        """The archived order as a dict in the API's wire format, or None."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT dictionary_id, data FROM archived_orders WHERE id = :id"), {"id": order_id}
+            ).first()
+            if row is None:
+                return None
+            return decode(row.data, self._dictionary(conn, row.dictionary_id))
+
+    def history(self, phone: str, limit: int, before=None):
+        """Archived orders of the customer with this normalized phone, newest first, as dicts."""
+        query = "SELECT dictionary_id, data FROM archived_orders WHERE phone = :phone"
+        if before is not None:
+            query += " AND created_at < :before"
+        query += " ORDER BY created_at DESC LIMIT :limit"
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), {"phone": phone, "before": before, "limit": limit}).fetchall()
+            return [decode(row.data, self._dictionary(conn, row.dictionary_id)) for row in rows]
+
+    def contains(self, order_id: str) -> bool:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT 1 FROM archived_orders WHERE id = :id"), {"id": order_id}
+            ).scalar() is not None
+
+    def summary(self) -> dict:
+        """status -> (orders, total) of every summarized archived order."""
+        with self.engine.connect() as conn:
+            return {
+                status: (orders, total)
+                for status, orders, total in conn.exec_driver_sql(
+                    "SELECT status, orders, total FROM archive_summary"
+                )
+            }
+
+    def store(self, orders):
+        """
+        Step 1: copy Order schemas into the archive, unsummarized. Orders
+        whose id is archived already are not copied; returns the ids that
+        were.
+        """
+        with self.engine.begin() as conn:
+            query = text("SELECT id FROM archived_orders WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+            taken = {row[0] for row in conn.execute(query, {"ids": [order.id for order in orders]})}
+            orders = [order for order in orders if order.id not in taken]
+            if not orders:
+                return []
+            documents = [order.model_dump_json() for order in orders]
+            dictionary_id = conn.exec_driver_sql("SELECT max(id) FROM dictionaries").scalar()
+            if dictionary_id is None:
+                # The first orders archived stand in for all later ones
+                dictionary = "\n".join(documents).encode("utf-8")[-DICTIONARY_SIZE:]
+                # Not cached until committed: a rollback would reuse the id
+                dictionary_id = conn.execute(
+                    text("INSERT INTO dictionaries (data) VALUES (:data)"), {"data": dictionary}
+                ).lastrowid
+            else:
+                dictionary = self._dictionary(conn, dictionary_id)
+
+            conn.execute(
+                text(
+                    "INSERT INTO archived_orders (id, status, total, created_at, dictionary_id, data, phone) "
+                    "VALUES (:id, :status, :total, :created_at, :dictionary_id, :data, :phone)"
+                ),
+                [
+                    {
+                        "id": order.id,
+                        "status": order.status,
+                        "total": order.total,
+                        "created_at": order.createdAt,
+                        "dictionary_id": dictionary_id,
+                        "data": encode(document, dictionary),
+                        "phone": normalize_phone(order.customer.phone) or "",
+                    }
+                    for order, document in zip(orders, documents)
+                ]
+            )
+        return [order.id for order in orders]
+
+    def index_phones(self, batch_size: int = BATCH_SIZE) -> int:
+        """Fill in the phone of orders archived before it was stored; returns how many."""
+        indexed = 0
+        while True:
+            with self.engine.begin() as conn:
+                rows = conn.exec_driver_sql(
+                    "SELECT id, dictionary_id, data FROM archived_orders WHERE phone IS NULL LIMIT ?", (batch_size,)
+                ).fetchall()
+                if not rows:
+                    return indexed
+                conn.execute(
+                    text("UPDATE archived_orders SET phone = :phone WHERE id = :id"),
+                    [
+                        {
+                            "id": row.id,
+                            # "": no usable phone, so the row is not looked at again
+                            "phone": normalize_phone(
+                                decode(row.data, self._dictionary(conn, row.dictionary_id))["customer"]["phone"]
+                            ) or "",
+                        }
+                        for row in rows
+                    ]
+                )
+            indexed += len(rows)
+
+    def pending_ids(self):
+        """Ids copied into the archive but not yet in the rollup."""
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.exec_driver_sql("SELECT id FROM archived_orders WHERE NOT summarized")]
+
+    def summarize(self):
+        """Step 3: add pending orders to the rollup, once they left the hot database."""
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO archive_summary (status, orders, total) "
+                "SELECT status, count(*), sum(total) FROM archived_orders WHERE NOT summarized GROUP BY status "
+                "ON CONFLICT(status) DO UPDATE SET "
+                "orders = orders + excluded.orders, total = total + excluded.total"
+            )
+            conn.exec_driver_sql("UPDATE archived_orders SET summarized = 1 WHERE NOT summarized")
+
+
+def archive_branch(server, branch, days: int, batch_size: int = BATCH_SIZE) -> int:
+    """Move old final orders of `branch` into its archive; returns how many moved."""
+    archive = server.archives[branch.engine]
+    cutoff = datetime.now() - timedelta(days=days)
+    moved = 0
+
+    # Finish a batch an interrupted run copied but did not delete
+    pending = archive.pending_ids()
+    if pending:
+        server.delete_orders(branch, pending)
+    archive.summarize()
+    # Orders archived before the phone column existed
+    archive.index_phones(batch_size)
+
+    # Old orders whose id is taken in the archive by another order
+    kept = set()
+    while True:
+        db = branch.SessionLocal()
+        try:
+            old_orders = (
+                db.query(server.OrderModel)
+                .filter(
+                    server.OrderModel.status.in_(server.FINAL_STATUSES),
+                    server.OrderModel.created_at < cutoff,
+                    server.OrderModel.id.notin_(kept)
+                )
+                .order_by(server.OrderModel.created_at)
+                .limit(batch_size)
+                .all()
+            )
+            if not old_orders:
+                break
+            stored = archive.store(server.load_orders(db, old_orders))
+        finally:
+            db.close()
+
+        for order_id in {order.id for order in old_orders}.difference(stored):
+            logger.warning("Order %s not archived: another order with its id is archived already", order_id)
+            kept.add(order_id)
+        if stored:
+            server.delete_orders(branch, stored)
+        archive.summarize()
+        moved += len(stored)
+
+    # Workers rebuild /stats with the new rollup
+    server.invalidate_stats(branch)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed and cancelled orders to the archive")
+    parser.add_argument("--days", type=int, default=None, help="archive final orders older than this")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    import server
+    server.init()
+
+    days = args.days if args.days is not None else server.ARCHIVE_AFTER_DAYS
+    for branch in server.branches.branches.values():
+        start = time.perf_counter()
+        moved = archive_branch(server, branch, days, args.batch_size)
+        print(f"{branch.slug}: archived {moved} orders older than {days} days in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
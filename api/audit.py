@@ -0,0 +1,303 @@
+"""
+Audit log of changes to products and orders
+
+Editing a product or changing an order's status overwrites the row, so
+the database alone cannot say who changed a price, or when. Every such
+change is also appended to an audit log: who made it (the actor), what
+it changed as [before, after] per field, and when. The log lives in its
+own SQLite file per branch, next to the archive, so writing it never
+takes the write lock of the orders.
+
+Requests only append the event to an in-memory buffer once their own
+change is committed. A background thread per worker writes the buffer
+every AUDIT_FLUSH_SECONDS, or sooner once AUDIT_SEGMENT_EVENTS are
+waiting, as one segment: a row holding the events as zlib-compressed
+JSON lines, compressed against a preset dictionary of the words every
+event repeats, so even a segment of one event is small. Segments are
+indexed by the time they span and by the products and orders they
+contain, and triggers refuse to update or delete them.
+
+The events of a worker that is killed before flushing are lost, at most
+AUDIT_FLUSH_SECONDS of them; a normal shutdown writes the buffer first.
+
+Any product or order can be reconstructed as it was at a point in time:
+take it as it is now (or as it was deleted) and undo, newest first, the
+changes made after that time (`state_at`). Products created before the
+audit log existed are taken to have existed all along.
+"""
+
+import json
+import logging
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.event import listen
+
+import metrics
+from order_status import utcnow
+
+logger = logging.getLogger("audit")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS audit_segments (
+        id INTEGER PRIMARY KEY,
+        first_at DATETIME NOT NULL,
+        last_at DATETIME NOT NULL,
+        events INTEGER NOT NULL,
+        dictionary INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_audit_segments_last_at ON audit_segments (last_at)",
+    """
+    CREATE TABLE IF NOT EXISTS audit_entities (
+        entity VARCHAR NOT NULL,
+        entity_id VARCHAR NOT NULL,
+        segment_id INTEGER NOT NULL,
+        PRIMARY KEY (entity, entity_id, segment_id)
+    ) WITHOUT ROWID
+    """,
+    # Append-only
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_segments_no_update BEFORE UPDATE ON audit_segments
+    BEGIN SELECT RAISE(ABORT, 'The audit log is append-only'); END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_segments_no_delete BEFORE DELETE ON audit_segments
+    BEGIN SELECT RAISE(ABORT, 'The audit log is append-only'); END
+    """,
+]
+
+# Preset dictionaries, by the id stored with each segment. Never change
+# one that segments were written with; add a new one instead
+DICTIONARIES = {
+    1: (
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "telegram:", "entity": "order", "id": "", '
+        b'"action": "status", "changes": {"status": ["processing", "delivering"], "version": [0, 1]}}\n'
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "telegram:", "entity": "order", "id": "", '
+        b'"action": "status", "changes": {"status": ["delivering", "completed"], "version": [1, 2]}}\n'
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "ip:127.0.0.1", "entity": "order", "id": "", '
+        b'"action": "status", "changes": {"status": ["processing", "cancelled"], "version": [0, 1]}}\n'
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "ip:", "entity": "order", "id": "", '
+        b'"action": "rating", "changes": {"rating": [null, 5]}}\n'
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "telegram:", "entity": "product", "id": "p", '
+        b'"action": "create", "changes": {"name": [null, ""], "description": [null, ""], "price": [null, 0], '
+        b'"category": [null, "classic"], "image": [null, "/uploads/p.jpg"], "popular": [null, false]}}\n'
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "ip:", "entity": "product", "id": "p", '
+        b'"action": "update", "changes": {"price": [0, 0], "popular": [false, true], "category": ["meat", '
+        b'"vegetable"], "image": ["/uploads/p.png", "/uploads/p.webp"]}}\n'
+        b'{"at": "2026-01-01T12:00:00.000000", "actor": "ip:", "entity": "product", "id": "p", '
+        b'"action": "delete", "changes": {"name": ["", null], "description": ["", null], "price": [0, null], '
+        b'"category": ["special", null], "image": ["/uploads/p.jpg", null], "popular": [true, null]}}\n'
+    ),
+}
+DICTIONARY = max(DICTIONARIES)
+
+CREATE = "create"
+DELETE = "delete"
+
+
+def set_audit_pragmas(dbapi_connection, connection_record):
+    # Every worker appends to the same file
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def to_utc(value: datetime) -> datetime:
+    """`value` as naive UTC, like every timestamp in the log."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode(events: List[dict], dictionary: bytes) -> bytes:
+    compressor = zlib.compressobj(9, zdict=dictionary)
+    lines = "".join(json.dumps(event) + "\n" for event in events)
+    return compressor.compress(lines.encode("utf-8")) + compressor.flush()
+
+
+def decode(data: bytes, dictionary: bytes) -> List[dict]:
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    lines = (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+    return [json.loads(line) for line in lines.splitlines()]
+
+
+def diff(before: Optional[dict], after: Optional[dict]) -> Dict[str, list]:
+    """field -> [before, after] of the fields that differ; None stands for no entity."""
+    before, after = before or {}, after or {}
+    return {
+        field: [before.get(field), after.get(field)]
+        for field in dict.fromkeys([*before, *after])
+        if field != "id" and before.get(field) != after.get(field)
+    }
+
+
+def state_at(current: Optional[dict], events: List[dict], at: datetime) -> Optional[dict]:
+    """
+    The entity as it was at `at`, from `current` (None: it does not
+    exist now) and its events, oldest first.
+    """
+    state = dict(current) if current is not None else None
+    for event in reversed(events):
+        if datetime.fromisoformat(event["at"]) <= at:
+            break
+        if event["action"] == CREATE:
+            state = None
+        elif event["action"] == DELETE:
+            state = {"id": event["id"], **{field: before for field, (before, _) in event["changes"].items()}}
+        elif state is not None:
+            for field, (before, _) in event["changes"].items():
+                state[field] = before
+    return state
+
+
+class AuditLog:
+    """The audit database of one branch, and this worker's events not written yet."""
+
+    def __init__(self, url: str, flush_interval: float, segment_events: int):
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        listen(self.engine, "connect", set_audit_pragmas)
+        with self.engine.begin() as conn:
+            for statement in SCHEMA:
+                conn.exec_driver_sql(statement)
+        self.flush_interval = flush_interval
+        self.segment_events = segment_events
+        self._buffer = []
+        self._lock = threading.Lock()
+        # One segment at a time, so events are written in the order they were buffered
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def record(self, entity: str, entity_id: str, action: str, changes: Dict[str, list], actor: str,
+               at: Optional[datetime] = None):
+        """Buffer a committed change; an update that changed nothing is not recorded."""
+        if not changes and action not in (CREATE, DELETE):
+            return
+        event = {
+            "at": to_utc(at or utcnow()).isoformat(timespec="microseconds"),
+            "actor": actor,
+            "entity": entity,
+            "id": entity_id,
+            "action": action,
+            "changes": changes,
+        }
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.segment_events
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing the audit log failed; retrying")
+
+    def close(self):
+        """Stop the background thread and write what is buffered."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.engine.dispose()
+
+    def flush(self) -> int:
+        """Write the buffered events as one segment; returns how many."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return 0
+            try:
+                self._write_segment(events)
+            except Exception:
+                # Kept for the next attempt, ahead of newer events
+                with self._lock:
+                    self._buffer[:0] = events
+                raise
+        for event in events:
+            metrics.audit_events.inc((event["entity"],))
+        return len(events)
+
+    def _write_segment(self, events: List[dict]):
+        events.sort(key=lambda event: event["at"])
+        with self.engine.begin() as conn:
+            segment_id = conn.execute(
+                text(
+                    "INSERT INTO audit_segments (first_at, last_at, events, dictionary, data) "
+                    "VALUES (:first_at, :last_at, :events, :dictionary, :data)"
+                ),
+                {
+                    "first_at": datetime.fromisoformat(events[0]["at"]),
+                    "last_at": datetime.fromisoformat(events[-1]["at"]),
+                    "events": len(events),
+                    "dictionary": DICTIONARY,
+                    "data": encode(events, DICTIONARIES[DICTIONARY]),
+                }
+            ).lastrowid
+            conn.execute(
+                text(
+                    "INSERT OR IGNORE INTO audit_entities (entity, entity_id, segment_id) "
+                    "VALUES (:entity, :entity_id, :segment_id)"
+                ),
+                [
+                    {"entity": entity, "entity_id": entity_id, "segment_id": segment_id}
+                    for entity, entity_id in dict.fromkeys((event["entity"], event["id"]) for event in events)
+                ]
+            )
+
+    def events(self, entity: str, entity_id: str, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[dict]:
+        """
+        Events of one product or order between `since` and `until`, oldest
+        first. Includes what this worker still buffers, but not yet what
+        other workers buffer.
+        """
+        self.flush()
+        query = (
+            "SELECT s.dictionary, s.data FROM audit_entities e JOIN audit_segments s ON s.id = e.segment_id "
+            "WHERE e.entity = :entity AND e.entity_id = :entity_id"
+        )
+        if since is not None:
+            query += " AND s.last_at >= :since"
+        if until is not None:
+            query += " AND s.first_at <= :until"
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(query), {"entity": entity, "entity_id": entity_id, "since": since, "until": until}
+            ).fetchall()
+        found = [
+            event
+            for row in rows
+            for event in decode(row.data, DICTIONARIES[row.dictionary])
+            if event["entity"] == entity and event["id"] == entity_id
+            and (since is None or datetime.fromisoformat(event["at"]) >= since)
+            and (until is None or datetime.fromisoformat(event["at"]) <= until)
+        ]
+        # Workers write their segments independently
+        found.sort(key=lambda event: event["at"])
+        return found
+
+    def size(self) -> Dict[str, int]:
+        """Segments, events and compressed bytes written so far."""
+        with self.engine.connect() as conn:
+            segments, events, size = conn.exec_driver_sql(
+                "SELECT count(*), coalesce(sum(events), 0), coalesce(sum(length(data)), 0) FROM audit_segments"
+            ).one()
+        return {"segments": segments, "events": events, "bytes": size}
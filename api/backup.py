@@ -0,0 +1,235 @@
+"""
+Online backups of the SQLite databases
+
+Copying denov_baraka.db while the API runs can tear the copy, so backups
+go through SQLite's online backup API instead. The copy runs in a
+background thread, a few hundred pages per step with a short pause
+between steps, so it never holds the GIL or the disk for long.
+
+The source connection keeps one read transaction open for the whole
+copy. In WAL mode a reader does not block writers, so orders keep being
+written, and every step copies from the same snapshot. Without it, each
+write by another connection would restart the backup from the first
+page, and a busy database would never finish.
+
+Snapshots are written to a temporary file and renamed into place, so a
+snapshot file is always complete. Scheduled snapshots keep the newest
+BACKUP_KEEP per database.
+
+Restore with the API and the bot stopped (workers cache catalog and
+snapshot ids):
+
+    python backup.py list
+    python backup.py restore backups/denov_baraka-20260101-030000.db
+
+Snapshots go to BACKUP_DIR, by default the backups directory next to the
+databases.
+"""
+
+import argparse
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger("backups")
+
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.005
+
+SNAPSHOT_SUFFIX = ".db"
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+TIMESTAMP_PATTERN = r"\d{8}-\d{6}"
+
+
+class BackupResult(NamedTuple):
+    path: str
+    pages: int
+    seconds: float
+
+
+def backup(source: str, destination: str, pages_per_step: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP) -> BackupResult:
+    """Copy the database at `source` to `destination` without blocking writers."""
+    start = time.perf_counter()
+    temporary = destination + ".part"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+
+    source_conn = sqlite3.connect(source, isolation_level=None, check_same_thread=False)
+    target_conn = sqlite3.connect(temporary, isolation_level=None)
+    try:
+        source_conn.execute("PRAGMA busy_timeout=5000")
+        # Pin one snapshot for every step (see the module docstring)
+        source_conn.execute("BEGIN")
+        source_conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        pages = source_conn.execute("PRAGMA page_count").fetchone()[0]
+        source_conn.backup(target_conn, pages=pages_per_step, sleep=sleep)
+        source_conn.execute("COMMIT")
+
+        # A self-contained file, readable without a -wal next to it
+        target_conn.execute("PRAGMA journal_mode=DELETE")
+        if target_conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise sqlite3.DatabaseError(f"Backup of {source} failed its integrity check")
+    finally:
+        source_conn.close()
+        target_conn.close()
+
+    with open(temporary, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(temporary, destination)
+    return BackupResult(destination, pages, time.perf_counter() - start)
+
+
+def snapshot_name(database: str, when: Optional[datetime] = None) -> str:
+    stem = os.path.splitext(os.path.basename(database))[0]
+    return f"{stem}-{(when or datetime.now()).strftime(TIMESTAMP_FORMAT)}{SNAPSHOT_SUFFIX}"
+
+
+def list_snapshots(directory: str, database: Optional[str] = None) -> List[str]:
+    """Snapshot files in `directory`, oldest first, optionally of one database."""
+    if not os.path.isdir(directory):
+        return []
+    if database:
+        # Exactly the stem and a timestamp: branch "x" must not match branch "x-y"'s snapshots
+        stem = os.path.splitext(os.path.basename(database))[0]
+        pattern = re.compile(f"{re.escape(stem)}-{TIMESTAMP_PATTERN}{re.escape(SNAPSHOT_SUFFIX)}")
+        matches = pattern.fullmatch
+    else:
+        matches = lambda name: name.endswith(SNAPSHOT_SUFFIX)
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if matches(name))
+
+
+def rotate(directory: str, database: str, keep: int) -> List[str]:
+    """Delete all but the newest `keep` snapshots of `database`; returns the deleted paths."""
+    snapshots = list_snapshots(directory, database)
+    expired = snapshots[:-keep] if keep > 0 else []
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+def snapshot_all(databases: List[str], directory: str, keep: int) -> List[BackupResult]:
+    """
+    Back up every database into `directory` and rotate old snapshots.
+
+    Several API workers may try at once; a lock file lets only one of
+    them run, and the others return no results.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return []
+        results = []
+        now = datetime.now()
+        for database in databases:
+            if not os.path.exists(database):
+                continue
+            result = backup(database, os.path.join(directory, snapshot_name(database, now)))
+            logger.info("Backed up %s (%d pages) in %.1fs", database, result.pages, result.seconds)
+            rotate(directory, database, keep)
+            results.append(result)
+        return results
+
+
+class BackupScheduler:
+    """Background thread taking snapshots every `interval` seconds, or only when triggered if None."""
+
+    def __init__(self, databases, directory: str, interval: Optional[float], keep: int):
+        self.databases = databases
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="backups", daemon=True)
+
+    @property
+    def started(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if not self._thread.is_alive():
+                self._thread.start()
+
+    def trigger(self):
+        """Take a snapshot now instead of at the next interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            if not self._wake.wait(self.interval) and self.interval is None:
+                continue
+            self._wake.clear()
+            try:
+                snapshot_all(self.databases, self.directory, self.keep)
+            except Exception:
+                logger.exception("Backup failed")
+
+
+def restore(snapshot: str, database: str) -> BackupResult:
+    """
+    Replace `database` with `snapshot`, keeping a copy of the current one.
+
+    Uses the backup API into the live file, so it is safe even if a
+    process still has the database open, but API workers must be
+    restarted afterwards to drop their caches.
+    """
+    if os.path.exists(database):
+        directory = os.path.dirname(os.path.abspath(snapshot))
+        backup(database, os.path.join(directory, "pre-restore-" + snapshot_name(database)))
+
+    start = time.perf_counter()
+    source_conn = sqlite3.connect(snapshot)
+    target_conn = sqlite3.connect(database)
+    try:
+        target_conn.execute("PRAGMA busy_timeout=5000")
+        source_conn.backup(target_conn)
+        pages = target_conn.execute("PRAGMA page_count").fetchone()[0]
+        target_conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        source_conn.close()
+        target_conn.close()
+    return BackupResult(database, pages, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up and restore the API databases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="snapshot every database now")
+    commands.add_parser("list", help="list snapshots")
+    restore_parser = commands.add_parser("restore", help="restore a snapshot (stop the API first)")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("--database", help="database to overwrite (default: the one the snapshot was taken of)")
+    args = parser.parse_args()
+
+    # Only the settings: nothing here should open the databases
+    import server
+
+    if args.command == "create":
+        for result in snapshot_all(server.backup_databases(), server.BACKUP_DIR, server.BACKUP_KEEP):
+            print(f"{result.path}: {result.pages} pages in {result.seconds:.1f}s")
+    elif args.command == "list":
+        for path in list_snapshots(server.BACKUP_DIR):
+            print(f"{path}  {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    else:
+        database = args.database
+        if database is None:
+            name = os.path.basename(args.snapshot).rsplit("-", 2)[0] + SNAPSHOT_SUFFIX
+            databases = {os.path.basename(path): path for path in server.backup_databases()}
+            if name not in databases:
+                parser.error(f"{name} is not one of the API's databases; pass --database")
+            database = databases[name]
+        result = restore(args.snapshot, database)
+        print(f"Restored {database} from {args.snapshot} ({result.pages} pages) in {result.seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+In-process caches kept coherent across workers
+
+Every worker holds its own copy of cached data (product catalog, order
+statistics). Coherence goes through the `cache_versions` table in the
+shared SQLite database: writers bump a named version counter in the same
+transaction as their change, and readers compare the counter with the
+version their copy was built from before using it. The check is a single
+primary-key lookup, much cheaper than rebuilding the cached value.
+
+Each branch database has its own counters, so caches keep one value per
+database (session bind). Only sessions without uncommitted writes fill
+them: one inside a group-commit batch may see a version and data that
+roll back, so on a miss it loads a value of its own. On a hit it can use
+the shared value, since the batch holds the write lock and the value's
+version was committed before.
+"""
+
+import threading
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+def current_version(db: Session, name: str) -> int:
+    version = db.execute(
+        text("SELECT version FROM cache_versions WHERE name = :name"),
+        {"name": name}
+    ).scalar()
+    return version or 0
+
+
+def all_versions(db: Session) -> Dict[str, int]:
+    return dict(db.execute(text("SELECT name, version FROM cache_versions")).fetchall())
+
+
+def has_pending_writes(db: Session) -> bool:
+    """Whether `db` holds writes not committed yet."""
+    # pysqlite only begins a transaction before a write (or an explicit BEGIN)
+    return db.connection().connection.driver_connection.in_transaction
+
+
+def bump_version(db: Session, name: str):
+    """Invalidate `name` in all workers once the current transaction commits."""
+    db.execute(
+        text(
+            "INSERT INTO cache_versions (name, version) VALUES (:name, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1"
+        ),
+        {"name": name}
+    )
+
+
+class VersionedCache:
+    """
+    A cached value per database, tied to a named version counter.
+
+    `loader` is called with a session to rebuild the value whenever the
+    counter has moved since the last load.
+    """
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._entries = {}  # bind -> (version, value)
+
+    def get(self, db: Session):
+        bind = db.get_bind()
+        # Read the version before loading so the value is never older than it
+        version = current_version(db, self.name)
+        entry = self._entries.get(bind)
+        if entry is None or entry[0] != version:
+            if has_pending_writes(db):
+                # The version or the data may roll back: load without sharing
+                return self.loader(db)
+            with self._lock:
+                entry = self._entries.get(bind)
+                if entry is None or entry[0] != version:
+                    entry = (version, self.loader(db))
+                    self._entries[bind] = entry
+        return entry[1]
+
+    def invalidate(self, db: Session):
+        bump_version(db, self.name)
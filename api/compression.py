@@ -0,0 +1,210 @@
+"""
+Response compression for the Denov Baraka Somsa API
+
+JSON responses above a size threshold are compressed on the fly with
+brotli or gzip, depending on what the client accepts. Uploaded static
+files are compressed once at upload time into `.br`/`.gz` siblings which
+are then served as-is, so nothing is compressed per request.
+
+Brotli is optional: install it with `pip install brotli`. Without it only
+gzip is offered.
+"""
+
+import gzip
+import os
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Content types worth compressing on the fly
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+# Precompressed siblings are only kept if they save at least this much
+PRECOMPRESS_MIN_SAVING = 0.1
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def supported_encodings() -> List[str]:
+    """Encodings this process can produce, most preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """Pick the first of `available` that the Accept-Encoding header allows."""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON/text responses above `minimum_size`.
+
+    The body is buffered before compressing, which is fine for the API's
+    JSON responses. Responses that already carry a Content-Encoding (e.g.
+    precompressed static files) are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.available = supported_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.available
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body_parts = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(body_parts)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+            headers["Content-Length"] = str(len(body))
+
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def precompress_file(path: str) -> List[str]:
+    """
+    Write `.br`/`.gz` siblings of `path` and return the ones that were kept.
+
+    Siblings that do not save at least PRECOMPRESS_MIN_SAVING are removed
+    again: already compressed formats like JPEG or WEBP gain nothing.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    kept = []
+    for encoding in supported_encodings():
+        sibling = path + (".br" if encoding == "br" else ".gz")
+        compressed = compress(data, encoding)
+        if len(compressed) <= len(data) * (1 - PRECOMPRESS_MIN_SAVING):
+            with open(sibling, "wb") as f:
+                f.write(compressed)
+            kept.append(sibling)
+        elif os.path.exists(sibling):
+            os.remove(sibling)
+    return kept
+
+
+def remove_precompressed(path: str):
+    """Remove any precompressed siblings of `path`."""
+    for suffix in (".br", ".gz"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves a `.br`/`.gz` sibling when the client accepts it.
+
+    Siblings themselves are not exposed under their own names.
+    """
+
+    async def get_response(self, path, scope):
+        if path.endswith((".br", ".gz")):
+            raise HTTPException(status_code=404)
+
+        response = await super().get_response(path, scope)
+        if response.status_code != 200:
+            return response
+
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(
+            request_headers.get("accept-encoding", ""), supported_encodings()
+        )
+        # Byte ranges always refer to the identity representation
+        if encoding is None or "range" in request_headers:
+            response.headers.add_vary_header("Accept-Encoding")
+            return response
+
+        sibling = path + (".br" if encoding == "br" else ".gz")
+        full_path, stat_result = self.lookup_path(sibling)
+        if stat_result is None:
+            response.headers.add_vary_header("Accept-Encoding")
+            return response
+
+        compressed = self.file_response(full_path, stat_result, scope)
+        # Keep the original media type rather than application/gzip
+        compressed.headers["Content-Type"] = response.headers["content-type"]
+        compressed.headers["Content-Encoding"] = encoding
+        compressed.headers.add_vary_header("Accept-Encoding")
+        return compressed
@@ -0,0 +1,96 @@
+"""
+Customer directory keyed by phone number
+
+Every order keeps the name, phone and address typed at checkout, but
+nothing used to link two orders of the same person. The directory holds
+one row per customer, keyed by the phone number in one normalized form,
+so "+998 90 123-45-67", "90 123 45 67" and "8 90 1234567" are the same
+customer. Orders reference their customer, and an index on
+(customer_id, created_at) lists a customer's orders newest first with
+one index seek, however many orders the shop has.
+
+A directory row is upserted in the order's own transaction, in one
+statement, so two orders from the same phone at once cannot create two
+customers. It keeps the latest name and address, to prefill checkout,
+and the last order, to reorder it.
+"""
+
+import re
+from typing import Optional
+
+from sqlalchemy.dialects.sqlite import insert
+
+# Uzbekistan: +998 and 9 national digits
+COUNTRY_CODE = "998"
+NATIONAL_DIGITS = 9
+MIN_DIGITS = 7
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """The phone as "+<digits>" with the country code, or None if it is too short to be one."""
+    digits = _NON_DIGITS.sub("", phone or "")
+    if len(digits) == NATIONAL_DIGITS:
+        digits = COUNTRY_CODE + digits
+    elif len(digits) == NATIONAL_DIGITS + 1 and digits.startswith("8"):
+        # The old domestic prefix: 8 90 123 45 67
+        digits = COUNTRY_CODE + digits[1:]
+    if len(digits) < MIN_DIGITS:
+        return None
+    return "+" + digits
+
+
+def remember_customer(db, model, customer, order_id: str, ordered_at) -> Optional[int]:
+    """Add or update the customer placing an order; returns their id, or None for an unusable phone."""
+    phone = normalize_phone(customer.phone)
+    if phone is None:
+        return None
+    statement = insert(model).values(
+        phone=phone,
+        name=customer.name,
+        address=customer.address,
+        order_count=1,
+        last_order_id=order_id,
+        last_order_at=ordered_at,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[model.phone],
+        set_={
+            "name": statement.excluded.name,
+            "address": statement.excluded.address,
+            "order_count": model.order_count + 1,
+            "last_order_id": statement.excluded.last_order_id,
+            "last_order_at": statement.excluded.last_order_at,
+        }
+    ).returning(model.id)
+    return db.execute(statement).scalar_one()
+
+
+def link_orders(conn):
+    """
+    Add the customers of orders that have none to the directory and link
+    them; used to fill the directory from existing orders.
+    """
+    conn.connection.driver_connection.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+    # Bare columns next to max() come from the row holding the maximum,
+    # i.e. the latest order of each customer
+    conn.exec_driver_sql(
+        "INSERT INTO customer_directory (phone, name, address, order_count, last_order_id, last_order_at) "
+        "SELECT phone, name, address, count(*), order_id, max(created_at) FROM ("
+        "  SELECT normalize_phone(c.phone) AS phone, c.name, c.address, o.id AS order_id, o.created_at"
+        "  FROM orders o JOIN customers c ON c.order_id = o.id WHERE o.customer_id IS NULL"
+        ") WHERE phone IS NOT NULL GROUP BY phone "
+        "ON CONFLICT (phone) DO UPDATE SET "
+        "order_count = order_count + excluded.order_count, "
+        "name = CASE WHEN excluded.last_order_at > last_order_at THEN excluded.name ELSE name END, "
+        "address = CASE WHEN excluded.last_order_at > last_order_at THEN excluded.address ELSE address END, "
+        "last_order_id = CASE WHEN excluded.last_order_at > last_order_at THEN excluded.last_order_id ELSE last_order_id END, "
+        "last_order_at = max(last_order_at, excluded.last_order_at)"
+    )
+    conn.exec_driver_sql(
+        "UPDATE orders SET customer_id = ("
+        "  SELECT d.id FROM customers c JOIN customer_directory d ON d.phone = normalize_phone(c.phone)"
+        "  WHERE c.order_id = orders.id"
+        ") WHERE customer_id IS NULL"
+    )
@@ -0,0 +1,82 @@
+"""
+Delivery zones and fees
+
+Delivery fees are computed server-side from the delivery zone table. Each
+zone lists the districts it covers. They are compiled into a phrase
+index so that an order address costs one normalization plus a few dict
+lookups, and results are cached per normalized address. Addresses that
+match no zone get the default fee.
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Different apostrophes people type in Uzbek (o‘zbek, oʻzbek, o`zbek)
+APOSTROPHES = str.maketrans({"‘": "'", "’": "'", "ʻ": "'", "ʼ": "'", "`": "'", "´": "'"})
+
+# Uzbek Cyrillic to Latin, so "Денов" and "Denov" normalize the same
+CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh",
+    "ъ": "'", "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya", "ў": "o'", "қ": "q", "ғ": "g'",
+    "ҳ": "h",
+}
+TRANSLITERATE = str.maketrans(CYRILLIC)
+
+_SEPARATORS = re.compile(r"[^\w']+")
+
+ADDRESS_CACHE_SIZE = 10000
+
+
+def normalize_address(address: str) -> str:
+    address = address.lower().translate(APOSTROPHES).translate(TRANSLITERATE)
+    return " ".join(_SEPARATORS.split(address)).strip()
+
+
+class DeliveryQuote(NamedTuple):
+    zone: Optional[str]
+    fee: int
+    free_delivery: bool
+
+
+class DeliveryZoneIndex:
+    """
+    Lookup structure built from delivery zone rows.
+
+    Every comma-separated district of a zone becomes a normalized phrase.
+    An address matches the zone of its longest matching phrase, so
+    "denov shahri" can have a different fee than the wider "denov".
+    """
+
+    def __init__(self, zones, default_fee: int, default_free_threshold: Optional[int]):
+        self.default_fee = default_fee
+        self.default_free_threshold = default_free_threshold
+        self.phrases = {}
+        self.max_words = 1
+        for zone in zones:
+            # Plain tuples: the rows may be expired once their session commits
+            entry = (zone.name, zone.fee, zone.free_threshold)
+            for district in zone.districts.split(","):
+                phrase = normalize_address(district)
+                if not phrase:
+                    continue
+                self.phrases.setdefault(phrase, entry)
+                self.max_words = max(self.max_words, len(phrase.split()))
+        self.match = lru_cache(maxsize=ADDRESS_CACHE_SIZE)(self._match)
+
+    def _match(self, normalized: str):
+        words = normalized.split()
+        for length in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                entry = self.phrases.get(" ".join(words[start:start + length]))
+                if entry is not None:
+                    return entry
+        return None, self.default_fee, self.default_free_threshold
+
+    def quote(self, address: str, subtotal: int) -> DeliveryQuote:
+        zone, fee, free_threshold = self.match(normalize_address(address))
+        if free_threshold is not None and subtotal >= free_threshold:
+            return DeliveryQuote(zone, 0, True)
+        return DeliveryQuote(zone, fee, False)
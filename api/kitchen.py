@@ -0,0 +1,196 @@
+"""
+Kitchen queue and delivery time estimates
+
+The kitchen works through orders in the order they were placed. Every
+worker keeps the active orders in memory: the queue of orders still in
+the kitchen (processing), each weighted by how long its items take, and
+the orders out for delivery. The queue is rebuilt from those few orders
+when the `kitchen` cache version moves, i.e. when an order is placed or
+changes status, so an estimate is a dict lookup and never reads order
+history.
+
+Estimates come from rolling statistics in the kitchen_stats table, which
+each status change updates incrementally, in the same transaction as
+the status change:
+
+- unit:<hour> - kitchen seconds per weighted item, by UTC hour of the
+  day. An order's kitchen time runs from when the kitchen could start on
+  it (it was placed, or the order before it went out) until it goes out
+  for delivery.
+- product:<id> - kitchen seconds per item of orders containing the
+  product. Its ratio to the average over all products is the product's
+  weight: shashlik takes longer than somsa.
+- delivery:<hour> - seconds from going out for delivery to delivered.
+
+Each is an exponentially weighted moving average, so it follows a change
+of staff or menu within a few dozen orders. A figure with too few
+samples falls back to the all-day one, then to a default.
+"""
+
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+# Weight of a new sample; the first samples are averaged plainly
+ALPHA = 0.1
+MIN_SAMPLES = 5
+
+DEFAULT_UNIT_SECONDS = 90.0
+DEFAULT_DELIVERY_SECONDS = 25 * 60.0
+
+# Longer kitchen or delivery times mean a status was changed late, not a slow kitchen
+MAX_SAMPLE_SECONDS = 3 * 3600
+
+MIN_WEIGHT = 0.25
+MAX_WEIGHT = 4.0
+
+# Active orders placed longer ago than this were forgotten, not cooked
+QUEUE_WINDOW = timedelta(hours=12)
+
+ACTIVE_STATUSES = ("processing", "delivering")
+
+# Row whose updated_at is when the kitchen last sent an order out
+LAST_READY = "last_ready"
+
+
+class KitchenStats:
+    """The kitchen_stats rows, read once."""
+
+    def __init__(self, rows):
+        self._rows = {row.name: row for row in rows}
+
+    @classmethod
+    def load(cls, db):
+        return cls(db.execute(text("SELECT name, samples, mean, updated_at FROM kitchen_stats")).fetchall())
+
+    def _mean(self, name: str, fallback: Optional[str], default: float) -> float:
+        for key in (name, fallback):
+            row = self._rows.get(key)
+            if row is not None and row.samples >= MIN_SAMPLES:
+                return row.mean
+        return default
+
+    def unit_seconds(self, hour: int) -> float:
+        return self._mean(f"unit:{hour}", "unit", DEFAULT_UNIT_SECONDS)
+
+    def delivery_seconds(self, hour: int) -> float:
+        return self._mean(f"delivery:{hour}", "delivery", DEFAULT_DELIVERY_SECONDS)
+
+    def weight(self, product_id: str) -> float:
+        average = self._mean("product", None, 0.0)
+        if not average:
+            return 1.0
+        return min(max(self._mean(f"product:{product_id}", None, average) / average, MIN_WEIGHT), MAX_WEIGHT)
+
+    def weighted_units(self, items) -> float:
+        """Kitchen work of (product_id, quantity) lines, in average items."""
+        return sum(quantity * self.weight(product_id) for product_id, quantity in items)
+
+    @property
+    def last_ready_at(self) -> Optional[datetime]:
+        row = self._rows.get(LAST_READY)
+        return parse_time(row.updated_at) if row is not None else None
+
+
+def parse_time(value):
+    # Raw SQL returns SQLite's text timestamps
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def observe(db, name: str, value: float, at: datetime):
+    """Add a sample to the moving average `name`."""
+    db.execute(
+        text(
+            "INSERT INTO kitchen_stats (name, samples, mean, updated_at) VALUES (:name, 1, :value, :at) "
+            "ON CONFLICT(name) DO UPDATE SET samples = samples + 1, "
+            "mean = mean + max(:alpha, 1.0 / (samples + 1)) * (excluded.mean - mean), "
+            "updated_at = excluded.updated_at"
+        ),
+        {"name": name, "value": value, "at": at, "alpha": ALPHA}
+    )
+
+
+def record_ready(db, placed_at: datetime, ready_at: datetime, items):
+    """An order placed at `placed_at` left the kitchen at `ready_at`; `items` are (product_id, quantity)."""
+    stats = KitchenStats.load(db)
+    last_ready_at = stats.last_ready_at
+    started = max(placed_at, last_ready_at) if last_ready_at is not None else placed_at
+    observe(db, LAST_READY, 0.0, ready_at)
+
+    seconds = (ready_at - started).total_seconds()
+    quantity = sum(quantity for _, quantity in items)
+    if not 0 < seconds <= MAX_SAMPLE_SECONDS or not quantity:
+        return
+    per_unit = seconds / stats.weighted_units(items)
+    observe(db, f"unit:{started.hour}", per_unit, ready_at)
+    observe(db, "unit", per_unit, ready_at)
+    per_item = seconds / quantity
+    observe(db, "product", per_item, ready_at)
+    for product_id in {product_id for product_id, _ in items}:
+        observe(db, f"product:{product_id}", per_item, ready_at)
+
+
+def record_delivered(db, delivering_at: datetime, delivered_at: datetime):
+    seconds = (delivered_at - delivering_at).total_seconds()
+    if 0 < seconds <= MAX_SAMPLE_SECONDS:
+        observe(db, f"delivery:{delivering_at.hour}", seconds, delivered_at)
+        observe(db, "delivery", seconds, delivered_at)
+
+
+class Estimate(NamedTuple):
+    position: Optional[int]  # 1 = next out of the kitchen; None once out for delivery
+    ready_at: Optional[datetime]
+    arrives_at: datetime
+
+
+class KitchenQueue:
+    """
+    The active orders of one database.
+
+    `orders` are (id, status, placed_at, delivering_at, items) of every
+    active order, oldest first, with items as (product_id, quantity).
+    """
+
+    def __init__(self, stats: KitchenStats, orders):
+        self.stats = stats
+        self._queue = {}  # order id -> (position, weighted items up to and including it)
+        self._delivering = {}  # order id -> when it went out
+        self.started_at = None  # when the kitchen started on the first order in the queue
+        self._first_work = 0.0
+        work = 0.0
+        for order_id, status, placed_at, delivering_at, items in orders:
+            if status == "delivering":
+                self._delivering[order_id] = delivering_at or placed_at
+                continue
+            if self.started_at is None:
+                last_ready_at = stats.last_ready_at
+                self.started_at = max(placed_at, last_ready_at) if last_ready_at is not None else placed_at
+            work += stats.weighted_units(items)
+            if not self._queue:
+                self._first_work = work
+            self._queue[order_id] = (len(self._queue) + 1, work)
+        self.work = work
+
+    def __len__(self):
+        return len(self._queue)
+
+    def estimate(self, order_id: str, now: datetime) -> Optional[Estimate]:
+        """When the order should be ready and delivered, or None if it is not active."""
+        if order_id in self._delivering:
+            delivering_at = self._delivering[order_id]
+            arrives_at = delivering_at + timedelta(seconds=self.stats.delivery_seconds(delivering_at.hour))
+            return Estimate(None, None, max(arrives_at, now))
+
+        queued = self._queue.get(order_id)
+        if queued is None:
+            return None
+        position, work = queued
+        # From when the kitchen started on the queue, so estimates hold still
+        # while it works. When it runs late, everything waits behind the
+        # first order, which is due now
+        unit = timedelta(seconds=self.stats.unit_seconds(now.hour))
+        late = max(now - (self.started_at + self._first_work * unit), timedelta(0))
+        ready_at = self.started_at + work * unit + late
+        arrives_at = ready_at + timedelta(seconds=self.stats.delivery_seconds(ready_at.hour))
+        return Estimate(position, ready_at, arrives_at)
@@ -0,0 +1,135 @@
+"""
+Image serving for the Denov Baraka Somsa API
+
+Serves product images from the uploads directory with strong ETags,
+conditional GET (If-None-Match / If-Modified-Since), byte ranges and an
+explicit Cache-Control policy. Bodies are streamed by Starlette's
+FileResponse.
+
+In offload mode the response only carries an X-Accel-Redirect (nginx) or
+X-Sendfile (Apache, lighttpd) header and the reverse proxy sends the file,
+so Python never touches image bytes.
+"""
+
+import os
+import re
+from email.utils import formatdate
+from mimetypes import guess_type
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+from compression import PrecompressedStaticFiles
+
+OFFLOAD_MODES = ("", "x-accel-redirect", "x-sendfile")
+
+_SINGLE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def strong_etag(stat_result: os.stat_result) -> str:
+    """
+    ETag derived from inode, size and nanosecond mtime.
+
+    Uploads are written once and replaced on update, so any change of the
+    file changes at least one of these and the tag can be used as strong.
+    """
+    return '"%x-%x-%x"' % (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def parse_single_range(http_range: str, size: int):
+    """
+    Parse a single `bytes=` range into a half-open (start, end) tuple.
+
+    Returns None for multi-range or otherwise unsupported headers, and
+    for invalid ones such as `bytes=5-3`, which RFC 9110 has servers
+    ignore. Raises ValueError when the range cannot be satisfied.
+    """
+    match = _SINGLE_RANGE.match(http_range.replace(" ", ""))
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    end = min(int(last) + 1, size) if last else size
+    return start, end
+
+
+def without_invalid_range(scope, size: int):
+    """`scope` without its Range header if that is an invalid single range."""
+    http_range = Headers(scope=scope).get("range")
+    if http_range is None or "," in http_range:
+        return scope
+    try:
+        if parse_single_range(http_range, size) is not None:
+            return scope
+    except ValueError:
+        # Valid but not satisfiable: 416
+        return scope
+    return {**scope, "headers": [(name, value) for name, value in scope["headers"] if name != b"range"]}
+
+
+class ImageResponse(FileResponse):
+    """FileResponse that ignores an invalid Range header, as RFC 9110 asks, instead of answering 400."""
+
+    async def __call__(self, scope, receive, send):
+        if self.status_code == 200:
+            scope = without_invalid_range(scope, self.stat_result.st_size)
+        await super().__call__(scope, receive, send)
+
+
+class ImageFiles(PrecompressedStaticFiles):
+    """
+    Static files mount for uploaded product images.
+
+    offload: "" to serve from Python, "x-accel-redirect" or "x-sendfile" to
+        hand the file over to the reverse proxy.
+    offload_prefix: internal location the proxy maps to the uploads
+        directory, used for X-Accel-Redirect.
+    max_age: seconds clients and proxies may cache an image before
+        revalidating it with its ETag.
+    """
+
+    def __init__(self, *, directory, offload="", offload_prefix="/protected-uploads/", max_age=3600, **kwargs):
+        if offload not in OFFLOAD_MODES:
+            raise ValueError(f"Unknown image offload mode: {offload!r}")
+        super().__init__(directory=directory, **kwargs)
+        self.offload = offload
+        self.offload_prefix = offload_prefix.rstrip("/") + "/"
+        self.cache_control = f"public, max-age={max_age}"
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        headers = {
+            "etag": strong_etag(stat_result),
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "cache-control": self.cache_control,
+        }
+        if self.is_not_modified(headers, Headers(scope=scope)):
+            return NotModifiedResponse(Headers(headers=headers))
+
+        if self.offload:
+            media_type = guess_type(full_path)[0] or "application/octet-stream"
+            response = Response(status_code=status_code, media_type=media_type, headers=headers)
+            if self.offload == "x-accel-redirect":
+                relative_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                response.headers["X-Accel-Redirect"] = self.offload_prefix + relative_path
+            else:
+                response.headers["X-Sendfile"] = os.path.abspath(full_path)
+            # The proxy fills in the real length when it sends the file
+            del response.headers["content-length"]
+        else:
+            response = ImageResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        return response
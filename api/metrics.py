@@ -0,0 +1,204 @@
+"""
+Prometheus-style metrics for the Denov Baraka Somsa API
+
+MetricsMiddleware records request counts, latency and response size per
+route template (`/orders/{order_id}`, not the raw path). SQLAlchemy engine
+events add the number of queries and the time spent in them per request.
+Everything is rendered in the Prometheus text exposition format by
+`render()`, which the API serves at /metrics.
+
+Metrics are kept per process. With several workers each one reports its
+own numbers, so scrape them with a `worker` label or aggregate upstream.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+WRITE_BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bucket_names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_names, labels + (bound,))} {cumulative}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+REQUEST_LABELS = ("method", "route")
+
+requests_total = Counter(
+    "http_requests_total", "Total HTTP requests.", ("method", "route", "status")
+)
+request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", LATENCY_BUCKETS, REQUEST_LABELS
+)
+response_size = Histogram(
+    "http_response_size_bytes", "HTTP response body size on the wire.", SIZE_BUCKETS, REQUEST_LABELS
+)
+db_queries = Histogram(
+    "db_queries_per_request", "SQL statements executed per request.", QUERY_COUNT_BUCKETS, REQUEST_LABELS
+)
+db_duration = Histogram(
+    "db_query_duration_seconds_per_request", "Time spent in SQL statements per request.", LATENCY_BUCKETS, REQUEST_LABELS
+)
+upload_bytes = Counter(
+    "image_upload_bytes_total", "Bytes of product images uploaded."
+)
+write_rejections = Counter(
+    "write_rejections_total", "Writes refused with 429.", ("reason",)
+)
+write_batch_size = Histogram(
+    "write_batch_size", "Writes committed per group-commit transaction.", WRITE_BATCH_BUCKETS
+)
+audit_events = Counter(
+    "audit_events_total", "Changes written to the audit log.", ("entity",)
+)
+
+REGISTRY = [
+    requests_total, request_duration, response_size, db_queries, db_duration, upload_bytes,
+    write_rejections, write_batch_size, audit_events,
+]
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "query_start")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.query_start = 0.0
+
+
+# Stats of the request being handled; copied into threadpool endpoints
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+def instrument_engine(engine):
+    """Count SQL statements and their time against the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        if stats is not None:
+            stats.query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += time.perf_counter() - stats.query_start
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        body_size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, body_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                body_size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+
+            labels = (scope["method"], route_template(scope))
+            requests_total.inc(labels + (status_code,))
+            request_duration.observe(labels, elapsed)
+            response_size.observe(labels, body_size)
+            db_queries.observe(labels, stats.queries)
+            db_duration.observe(labels, stats.query_time)
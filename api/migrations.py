@@ -0,0 +1,239 @@
+"""
+Schema migrations for the Denov Baraka Somsa database
+
+`Base.metadata.create_all` only creates missing tables, so changes to
+existing tables go here. Each migration runs once, in order, inside its
+own transaction, and is recorded in the `schema_migrations` table. The
+transaction is begun explicitly: pysqlite only begins one before data
+changes, so the DROP, ALTER and CREATE of a table rebuild would each
+commit on their own, and after a failure halfway the rerun would find
+the new, empty table and skip the migration, leaving the rows behind in
+the renamed one.
+Migrations must also be safe on a fresh database whose tables
+create_all has already built in their latest shape.
+
+Every API worker calls `ensure_schema` on startup. When the database is
+current, which is nearly always, that costs two reads and no writes;
+otherwise one worker migrates while the others wait on a lock file.
+"""
+
+import fcntl
+
+from sqlalchemy import text
+
+from customers import link_orders
+from search import create_search_index
+from snapshots import fingerprint
+
+BATCH_SIZE = 5000
+
+
+def column_names(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def add_column(conn, table, column, ddl):
+    """Add `column` to `table` unless create_all already did."""
+    if column not in column_names(conn, table):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def add_order_delivery_fee(conn, metadata):
+    add_column(conn, "orders", "delivery_fee", "FLOAT")
+
+
+def add_order_price_mismatch(conn, metadata):
+    add_column(conn, "orders", "price_mismatch", "BOOLEAN DEFAULT 0")
+
+
+def table_exists(conn, table):
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).first() is not None
+
+
+def normalize_order_items(conn, metadata):
+    """
+    Move the product fields of order lines into product_snapshots.
+
+    Finishes the job if order_items_old is still there: before
+    migrations began their transactions explicitly, a run that died
+    after renaming the table left every line in it, and the new table
+    may since have lines of new orders, whose ids old lines then give up.
+    """
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_customers_order_id ON customers (order_id)")
+    if table_exists(conn, "order_items_old"):
+        if not table_exists(conn, "order_items"):
+            metadata.tables["order_items"].create(conn)
+    elif "name" in column_names(conn, "order_items"):
+        conn.exec_driver_sql("ALTER TABLE order_items RENAME TO order_items_old")
+        metadata.tables["order_items"].create(conn)
+    else:
+        return
+
+    snapshot_ids = {
+        key: snapshot_id
+        for snapshot_id, key in conn.exec_driver_sql("SELECT id, fingerprint FROM product_snapshots")
+    }
+    last_id = -1
+    while True:
+        # Rounded, as the new table's prices already are integers
+        rows = conn.exec_driver_sql(
+            "SELECT id, order_id, product_id, name, description, image, category, "
+            "CAST(ROUND(price) AS INTEGER), quantity "
+            "FROM order_items_old WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        taken = {
+            row[0] for row in conn.exec_driver_sql(
+                "SELECT id FROM order_items WHERE id BETWEEN ? AND ?", (rows[0][0], rows[-1][0])
+            )
+        }
+        new_rows = []
+        for item_id, order_id, product_id, name, description, image, category, price, quantity in rows:
+            key = fingerprint(product_id, name, description, image, category)
+            if key not in snapshot_ids:
+                snapshot_ids[key] = conn.exec_driver_sql(
+                    "INSERT INTO product_snapshots (fingerprint, product_id, name, description, image, category) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, product_id, name, description, image, category)
+                ).lastrowid
+            new_rows.append(
+                (None if item_id in taken else item_id, order_id, product_id, snapshot_ids[key], price, quantity)
+            )
+        # Kept ids first, so the new ones are numbered after all of them
+        new_rows.sort(key=lambda row: row[0] is None)
+        conn.exec_driver_sql(
+            "INSERT INTO order_items (id, order_id, product_id, snapshot_id, price, quantity) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            new_rows
+        )
+        last_id = rows[-1][0]
+
+    conn.exec_driver_sql("DROP TABLE order_items_old")
+
+
+def integer_money(conn, metadata):
+    """Rebuild the tables holding money so those columns store whole so'm."""
+    money_columns = {
+        "products": ["price"],
+        "order_items": ["price"],
+        "orders": ["total", "delivery_fee"],
+        "delivery_zones": ["fee", "free_threshold"],
+    }
+    for table, columns in money_columns.items():
+        # Column affinity is fixed at CREATE TABLE: a REAL column would
+        # turn the rounded values back into floats
+        declared = {row[1]: row[2].upper() for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if all(declared[column] == "INTEGER" for column in columns):
+            continue
+
+        indexes = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()
+        for (index,) in indexes:
+            conn.exec_driver_sql(f"DROP INDEX {index}")
+        # Keep the foreign keys of other tables pointing at `table`
+        conn.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+        conn.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {table}_old")
+        conn.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+        metadata.tables[table].create(conn)
+
+        names = [name for name in declared if name in metadata.tables[table].columns]
+        values = [f"CAST(ROUND({name}) AS INTEGER)" if name in columns else name for name in names]
+        conn.exec_driver_sql(
+            f"INSERT INTO {table} ({', '.join(names)}) SELECT {', '.join(values)} FROM {table}_old"
+        )
+        conn.exec_driver_sql(f"DROP TABLE {table}_old")
+
+
+def product_search(conn, metadata):
+    create_search_index(conn)
+
+
+def search_index_rowids(conn, metadata):
+    """Rebuild the search index with triggers that find a product's entry by rowid."""
+    create_search_index(conn)
+
+
+def add_order_version(conn, metadata):
+    add_column(conn, "orders", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def customer_directory(conn, metadata):
+    """Link orders to the customer directory, filling it from existing orders."""
+    add_column(conn, "orders", "customer_id", "INTEGER REFERENCES customer_directory (id)")
+    # Indexing after filling the column is 3x faster at a million orders
+    link_orders(conn)
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_orders_customer_id_created_at ON orders (customer_id, created_at)"
+    )
+
+
+def order_status_times(conn, metadata):
+    """Record when orders enter each status; older orders count as placed when created."""
+    for column in ("placed_at", "delivering_at", "completed_at", "cancelled_at"):
+        add_column(conn, "orders", column, "DATETIME")
+    conn.exec_driver_sql("UPDATE orders SET placed_at = created_at WHERE placed_at IS NULL")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_orders_status_placed_at ON orders (status, placed_at)")
+
+
+# (name, function) in the order they must run
+MIGRATIONS = [
+    ("0001_order_delivery_fee", add_order_delivery_fee),
+    ("0002_order_price_mismatch", add_order_price_mismatch),
+    ("0003_normalize_order_items", normalize_order_items),
+    ("0004_integer_money", integer_money),
+    ("0005_product_search", product_search),
+    ("0006_order_version", add_order_version),
+    ("0007_customer_directory", customer_directory),
+    ("0008_order_status_times", order_status_times),
+    ("0009_search_index_rowids", search_index_rowids),
+    ("0010_finish_order_items", normalize_order_items),
+]
+
+
+def schema_is_current(engine, metadata) -> bool:
+    """Whether every table exists and every migration was applied."""
+    with engine.connect() as conn:
+        tables = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "schema_migrations" not in tables or not set(metadata.tables) <= tables:
+            return False
+        applied = {row[0] for row in conn.exec_driver_sql("SELECT name FROM schema_migrations")}
+    return all(name in applied for name, _ in MIGRATIONS)
+
+
+def ensure_schema(engine, metadata):
+    """Create and migrate the database unless it is current; returns the migrations applied."""
+    if schema_is_current(engine, metadata):
+        return []
+    # Workers starting together migrate one at a time; the later ones find nothing left to do
+    with open(engine.url.database + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        metadata.create_all(bind=engine)
+        return migrate(engine, metadata)
+
+
+def migrate(engine, metadata):
+    """Apply pending migrations and return the names of those applied."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+        )
+        applied = {row[0] for row in conn.exec_driver_sql("SELECT name FROM schema_migrations")}
+
+    newly_applied = []
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            migration(conn, metadata)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        newly_applied.append(name)
+    return newly_applied
@@ -0,0 +1,134 @@
+"""
+Order status transitions
+
+An order starts in processing, goes out for delivery and is completed
+(processing -> delivering -> completed). It can be cancelled from any
+status that is not final, and final orders never change again.
+
+Admins change statuses from the Telegram channel and the web admin at
+the same time, so a change is a single conditional UPDATE: it only
+applies if the order is still in a status the target can be reached
+from, and, when the caller says which version it saw, if nobody changed
+the order since. SQLite runs the check and the write as one statement,
+so of two admins pressing "deliver" and "cancel" together exactly one
+wins, and the other gets a conflict instead of silently overwriting it.
+
+The same statement records when the order entered its new status, by
+the server's clock in UTC, for the kitchen's time estimates.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, update
+
+INITIAL_STATUS = "processing"
+FINAL_STATUSES = ("completed", "cancelled")
+
+# status -> statuses it can move to
+TRANSITIONS = {
+    "processing": ("delivering", "cancelled"),
+    "delivering": ("completed", "cancelled"),
+    "completed": (),
+    "cancelled": (),
+}
+
+STATUSES = tuple(TRANSITIONS)
+
+# Column holding when an order entered each status
+STATUS_TIME_COLUMNS = {
+    "processing": "placed_at",
+    "delivering": "delivering_at",
+    "completed": "completed_at",
+    "cancelled": "cancelled_at",
+}
+
+
+def utcnow() -> datetime:
+    """Now in UTC, naive like the timestamps stored by SQLite."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def status_values(model, target: str, at: Optional[datetime]):
+    return {
+        "status": target,
+        "version": model.version + 1,
+        STATUS_TIME_COLUMNS[target]: at or utcnow(),
+    }
+
+
+def sources(target: str):
+    """Statuses an order can move to `target` from."""
+    return [status for status, targets in TRANSITIONS.items() if target in targets]
+
+
+def change_status(db, model, order_id: str, target: str, version: Optional[int] = None, at: Optional[datetime] = None):
+    """
+    Move the order to `target` at `at` (default: now) and bump its version, in one statement.
+
+    Returns the updated order, or None if it does not exist, cannot
+    reach `target` from its current status, or is no longer at `version`.
+    """
+    conditions = [model.id == order_id, model.status.in_(sources(target))]
+    if version is not None:
+        conditions.append(model.version == version)
+    statement = (
+        update(model)
+        .where(*conditions)
+        .values(status_values(model, target, at))
+        .returning(model)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(statement).scalar_one_or_none()
+
+
+def change_statuses(
+    db, model, target: str, ids=None, from_status: Optional[str] = None, chunk_size: int = 500,
+    at: Optional[datetime] = None
+):
+    """
+    Move many orders to `target`: those in `ids`, or every order in
+    `from_status`, or the ones in `ids` that are in `from_status`.
+
+    One UPDATE per `chunk_size` ids, in the caller's transaction. Orders
+    that cannot reach `target` are left alone; returns the updated ones.
+    """
+    allowed = sources(target)
+    if from_status is not None:
+        allowed = [status for status in allowed if status == from_status]
+    if not allowed:
+        return []
+    values = status_values(model, target, at)
+
+    def run(*conditions):
+        statement = (
+            update(model)
+            .where(model.status.in_(allowed), *conditions)
+            .values(values)
+            .returning(model)
+            .execution_options(synchronize_session=False)
+        )
+        return list(db.execute(statement).scalars())
+
+    if ids is None:
+        return run()
+    updated = []
+    for start in range(0, len(ids), chunk_size):
+        updated.extend(run(model.id.in_(ids[start:start + chunk_size])))
+    return updated
+
+
+def previous_status(order, target: str) -> str:
+    """The status an order just moved to `target` came from, by when it entered each one."""
+    entered = [
+        (getattr(order, STATUS_TIME_COLUMNS[status]), status)
+        for status in sources(target)
+        if getattr(order, STATUS_TIME_COLUMNS[status]) is not None
+    ]
+    # Orders from before the timestamps were kept
+    return max(entered)[1] if entered else sources(target)[0]
+
+
+def current_state(db, model, order_id: str):
+    """(status, version) of the order, or None; used to explain a failed change."""
+    return db.execute(select(model.status, model.version).where(model.id == order_id)).first()
@@ -0,0 +1,62 @@
+"""
+Server-side validation of order prices
+
+Order lines are checked against the in-memory product catalog (the
+versioned products cache, rebuilt in every worker on product writes), so
+validation is a dict lookup per line and no extra query. Lines of known
+products are repriced from the catalog and the order total is
+recomputed; every difference from what the client sent is reported.
+
+Money is whole so'm everywhere: the database stores integers, sums are
+exact and the JSON numbers have no fractional part.
+"""
+
+from typing import List, NamedTuple
+
+VALIDATION_MODES = ("flag", "reject")
+
+
+class PriceCheck(NamedTuple):
+    items: list
+    total: int
+    problems: List[str]
+
+
+def to_som(amount: float) -> int:
+    """Round an amount typed or sent as a decimal number to whole so'm."""
+    return int(round(amount))
+
+
+def check_order_prices(catalog, items, client_total: int) -> PriceCheck:
+    """
+    Reprice `items` (CartItem) from `catalog` (product id -> Product).
+
+    Unknown products keep the client's line as sent, since the web app
+    still ships a few hardcoded products, but they are reported.
+    """
+    checked = []
+    problems = []
+    total = 0
+    for item in items:
+        product = catalog.get(item.id)
+        if product is None:
+            problems.append(f"unknown product {item.id}")
+            checked.append(item)
+        else:
+            if product.price != item.price:
+                problems.append(f"price of {item.id} is {product.price}, not {item.price}")
+            if product.name != item.name:
+                problems.append(f"name of {item.id} is {product.name!r}, not {item.name!r}")
+            item = item.model_copy(update={
+                "name": product.name,
+                "price": product.price,
+                "description": product.description,
+                "image": product.image,
+                "category": product.category,
+            })
+            checked.append(item)
+        total += item.price * item.quantity
+
+    if total != client_total:
+        problems.append(f"total is {total}, not {client_total}")
+    return PriceCheck(checked, total, problems)
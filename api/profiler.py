@@ -0,0 +1,143 @@
+"""
+Per-request SQL profiler and slow-query log
+
+With profiling enabled for a request, every SQL statement it runs is timed
+and the response gets a `Server-Timing` header with the total query count
+and time plus the most expensive statements, grouped by SQL text so N+1
+patterns show up as e.g. `SELECT ... FROM order_items (x200)`.
+
+Profiling is enabled for all requests with the `enabled` setting, or per
+request by sending the configured token in the X-Profile-Queries header.
+Without a token the header is ignored, since the breakdown exposes SQL.
+
+Independently of that, any statement slower than the threshold is written
+to the `slow_queries` logger together with its EXPLAIN QUERY PLAN.
+"""
+
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from starlette.datastructures import Headers, MutableHeaders
+
+PROFILE_HEADER = "x-profile-queries"
+
+# Statements EXPLAIN QUERY PLAN says something useful about
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+# Number of statement groups listed individually in Server-Timing
+TOP_STATEMENTS = 5
+
+slow_query_logger = logging.getLogger("slow_queries")
+
+# Statement timings of the request being profiled, or None
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+def configure_slow_query_log(path: str):
+    """Also write the slow-query log to `path`."""
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.INFO)
+
+
+def explain(cursor, statement, parameters) -> str:
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            rows = plan_cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        finally:
+            plan_cursor.close()
+    except Exception as e:
+        return f"(no plan: {e})"
+    return "\n".join(f"  {row[-1]}" for row in rows)
+
+
+def instrument_engine(engine, slow_query_ms: float):
+    """Time statements for profiled requests and log slow ones."""
+    threshold = slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # On the statement's own context, which goes away with it even if it fails
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+
+        profile = current_profile.get()
+        if profile is not None:
+            profile.append((statement, elapsed))
+
+        if elapsed >= threshold:
+            explainable = not executemany and statement.lstrip().upper().startswith(EXPLAINABLE)
+            plan = explain(cursor, statement, parameters) if explainable else "  (not explained)"
+            slow_query_logger.warning(
+                "slow query (%.1f ms): %s\nparameters: %r\nplan:\n%s",
+                elapsed * 1000, statement, parameters, plan
+            )
+
+
+def _describe(statement: str) -> str:
+    words = statement.split()
+    if "FROM" in words:
+        table = words[words.index("FROM") + 1]
+        return f"{words[0]} {table}"
+    return " ".join(words[:3])
+
+
+def server_timing(profile, total: float) -> str:
+    """Format statement timings as a Server-Timing header value."""
+    groups = {}
+    for statement, elapsed in profile:
+        count, duration = groups.get(statement, (0, 0.0))
+        groups[statement] = (count + 1, duration + elapsed)
+
+    db_time = sum(elapsed for _, elapsed in profile)
+    entries = [
+        f'total;dur={total * 1000:.2f}',
+        f'db;dur={db_time * 1000:.2f};desc="{len(profile)} queries"',
+    ]
+    top = sorted(groups.items(), key=lambda item: item[1][1], reverse=True)[:TOP_STATEMENTS]
+    for index, (statement, (count, duration)) in enumerate(top):
+        entries.append(f'q{index};dur={duration * 1000:.2f};desc="{_describe(statement)} (x{count})"')
+    return ", ".join(entries)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware adding a Server-Timing header to profiled requests."""
+
+    def __init__(self, app, enabled: bool = False, token: str = ""):
+        self.app = app
+        self.enabled = enabled
+        self.token = token
+
+    def should_profile(self, scope) -> bool:
+        if self.enabled:
+            return True
+        if not self.token:
+            return False
+        return Headers(scope=scope).get(PROFILE_HEADER) == self.token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = []
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(profile, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
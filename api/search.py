@@ -0,0 +1,158 @@
+"""
+Full-text product search with category facets
+
+Products are indexed in an SQLite FTS5 table over name, description and
+category, kept in sync with the products table by triggers. A search
+returns the best matching products together with the number of matches
+per category, both from a single statement.
+
+The index stores its own copy of the text, keyed by product id, rather
+than pointing at products by rowid: products has no INTEGER PRIMARY KEY,
+so VACUUM may renumber its rowids. The id column is not indexed, so
+products_fts_rowids maps each product id to its row in the index, and
+the triggers replace that row by rowid instead of scanning the index.
+"""
+
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from delivery import APOSTROPHES
+
+# Apostrophes are part of Uzbek words (go'shtli, qo'y), not separators
+FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    id UNINDEXED, name, description, category,
+    tokenize = "unicode61 remove_diacritics 2 tokenchars ''''"
+)
+"""
+
+FTS_ROWIDS_TABLE = """
+CREATE TABLE IF NOT EXISTS products_fts_rowids (
+    id VARCHAR PRIMARY KEY,
+    fts_rowid INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+# Statements of the triggers indexing and unindexing a product
+_INDEX_NEW = """
+        INSERT INTO products_fts (id, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+        INSERT OR REPLACE INTO products_fts_rowids (id, fts_rowid) VALUES (new.id, last_insert_rowid());
+"""
+_UNINDEX_OLD = """
+        DELETE FROM products_fts WHERE rowid = (SELECT fts_rowid FROM products_fts_rowids WHERE id = old.id);
+        DELETE FROM products_fts_rowids WHERE id = old.id;
+"""
+
+FTS_TRIGGERS = {
+    "products_fts_insert": f"""
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN{_INDEX_NEW}    END
+    """,
+    "products_fts_delete": f"""
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN{_UNINDEX_OLD}    END
+    """,
+    # Price and popularity changes do not touch the index
+    "products_fts_update": f"""
+    CREATE TRIGGER products_fts_update AFTER UPDATE OF id, name, description, category ON products
+    BEGIN{_UNINDEX_OLD}{_INDEX_NEW}    END
+    """,
+}
+
+# bm25 weights of name, description and category (id is unindexed)
+RANK = "bm25(products_fts, 0.0, 10.0, 1.0, 5.0)"
+
+MAX_LIMIT = 200
+
+_WORDS = re.compile(r"[\w']+")
+
+
+def create_search_index(conn):
+    """Create the FTS table and its triggers, replacing older triggers, and index existing products."""
+    conn.exec_driver_sql(FTS_TABLE)
+    conn.exec_driver_sql(FTS_ROWIDS_TABLE)
+    for name, trigger in FTS_TRIGGERS.items():
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+        conn.exec_driver_sql(trigger)
+    conn.exec_driver_sql("DELETE FROM products_fts")
+    conn.exec_driver_sql("DELETE FROM products_fts_rowids")
+    conn.exec_driver_sql(
+        "INSERT INTO products_fts (id, name, description, category) "
+        "SELECT id, name, description, category FROM products"
+    )
+    conn.exec_driver_sql("INSERT INTO products_fts_rowids (id, fts_rowid) SELECT id, rowid FROM products_fts")
+
+
+def match_query(q: Optional[str]) -> Optional[str]:
+    """
+    FTS5 query for what a customer typed, or None if it has no words.
+
+    Every word must match, and the last one may be unfinished, so
+    "kosa som" finds "Kosa somsa" while the customer is still typing.
+    """
+    words = [word.strip("'") for word in _WORDS.findall((q or "").lower().translate(APOSTROPHES))]
+    words = [word for word in words if word]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchResult(NamedTuple):
+    products: List[dict]
+    facets: Dict[str, int]
+    total: int
+
+
+def search_products(db, q=None, category=None, popular=None, limit=50) -> SearchResult:
+    """
+    Rank products matching `q`, restricted to `category` and `popular`.
+
+    Facet counts cover every category, ignoring the `category` filter,
+    so the web app can show how many matches each category tab has.
+    """
+    match = match_query(q)
+    params = {"match": match, "category": category, "popular": popular, "limit": min(limit, MAX_LIMIT)}
+
+    conditions = []
+    if popular is not None:
+        conditions.append("p.popular = :popular")
+    if match is not None:
+        conditions.append("products_fts MATCH :match")
+        source = "products_fts JOIN products p ON p.id = products_fts.id"
+        rank = RANK
+    else:
+        source = "products p"
+        rank = "0.0"
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    page_filter = "WHERE category = :category" if category is not None else ""
+
+    statement = f"""
+        WITH hits AS (
+            SELECT p.id, p.name, p.description, p.price, p.category, p.image, p.popular, {rank} AS rank
+            FROM {source} {where}
+        ),
+        facets AS (
+            SELECT json_group_object(category, n) AS facets
+            FROM (SELECT category, count(*) AS n FROM hits GROUP BY category)
+        ),
+        page AS (
+            SELECT * FROM hits {page_filter}
+            ORDER BY rank, popular DESC, name LIMIT :limit
+        )
+        SELECT facets.facets, page.* FROM facets LEFT JOIN page ON 1
+        ORDER BY page.rank, page.popular DESC, page.name
+    """
+    rows = db.execute(text(statement), params).mappings().all()
+
+    # There is always one row, carrying the facets even without results
+    facets = json.loads(rows[0]["facets"]) if rows and rows[0]["facets"] else {}
+    products = [dict(row) for row in rows if row["id"] is not None]
+    for product in products:
+        del product["facets"], product["rank"]
+        product["popular"] = bool(product["popular"])
+    total = facets.get(category, 0) if category is not None else sum(facets.values())
+    return SearchResult(products, facets, total)
@@ -7,30 +7,190 @@ It provides endpoints for products and orders management using SQLite database.
 To run:
 1. Install requirements: pip install fastapi uvicorn sqlalchemy
 2. Run server: uvicorn server:app --reload
+
+For production, run `python server.py`. It reads API_HOST, API_PORT and
+API_WORKERS from the environment and starts that many worker processes
+sharing the same SQLite database in WAL mode.
+
+The API runs on POSIX systems (Linux, macOS) only: the launcher forks
+its workers, and workers take turns migrating and backing up the
+databases with fcntl locks.
+
+Importing this module opens nothing. Databases live in DATA_DIR (this
+directory by default) and are opened, and created or migrated if needed,
+when the app starts or on first use (`init()`). Each worker then warms
+its caches in the background; GET /ready answers 503 until it is done.
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, status
+import time
+IMPORT_STARTED = time.perf_counter()  # for the startup timings in GET /ready
+
+import asyncio
+import logging
+import re
+import threading
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, Request, UploadFile, File, Form, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from typing import List, Optional, Union, Dict, Any
 from pydantic import BaseModel, ConfigDict
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import shutil
 import uuid
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import event, func, case, Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Index, Float
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.orm import relationship, Session
+from compression import CompressionMiddleware, precompress_file, remove_precompressed
+from media import ImageFiles
+from cache import VersionedCache, all_versions
+import metrics
+import profiler
+import migrations
+from delivery import DeliveryZoneIndex
+from pricing import VALIDATION_MODES, check_order_prices, to_som
+from snapshots import SnapshotStore
+from search import search_products
+from branches import Branch, BranchRegistry, parse_branches
+from archive import OrderArchive
+from order_status import (
+    FINAL_STATUSES, INITIAL_STATUS, STATUS_TIME_COLUMNS, STATUSES, TRANSITIONS, change_status, change_statuses,
+    current_state, previous_status, utcnow
+)
+import kitchen
+import audit
+from customers import normalize_phone, remember_customer
+from admission import AdmissionMiddleware, GroupCommitWriter, QueueFull, RateLimiter, retry_after_header
+import backup
+
+logger = logging.getLogger("api")
+
+# Databases and uploaded images; the defaults do not depend on the
+# directory the API is started from
+DATA_DIR = os.path.abspath(os.getenv("DATA_DIR", os.path.dirname(os.path.abspath(__file__))))
+UPLOAD_DIR = os.path.abspath(os.getenv("UPLOAD_DIR", os.path.join(DATA_DIR, "uploads")))
+
+# Database configuration - SQLite, one file per branch. BRANCHES lists the
+# branches and the first one is the default; it keeps denov_baraka.db
+BRANCHES = parse_branches(os.getenv("BRANCHES", "denov"))
+
+def database_path(branch):
+    if branch == BRANCHES[0]:
+        return os.path.join(DATA_DIR, "denov_baraka.db")
+    return os.path.join(DATA_DIR, f"denov_baraka_{branch}.db")
+
+def database_url(branch):
+    return f"sqlite:///{database_path(branch)}"
+
+# Completed and cancelled orders older than this many days are moved to
+# each branch's archive database by archive.py (run it from cron)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+def archive_path(branch):
+    if branch == BRANCHES[0]:
+        return os.path.join(DATA_DIR, "denov_baraka_archive.db")
+    return os.path.join(DATA_DIR, f"denov_baraka_{branch}_archive.db")
+
+def archive_url(branch):
+    return f"sqlite:///{archive_path(branch)}"
+
+# Online backups (see backup.py): every BACKUP_INTERVAL seconds (0: only on
+# request) snapshot each database into BACKUP_DIR and keep the newest
+# BACKUP_KEEP. POST /backups needs BACKUP_TOKEN in the X-Backup-Token header
+BACKUP_DIR = os.path.abspath(os.getenv("BACKUP_DIR", os.path.join(DATA_DIR, "backups")))
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", "0"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_TOKEN = os.getenv("BACKUP_TOKEN", "")
+
+# Audit log of product and order changes (see audit.py), one file per
+# branch. Each worker writes the changes it buffered every
+# AUDIT_FLUSH_SECONDS, or once AUDIT_SEGMENT_EVENTS are waiting. Reading
+# it needs AUDIT_TOKEN in the X-Audit-Token header. Requests name who
+# makes a change in X-Actor (the bot sends the admin's Telegram id);
+# without it the client address stands in
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_SEGMENT_EVENTS = int(os.getenv("AUDIT_SEGMENT_EVENTS", "500"))
+AUDIT_TOKEN = os.getenv("AUDIT_TOKEN", "")
+
+def audit_path(branch):
+    if branch == BRANCHES[0]:
+        return os.path.join(DATA_DIR, "denov_baraka_audit.db")
+    return os.path.join(DATA_DIR, f"denov_baraka_{branch}_audit.db")
+
+def audit_url(branch):
+    return f"sqlite:///{audit_path(branch)}"
+
+# The customer directory (GET /customers/{phone}, the customer's orders
+# and POST /customers/{phone}/reorder) gives out names, phones and
+# addresses and places orders on a customer's behalf, so it needs
+# CUSTOMERS_TOKEN in the X-Customers-Token header, sent by staff tools
+# and the bots; without the setting it is disabled
+CUSTOMERS_TOKEN = os.getenv("CUSTOMERS_TOKEN", "")
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets several worker processes read while one of them writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+# SQL profiling: PROFILE_QUERIES=1 profiles every request, otherwise only
+# requests sending PROFILE_TOKEN in the X-Profile-Queries header
+PROFILE_QUERIES = os.getenv("PROFILE_QUERIES", "").lower() in ("1", "true", "yes")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "")
 
-# Database configuration - SQLite
-DATABASE_URL = "sqlite:///denov_baraka.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# Create uploads directory if it doesn't exist
-os.makedirs("uploads", exist_ok=True)
+# JSON responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Image serving: "" serves uploads from Python, "x-accel-redirect" (nginx) or
+# "x-sendfile" (Apache/lighttpd) hands them over to the reverse proxy
+IMAGE_OFFLOAD = os.getenv("IMAGE_OFFLOAD", "")
+IMAGE_OFFLOAD_PREFIX = os.getenv("IMAGE_OFFLOAD_PREFIX", "/protected-uploads/")
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "3600"))
+
+# Delivery fee for addresses outside every configured zone, and the order
+# subtotal from which delivery is free, in so'm (same defaults as the web app)
+DELIVERY_FEE = int(os.getenv("DELIVERY_FEE", "10000"))
+FREE_DELIVERY_THRESHOLD = int(os.getenv("FREE_DELIVERY_THRESHOLD", "100000"))
+
+# What to do with orders whose prices differ from the catalog: "flag" stores
+# them repriced and marked, "reject" refuses them with 409
+PRICE_VALIDATION = os.getenv("PRICE_VALIDATION", "flag")
+if PRICE_VALIDATION not in VALIDATION_MODES:
+    raise ValueError(f"PRICE_VALIDATION must be one of {VALIDATION_MODES}")
+
+# Admission control for writes (see admission.py): one writer per
+# database and worker commits orders and product changes WRITE_BATCH_SIZE
+# at a time, with at most WRITE_QUEUE_SIZE waiting (0: no queue, every
+# write commits on its own).
+#
+# Per-client rate limiting is off unless WRITE_RATE is set: a client may
+# then send WRITE_BURST writes at once and WRITE_RATE per second after
+# that. Clients are told apart by address, and many customers can share
+# one (mobile carriers NAT whole neighbourhoods), so keep the limit well
+# above what a single shopper sends. Behind a reverse proxy every request
+# comes from the proxy's address unless uvicorn trusts it: list the proxy
+# in FORWARDED_ALLOW_IPS (by default 127.0.0.1) and have it set
+# X-Forwarded-For, overwriting any the client sent. RATE_LIMIT_EXEMPT
+# (the bots on this host) are never limited
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "64"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "20"))
+WRITE_RATE = float(os.getenv("WRITE_RATE", "0"))
+WRITE_BURST = int(os.getenv("WRITE_BURST", "30"))
+RATE_LIMIT_EXEMPT = {
+    address.strip() for address in os.getenv("RATE_LIMIT_EXEMPT", "127.0.0.1,::1").split(",") if address.strip()
+}
+
+# Production launcher settings (see __main__ below)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
 
 # Database models
 class ProductModel(Base):
@@ -39,57 +199,233 @@ class ProductModel(Base):
     id = Column(String, primary_key=True)
     name = Column(String, nullable=False)
     description = Column(Text, nullable=False)
-    price = Column(Float, nullable=False)
+    price = Column(Integer, nullable=False)  # so'm
     category = Column(String, nullable=False)
     image = Column(String, nullable=True)
     popular = Column(Boolean, default=False)
 
+class CustomerModel(Base):
+    __tablename__ = "customer_directory"
+    
+    # One row per normalized phone number (see customers.py)
+    id = Column(Integer, primary_key=True)
+    phone = Column(String, nullable=False, unique=True)
+    name = Column(String, nullable=False)  # as typed in the last order
+    address = Column(String, nullable=False)
+    order_count = Column(Integer, nullable=False, default=0)
+    last_order_id = Column(String, nullable=True)
+    last_order_at = Column(DateTime, nullable=True)
+
 class CustomerInfoModel(Base):
     __tablename__ = "customers"
     
+    # What the customer typed for this order
     id = Column(Integer, primary_key=True)
-    order_id = Column(String, ForeignKey("orders.id"))
+    order_id = Column(String, ForeignKey("orders.id"), index=True)
     name = Column(String, nullable=False)
     phone = Column(String, nullable=False)
     address = Column(String, nullable=False)
     
-class OrderItemModel(Base):
-    __tablename__ = "order_items"
+class ProductSnapshotModel(Base):
+    __tablename__ = "product_snapshots"
     
+    # Immutable: one row per distinct version of a product's display fields
     id = Column(Integer, primary_key=True)
-    order_id = Column(String, ForeignKey("orders.id"))
+    fingerprint = Column(String, nullable=False, unique=True)
     product_id = Column(String, nullable=False)
     name = Column(String, nullable=False)
-    price = Column(Float, nullable=False)
-    quantity = Column(Integer, nullable=False)
     description = Column(Text, nullable=True)
     image = Column(String, nullable=True)
     category = Column(String, nullable=True)
 
+class OrderItemModel(Base):
+    __tablename__ = "order_items"
+    
+    id = Column(Integer, primary_key=True)
+    order_id = Column(String, ForeignKey("orders.id"), index=True)
+    product_id = Column(String, nullable=False)
+    snapshot_id = Column(Integer, ForeignKey("product_snapshots.id"), nullable=False)
+    price = Column(Integer, nullable=False)  # so'm
+    quantity = Column(Integer, nullable=False)
+
 class OrderModel(Base):
     __tablename__ = "orders"
     
     id = Column(String, primary_key=True)
-    total = Column(Float, nullable=False)
+    total = Column(Integer, nullable=False)  # so'm
     status = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False)
     free_delivery = Column(Boolean, default=False)
     rating = Column(Integer, nullable=True)  # Add this line
+    delivery_fee = Column(Integer, nullable=True)
+    price_mismatch = Column(Boolean, default=False)
+    # Bumped by every status change; the SQL default lets migrations that
+    # rebuild the table copy older rows without it
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    customer_id = Column(Integer, ForeignKey("customer_directory.id"), nullable=True)
+    # When the order entered each status, by the server's clock (UTC)
+    placed_at = Column(DateTime, nullable=True)
+    delivering_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    cancelled_at = Column(DateTime, nullable=True)
     
     customer = relationship("CustomerInfoModel", backref="order", uselist=False, cascade="all, delete-orphan")
     items = relationship("OrderItemModel", backref="order", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # A customer's orders, newest first
+        Index("ix_orders_customer_id_created_at", "customer_id", "created_at"),
+        # The active orders, for the kitchen queue
+        Index("ix_orders_status_placed_at", "status", "placed_at"),
+    )
+
+class DeliveryZoneModel(Base):
+    __tablename__ = "delivery_zones"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    districts = Column(Text, nullable=False)  # comma-separated district names
+    fee = Column(Integer, nullable=False)
+    free_threshold = Column(Integer, nullable=True)
+
+class KitchenStatModel(Base):
+    __tablename__ = "kitchen_stats"
+    
+    # Moving averages behind the kitchen's estimates (see kitchen.py)
+    name = Column(String, primary_key=True)
+    samples = Column(Integer, nullable=False)
+    mean = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=True)
+
+class CacheVersionModel(Base):
+    __tablename__ = "cache_versions"
+    
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+def setup_engine(engine):
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    # Count SQL statements and their time per request for /metrics
+    metrics.instrument_engine(engine)
+    # Time statements for Server-Timing and log slow ones with their query plan
+    profiler.instrument_engine(engine, slow_query_ms=SLOW_QUERY_MS)
+    # Create tables in the database and bring existing ones up to date,
+    # unless they already are (the usual case: two reads)
+    migrations.ensure_schema(engine, Base.metadata)
+
+# Set by init() rather than at import
+branches = None
+
+# The default branch, for scripts that work on a single database
+engine = None
+SessionLocal = None
+
+# Old final orders of each branch, keyed by the branch's engine
+archives = {}
+
+# The group-commit writer of each branch, by slug
+writers = {}
+
+# The audit log of each branch, keyed by the branch's engine
+audit_logs = {}
 
-# Create tables in the database
-Base.metadata.create_all(bind=engine)
+_init_lock = threading.Lock()
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
+def init():
+    """Open every branch database, archive and audit log, creating and migrating them if needed."""
+    global branches, engine, SessionLocal, archives, writers, audit_logs
+    with _init_lock:
+        if branches is None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            if SLOW_QUERY_LOG:
+                profiler.configure_slow_query_log(SLOW_QUERY_LOG)
+            registry = BranchRegistry(BRANCHES, database_url, setup_engine)
+            archives = {branch.engine: OrderArchive(archive_url(branch.slug)) for branch in registry.branches.values()}
+            audit_logs = {
+                branch.engine: audit.AuditLog(audit_url(branch.slug), AUDIT_FLUSH_SECONDS, AUDIT_SEGMENT_EVENTS)
+                for branch in registry.branches.values()
+            }
+            writers = {
+                slug: GroupCommitWriter(
+                    branch.SessionLocal,
+                    max_queue=WRITE_QUEUE_SIZE,
+                    max_batch=WRITE_BATCH_SIZE,
+                    on_batch=lambda size: metrics.write_batch_size.observe((), size)
+                )
+                for slug, branch in registry.branches.items()
+            }
+            engine = registry.default.engine
+            SessionLocal = registry.default.SessionLocal
+            # Last, as get_db reads it without the lock
+            branches = registry
+    return branches
+
+def backup_databases():
+    """Files of every branch database, archive and audit log."""
+    return (
+        [database_path(slug) for slug in BRANCHES]
+        + [archive_path(slug) for slug in BRANCHES]
+        + [audit_path(slug) for slug in BRANCHES]
+    )
+
+# Started with the app when BACKUP_INTERVAL is set, or by POST /backups
+backup_scheduler = backup.BackupScheduler(backup_databases(), BACKUP_DIR, BACKUP_INTERVAL or None, BACKUP_KEEP)
+
+# Dependencies to get the request's branch and a database session of it
+def get_branch(request: Request):
+    branch = (branches or init()).resolve(request.headers, request.query_params)
+    if branch is None:
+        raise HTTPException(status_code=404, detail="Branch not found")
+    return branch
+
+def get_db(branch: Branch = Depends(get_branch)):
+    db = branch.SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+# Who makes a change, for the audit log
+ACTOR_MAX_LENGTH = 100
+
+def get_actor(request: Request):
+    actor = request.headers.get("x-actor", "").strip()
+    if actor:
+        return actor[:ACTOR_MAX_LENGTH]
+    return f"ip:{request.client.host}" if request.client else "unknown"
+
+# Admission control for writes (see admission.py): placing orders and
+# uploading products
+WRITE_ROUTES = [
+    ("POST", re.compile(r"/orders")),
+    ("POST", re.compile(r"/customers/[^/]+/reorder")),
+    ("POST", re.compile(r"/products")),
+    ("PUT", re.compile(r"/products/[^/]+")),
+]
+
+write_limiter = RateLimiter(WRITE_RATE, WRITE_BURST)
+
+def client_address(scope):
+    return scope["client"][0] if scope.get("client") else ""
+
+def branch_writer(scope):
+    request = Request(scope)
+    branch = (branches or init()).resolve(request.headers, request.query_params)
+    return writers[branch.slug] if branch is not None else None
+
+async def write(branch, job):
+    """Result of `job(db)` once the batch it ran in is committed."""
+    try:
+        return await writers[branch.slug].submit(job)
+    except QueueFull as e:
+        metrics.write_rejections.inc(("queue_full",))
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Server is busy, try again later",
+            headers=retry_after_header(e.retry_after)
+        )
+
 # Pydantic models
 class CustomerInfo(BaseModel):
     name: str
@@ -102,7 +438,7 @@ class CustomerInfo(BaseModel):
 class CartItem(BaseModel):
     id: str
     name: str
-    price: float
+    price: int
     quantity: int
     description: Optional[str] = None
     image: Optional[str] = None
@@ -111,15 +447,26 @@ class CartItem(BaseModel):
     class Config:
         orm_mode = True
 
+class OrderEta(BaseModel):
+    queuePosition: Optional[int] = None  # 1: next out of the kitchen; none once out for delivery
+    readyAt: Optional[datetime] = None  # UTC, with its offset
+    arrivesAt: datetime  # UTC, with its offset
+    minutes: int  # until it arrives
+
 class Order(BaseModel):
     id: str
     items: List[CartItem]
     customer: CustomerInfo
-    total: float
+    total: int
     status: str
     createdAt: datetime
     freeDelivery: bool
     rating: Optional[int] = None  # Add this line
+    deliveryFee: Optional[int] = None  # computed by the server
+    totalWithDelivery: Optional[int] = None  # computed by the server
+    priceMismatch: Optional[bool] = None  # computed by the server
+    version: Optional[int] = None  # for PUT /orders/{id}?version=
+    eta: Optional[OrderEta] = None  # computed by the server, in GET /orders/{id}
     
     class Config:
         orm_mode = True
@@ -128,7 +475,7 @@ class Product(BaseModel):
     id: str
     name: str
     description: str
-    price: float
+    price: int
     category: str
     image: Optional[str] = None
     popular: Optional[bool] = False
@@ -136,21 +483,89 @@ class Product(BaseModel):
     class Config:
         orm_mode = True
 
-app = FastAPI(title="Denov Baraka Somsa API")
+class ProductSearch(BaseModel):
+    results: List[Product]
+    facets: Dict[str, int]  # matches per category, ignoring the category filter
+    total: int
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+class DeliveryZone(BaseModel):
+    id: Optional[int] = None
+    name: str
+    districts: str
+    fee: int
+    freeThreshold: Optional[int] = None
+
+class DeliveryQuote(BaseModel):
+    zone: Optional[str] = None
+    deliveryFee: int
+    freeDelivery: bool
+
+class BulkStatusChange(BaseModel):
+    status: str
+    ids: Optional[List[str]] = None  # default: every order in fromStatus
+    fromStatus: Optional[str] = None
+
+class StatusConflict(BaseModel):
+    id: str
+    status: str
+    version: int
+
+class BulkStatusResult(BaseModel):
+    status: str
+    updated: List[Order]
+    conflicts: List[StatusConflict]  # could not move to status
+    notFound: List[str]  # unknown or archived
+
+class Customer(BaseModel):
+    phone: str  # normalized
+    name: str
+    address: str
+    orderCount: int
+    lastOrderId: Optional[str] = None
+    lastOrderAt: Optional[datetime] = None
+
+class Reorder(BaseModel):
+    id: Optional[str] = None  # new order id; a retry with the same id returns that order
+    address: Optional[str] = None  # default: the last order's
+
+class Snapshot(BaseModel):
+    name: str
+    size: int
+    createdAt: datetime
+
+class AuditEvent(BaseModel):
+    at: datetime  # UTC
+    actor: str
+    action: str  # create, update, delete, status or rating
+    changes: Dict[str, List[Any]]  # field -> [before, after]
 
-# Serve static files (uploads)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+class ProductAtTime(BaseModel):
+    at: datetime
+    product: Optional[Product] = None  # none: it did not exist then
+
+class OrderAtTime(BaseModel):
+    at: datetime
+    order: Optional[Order] = None  # none: it was not placed yet
+
+class BranchList(BaseModel):
+    branches: List[str]
+    default: str
+
+class Stats(BaseModel):
+    totalOrders: int
+    activeOrders: int
+    completedOrders: int
+    cancelledOrders: int
+    totalRevenue: int
+
+# Endpoints, added to the app by create_app()
+router = APIRouter()
 
 # Helper functions
+def upload_file_path(image):
+    """File in UPLOAD_DIR behind an image URL such as /uploads/p1a2b3c4d.jpg."""
+    return os.path.join(UPLOAD_DIR, os.path.basename(image))
+
 def db_product_to_schema(product):
     return Product(
         id=product.id,
@@ -162,16 +577,25 @@ def db_product_to_schema(product):
         popular=product.popular
     )
 
-def db_order_to_schema(db_order, db_customer, db_items):
+def db_zone_to_schema(zone):
+    return DeliveryZone(
+        id=zone.id,
+        name=zone.name,
+        districts=zone.districts,
+        fee=zone.fee,
+        freeThreshold=zone.free_threshold
+    )
+
+def db_order_to_schema(db_order, db_customer, db_items, snapshots):
     cart_items = [
         CartItem(
             id=item.product_id,
-            name=item.name,
+            name=snapshots[item.snapshot_id]["name"],
             price=item.price,
             quantity=item.quantity,
-            description=item.description,
-            image=item.image,
-            category=item.category
+            description=snapshots[item.snapshot_id]["description"],
+            image=snapshots[item.snapshot_id]["image"],
+            category=snapshots[item.snapshot_id]["category"]
         ) for item in db_items
     ]
     
@@ -189,28 +613,180 @@ def db_order_to_schema(db_order, db_customer, db_items):
         status=db_order.status,
         createdAt=db_order.created_at,
         freeDelivery=db_order.free_delivery,
-        rating=db_order.rating  # Add this line
+        rating=db_order.rating,  # Add this line
+        deliveryFee=db_order.delivery_fee,
+        totalWithDelivery=None if db_order.delivery_fee is None else db_order.total + db_order.delivery_fee,
+        priceMismatch=db_order.price_mismatch,
+        version=db_order.version
+    )
+
+# Ids per IN (...) query, below SQLite's bound parameter limit
+IN_CHUNK_SIZE = 500
+
+def load_orders(db, db_orders):
+    """Build Order schemas with one query each for customers, items and new snapshots."""
+    order_ids = [order.id for order in db_orders]
+    customers = {}
+    items = {order_id: [] for order_id in order_ids}
+    for start in range(0, len(order_ids), IN_CHUNK_SIZE):
+        chunk = order_ids[start:start + IN_CHUNK_SIZE]
+        for customer in db.query(CustomerInfoModel).filter(CustomerInfoModel.order_id.in_(chunk)):
+            customers[customer.order_id] = customer
+        for item in db.query(OrderItemModel).filter(OrderItemModel.order_id.in_(chunk)).order_by(OrderItemModel.id):
+            items[item.order_id].append(item)
+    
+    snapshots = snapshot_store.get_many(db, {item.snapshot_id for lines in items.values() for item in lines})
+    return [
+        db_order_to_schema(order, customers[order.id], items[order.id], snapshots)
+        for order in db_orders
+    ]
+
+# Order lines reference deduplicated product snapshots, cached per worker
+snapshot_store = SnapshotStore(ProductSnapshotModel)
+
+# Per-worker caches, kept coherent through the cache_versions table
+def load_products(db):
+    return {product.id: db_product_to_schema(product) for product in db.query(ProductModel).all()}
+
+def load_stats(db):
+    row = db.query(
+        func.count(OrderModel.id),
+        func.sum(case((OrderModel.status == "completed", 1), else_=0)),
+        func.sum(case((OrderModel.status == "cancelled", 1), else_=0)),
+        func.sum(case((OrderModel.status == "completed", OrderModel.total), else_=0)),
+    ).one()
+    total, completed, cancelled, revenue = row
+    
+    # Archived orders come from the archive's rollup, not a scan
+    archived = archives[db.get_bind()].summary()
+    archived_completed, archived_revenue = archived.get("completed", (0, 0))
+    archived_cancelled = archived.get("cancelled", (0, 0))[0]
+    total += sum(orders for orders, _ in archived.values())
+    completed = (completed or 0) + archived_completed
+    cancelled = (cancelled or 0) + archived_cancelled
+    revenue = (revenue or 0) + archived_revenue
+    return Stats(
+        totalOrders=total,
+        activeOrders=total - (completed or 0) - (cancelled or 0),
+        completedOrders=completed or 0,
+        cancelledOrders=cancelled or 0,
+        totalRevenue=revenue or 0
+    )
+
+def delete_orders(branch, order_ids):
+    """Delete orders with their customers and lines, once they are archived."""
+    db = branch.SessionLocal()
+    try:
+        for start in range(0, len(order_ids), IN_CHUNK_SIZE):
+            chunk = order_ids[start:start + IN_CHUNK_SIZE]
+            for model, column in (
+                (OrderItemModel, OrderItemModel.order_id),
+                (CustomerInfoModel, CustomerInfoModel.order_id),
+                (OrderModel, OrderModel.id),
+            ):
+                db.query(model).filter(column.in_(chunk)).delete(synchronize_session=False)
+        stats_cache.invalidate(db)
+        db.commit()
+    finally:
+        db.close()
+
+def invalidate_stats(branch):
+    db = branch.SessionLocal()
+    try:
+        stats_cache.invalidate(db)
+        db.commit()
+    finally:
+        db.close()
+
+def load_delivery_zones(db):
+    return DeliveryZoneIndex(
+        db.query(DeliveryZoneModel).all(),
+        default_fee=DELIVERY_FEE,
+        default_free_threshold=FREE_DELIVERY_THRESHOLD
+    )
+
+def load_kitchen(db):
+    """The kitchen queue, from the orders placed within kitchen.QUEUE_WINDOW that are still active."""
+    orders = (
+        db.query(OrderModel.id, OrderModel.status, OrderModel.placed_at, OrderModel.delivering_at)
+        .filter(
+            OrderModel.status.in_(kitchen.ACTIVE_STATUSES),
+            OrderModel.placed_at >= utcnow() - kitchen.QUEUE_WINDOW
+        )
+        .order_by(OrderModel.placed_at)
+        .all()
+    )
+    items = {order.id: [] for order in orders}
+    order_ids = list(items)
+    for start in range(0, len(order_ids), IN_CHUNK_SIZE):
+        chunk = order_ids[start:start + IN_CHUNK_SIZE]
+        for order_id, product_id, quantity in db.query(
+            OrderItemModel.order_id, OrderItemModel.product_id, OrderItemModel.quantity
+        ).filter(OrderItemModel.order_id.in_(chunk)):
+            items[order_id].append((product_id, quantity))
+    return kitchen.KitchenQueue(
+        kitchen.KitchenStats.load(db),
+        [(order.id, order.status, order.placed_at, order.delivering_at, items[order.id]) for order in orders]
     )
 
+def order_eta(db, order_id):
+    now = utcnow()
+    estimate = kitchen_cache.get(db).estimate(order_id, now)
+    if estimate is None:
+        return None
+    # Aware, so clients do not read the naive UTC times as local ones
+    return OrderEta(
+        queuePosition=estimate.position,
+        readyAt=estimate.ready_at.replace(tzinfo=timezone.utc) if estimate.ready_at else None,
+        arrivesAt=estimate.arrives_at.replace(tzinfo=timezone.utc),
+        minutes=round((estimate.arrives_at - now).total_seconds() / 60)
+    )
+
+products_cache = VersionedCache("products", load_products)
+delivery_cache = VersionedCache("delivery_zones", load_delivery_zones)
+stats_cache = VersionedCache("stats", load_stats)
+kitchen_cache = VersionedCache("kitchen", load_kitchen)
+
 # API endpoints
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"message": "Welcome to Denov Baraka Somsa API"}
 
 # Product endpoints
-@app.get("/products", response_model=List[Product])
+@router.get("/products", response_model=List[Product])
 def get_products(db: Session = Depends(get_db)):
-    db_products = db.query(ProductModel).all()
-    return [db_product_to_schema(product) for product in db_products]
+    return list(products_cache.get(db).values())
+
+# Declared before /products/{product_id}, which would otherwise match "search"
+@router.get("/products/search", response_model=ProductSearch)
+def search_products_endpoint(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    popular: Optional[bool] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db)
+):
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="Limit must be at least 1")
+    result = search_products(db, q=q, category=category, popular=popular, limit=limit)
+    return ProductSearch(results=result.products, facets=result.facets, total=result.total)
 
-@app.get("/products/{product_id}", response_model=Product)
+@router.get("/products/{product_id}", response_model=Product)
 def get_product(product_id: str, db: Session = Depends(get_db)):
-    db_product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
-    if not db_product:
+    product = products_cache.get(db).get(product_id)
+    if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return db_product_to_schema(db_product)
+    return product
 
-@app.post("/products", status_code=status.HTTP_201_CREATED)
+def save_image(image, image_path):
+    """Write an uploaded image to the file behind its URL, with its precompressed copies."""
+    file_path = upload_file_path(image_path)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(image.file, buffer)
+    metrics.upload_bytes.inc(amount=os.path.getsize(file_path))
+    precompress_file(file_path)
+
+@router.post("/products", status_code=status.HTTP_201_CREATED)
 async def create_product(
     name: str = Form(...),
     description: str = Form(...),
@@ -218,8 +794,11 @@ async def create_product(
     category: str = Form(...),
     popular: bool = Form(False),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    branch: Branch = Depends(get_branch),
+    actor: str = Depends(get_actor)
 ):
+    # The admin bot sends prices as typed, e.g. "12000.0"
+    price = to_som(price)
     if price <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -240,21 +819,17 @@ async def create_product(
                     detail="Invalid image format. Allowed formats: JPG, JPEG, PNG, WEBP"
                 )
 
-            # Save the uploaded image
-            image_path = f"uploads/{product_id}{file_extension}"
-            
-            with open(image_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-            
-            # Use relative path for storage
-            image_path = f"/{image_path}"
+            # Save the uploaded image; the product stores its URL. Off the
+            # event loop, which keeps serving the catalog meanwhile
+            image_path = f"/uploads/{product_id}{file_extension}"
+            await asyncio.to_thread(save_image, image, image_path)
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error uploading image: {str(e)}"
             )
     
-    try:
+    def insert_product(db):
         new_product = ProductModel(
             id=product_id,
             name=name.strip(),
@@ -266,24 +841,33 @@ async def create_product(
         )
         
         db.add(new_product)
-        db.commit()
-        db.refresh(new_product)
-        
+        products_cache.invalidate(db)
+        db.flush()
         return db_product_to_schema(new_product)
+    
+    try:
+        product = await write(branch, insert_product)
     except Exception as e:
-        db.rollback()
         # If product creation fails, delete uploaded image
-        if image_path and os.path.exists(image_path.lstrip("/")):
+        if image_path and os.path.exists(upload_file_path(image_path)):
             try:
-                os.remove(image_path.lstrip("/"))
+                os.remove(upload_file_path(image_path))
+                remove_precompressed(upload_file_path(image_path))
             except:
                 pass
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating product: {str(e)}"
         )
+    
+    audit_logs[branch.engine].record(
+        "product", product.id, audit.CREATE, audit.diff(None, product.model_dump()), actor
+    )
+    return product
 
-@app.put("/products/{product_id}")
+@router.put("/products/{product_id}")
 async def update_product(
     product_id: str,
     name: Optional[str] = Form(None),
@@ -292,7 +876,9 @@ async def update_product(
     category: Optional[str] = Form(None),
     popular: Optional[bool] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    branch: Branch = Depends(get_branch),
+    actor: str = Depends(get_actor)
 ):
     # Find the product
     product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
@@ -300,72 +886,92 @@ async def update_product(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Update product data
+    # Update product data, written by the branch's writer below
+    changes = {}
     if name is not None:
-        product.name = name
+        changes["name"] = name
     
     if description is not None:
-        product.description = description
+        changes["description"] = description
     
     if price is not None:
-        product.price = price
+        changes["price"] = to_som(price)
     
     if category is not None:
-        product.category = category
+        changes["category"] = category
     
     if popular is not None:
         if isinstance(popular, str):
-            product.popular = popular.lower() == "true"
+            changes["popular"] = popular.lower() == "true"
         else:
-            product.popular = popular
+            changes["popular"] = popular
     
     if image:
         # Delete old image if exists
-        if product.image and os.path.exists(product.image.lstrip("/")):
+        if product.image and os.path.exists(upload_file_path(product.image)):
             try:
-                os.remove(product.image.lstrip("/"))
+                os.remove(upload_file_path(product.image))
+                remove_precompressed(upload_file_path(product.image))
             except:
                 pass
         
-        # Save the new image
+        # Save the new image; the product stores its URL
         file_extension = os.path.splitext(image.filename)[1]
-        image_path = f"uploads/{product_id}{file_extension}"
+        image_path = f"/uploads/{product_id}{file_extension}"
+        await asyncio.to_thread(save_image, image, image_path)
         
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        # Use relative path for storage
-        product.image = f"/{image_path}"
+        changes["image"] = image_path
+    
+    def apply_changes(db):
+        product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        before = db_product_to_schema(product)
+        for field, value in changes.items():
+            setattr(product, field, value)
+        products_cache.invalidate(db)
+        db.flush()
+        return before, db_product_to_schema(product)
     
     try:
-        db.commit()
-        db.refresh(product)
-        return db_product_to_schema(product)
+        before, after = await write(branch, apply_changes)
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating product: {str(e)}"
         )
+    
+    audit_logs[branch.engine].record(
+        "product", product_id, "update", audit.diff(before.model_dump(), after.model_dump()), actor
+    )
+    return after
 
-@app.delete("/products/{product_id}")
-def delete_product(product_id: str, db: Session = Depends(get_db)):
+@router.delete("/products/{product_id}")
+def delete_product(product_id: str, db: Session = Depends(get_db), actor: str = Depends(get_actor)):
     product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
     
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Delete the product image if it exists
-    if product.image and os.path.exists(product.image.lstrip("/")):
+    if product.image and os.path.exists(upload_file_path(product.image)):
         try:
-            os.remove(product.image.lstrip("/"))
+            os.remove(upload_file_path(product.image))
+            remove_precompressed(upload_file_path(product.image))
         except:
             pass
     
     try:
+        deleted = db_product_to_schema(product)
         db.delete(product)
+        products_cache.invalidate(db)
         db.commit()
-        return {"message": f"Product {product_id} deleted", "product": db_product_to_schema(product)}
+        audit_logs[db.get_bind()].record(
+            "product", product_id, audit.DELETE, audit.diff(deleted.model_dump(), None), actor
+        )
+        return {"message": f"Product {product_id} deleted", "product": deleted}
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -374,40 +980,82 @@ def delete_product(product_id: str, db: Session = Depends(get_db)):
         )
 
 # Order endpoints
-@app.get("/orders", response_model=List[Order])
+@router.get("/orders", response_model=List[Order])
 def get_orders(db: Session = Depends(get_db)):
-    db_orders = db.query(OrderModel).all()
-    result = []
-    
-    for order in db_orders:
-        customer = db.query(CustomerInfoModel).filter(CustomerInfoModel.order_id == order.id).first()
-        items = db.query(OrderItemModel).filter(OrderItemModel.order_id == order.id).all()
-        result.append(db_order_to_schema(order, customer, items))
-    
-    return result
+    return load_orders(db, db.query(OrderModel).all())
 
-@app.get("/orders/{order_id}", response_model=Order)
+@router.get("/orders/{order_id}", response_model=Order)
 def get_order(order_id: str, db: Session = Depends(get_db)):
     order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
     
     if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    customer = db.query(CustomerInfoModel).filter(CustomerInfoModel.order_id == order_id).first()
-    items = db.query(OrderItemModel).filter(OrderItemModel.order_id == order_id).all()
+        # Old completed and cancelled orders live in the archive
+        archived = archives[db.get_bind()].get(order_id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        return archived
     
-    return db_order_to_schema(order, customer, items)
+    result = load_orders(db, [order])[0]
+    if order.status not in FINAL_STATUSES:
+        result.eta = order_eta(db, order_id)
+    return result
 
-@app.post("/orders", response_model=Order)
-def create_order(order: Order, db: Session = Depends(get_db)):
+@router.post("/orders", response_model=Order)
+async def create_order(order: Order, branch: Branch = Depends(get_branch)):
+    # Committed together with the other orders of its batch
+    return await write(branch, lambda db: place_order(db, order))
+
+def place_order(db, order):
+    """Add `order` in `db`'s transaction, without committing; returns it as stored."""
+    if not order.items or any(item.quantity <= 0 for item in order.items):
+        raise HTTPException(status_code=400, detail="Order must contain items with positive quantities")
+    # The archival job would take the new order for the archived one and drop it
+    if archives[db.get_bind()].contains(order.id):
+        raise HTTPException(status_code=409, detail="Order id is already taken")
+    
+    # Reprice the lines from the in-memory catalog and recompute the total
+    price_check = check_order_prices(products_cache.get(db), order.items, order.total)
+    if price_check.problems and PRICE_VALIDATION == "reject":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Order does not match the catalog", "problems": price_check.problems}
+        )
+    order.items = price_check.items
+    order.total = price_check.total
+    order.priceMismatch = bool(price_check.problems)
+    # Every order enters the status graph at its start
+    order.status = INITIAL_STATUS
+    order.version = 0
+    order.eta = None
+    
     try:
+        # One lookup per distinct product version, however many lines have it
+        snapshot_ids = {}
+        for item in order.items:
+            fields = (item.id, item.name, item.description, item.image, item.category)
+            if fields not in snapshot_ids:
+                snapshot_ids[fields] = snapshot_store.get_or_create(db, *fields)
+        
+        # Delivery is priced by the server, whatever the client sent
+        quote = delivery_cache.get(db).quote(order.customer.address, order.total)
+        order.freeDelivery = quote.free_delivery
+        order.deliveryFee = quote.fee
+        order.totalWithDelivery = order.total + quote.fee
+        
+        # Add the customer to the directory, or update their details
+        customer_id = remember_customer(db, CustomerModel, order.customer, order.id, order.createdAt)
+        
         # Create order
         db_order = OrderModel(
             id=order.id,
             total=order.total,
             status=order.status,
             created_at=order.createdAt,
-            free_delivery=order.freeDelivery
+            free_delivery=quote.free_delivery,
+            delivery_fee=quote.fee,
+            price_mismatch=order.priceMismatch,
+            customer_id=customer_id,
+            placed_at=utcnow()
         )
         db.add(db_order)
         
@@ -425,71 +1073,187 @@ def create_order(order: Order, db: Session = Depends(get_db)):
             db_item = OrderItemModel(
                 order_id=order.id,
                 product_id=item.id,
-                name=item.name,
+                snapshot_id=snapshot_ids[(item.id, item.name, item.description, item.image, item.category)],
                 price=item.price,
-                quantity=item.quantity,
-                description=item.description,
-                image=item.image,
-                category=item.category
+                quantity=item.quantity
             )
             db.add(db_item)
         
-        db.commit()
+        stats_cache.invalidate(db)
+        kitchen_cache.invalidate(db)
+        db.flush()
         return order
     except Exception as e:
-        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating order: {str(e)}"
         )
 
-@app.put("/orders/{order_id}")
-def update_order_status(order_id: str, status: str, db: Session = Depends(get_db)):
-    order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
+def raise_order_not_found(db, order_id):
+    # Archived orders are final and read-only
+    if archives[db.get_bind()].contains(order_id):
+        raise HTTPException(status_code=409, detail="Order is archived and can no longer change")
+    raise HTTPException(status_code=404, detail="Order not found")
+
+def audit_status_change(db, order, actor):
+    """Record an order's committed move into its current status in the audit log."""
+    audit_logs[db.get_bind()].record(
+        "order",
+        order.id,
+        "status",
+        {"status": [previous_status(order, order.status), order.status], "version": [order.version - 1, order.version]},
+        actor,
+        at=getattr(order, STATUS_TIME_COLUMNS[order.status])
+    )
+
+@router.put("/orders/{order_id}")
+def update_order_status(
+    order_id: str,
+    status: str,
+    version: Optional[int] = None,
+    db: Session = Depends(get_db),
+    actor: str = Depends(get_actor)
+):
+    # `status` is the new status here, not fastapi.status
+    if status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status {status!r}")
     
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    try:
+        order = change_status(db, OrderModel, order_id, status, version)
+        if order is None:
+            state = current_state(db, OrderModel, order_id)
+            db.rollback()
+            if state is None:
+                raise_order_not_found(db, order_id)
+            if version is not None and state.version != version:
+                message = "Order was changed by someone else"
+            elif state.status == status:
+                message = f"Order is already {status}"
+            else:
+                message = f"Order cannot go from {state.status} to {status}"
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": message,
+                    "status": state.status,
+                    "version": state.version,
+                    "allowed": list(TRANSITIONS[state.status]) if state.status in TRANSITIONS else []
+                }
+            )
+        
+        # Keep the returned row loaded instead of reading it again after commit
+        db.expunge(order)
+        
+        # Learn how long the kitchen and the couriers take
+        if status == "delivering" and order.placed_at is not None:
+            items = db.query(OrderItemModel.product_id, OrderItemModel.quantity).filter(
+                OrderItemModel.order_id == order_id
+            ).all()
+            kitchen.record_ready(db, order.placed_at, order.delivering_at, items)
+        elif status == "completed" and order.delivering_at is not None:
+            kitchen.record_delivered(db, order.delivering_at, order.completed_at)
+        
+        stats_cache.invalidate(db)
+        kitchen_cache.invalidate(db)
+        db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error updating order status: {str(e)}"
+        )
     
-    order.status = status
+    audit_status_change(db, order, actor)
+    return {
+        "message": f"Order {order_id} status updated to {status}", 
+        "order": load_orders(db, [order])[0]
+    }
+
+# Ids per bulk status change, so one request cannot hold the write lock for long
+BULK_MAX_IDS = 1000
+
+@router.put("/orders/status/bulk", response_model=BulkStatusResult)
+def update_order_statuses(change: BulkStatusChange, db: Session = Depends(get_db), actor: str = Depends(get_actor)):
+    """Change the status of many orders in one transaction, e.g. at closing time."""
+    if change.status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status {change.status!r}")
+    if change.fromStatus is not None and change.fromStatus not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status {change.fromStatus!r}")
+    if change.ids is None and change.fromStatus is None:
+        raise HTTPException(status_code=400, detail="Give the order ids or fromStatus")
+    ids = list(dict.fromkeys(change.ids)) if change.ids is not None else None
+    if ids is not None and len(ids) > BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_IDS} orders per request")
     
     try:
-        db.commit()
-        db.refresh(order)
+        updated = change_statuses(db, OrderModel, change.status, ids, change.fromStatus, IN_CHUNK_SIZE)
+        for order in updated:
+            db.expunge(order)
         
-        customer = db.query(CustomerInfoModel).filter(CustomerInfoModel.order_id == order_id).first()
-        items = db.query(OrderItemModel).filter(OrderItemModel.order_id == order_id).all()
+        # Why the other requested orders did not change
+        conflicts, not_found = [], []
+        if ids is not None:
+            missing = set(ids) - {order.id for order in updated}
+            states = {}
+            missing_ids = list(missing)
+            for start in range(0, len(missing_ids), IN_CHUNK_SIZE):
+                chunk = missing_ids[start:start + IN_CHUNK_SIZE]
+                states.update(
+                    (row.id, row) for row in db.query(OrderModel.id, OrderModel.status, OrderModel.version)
+                    .filter(OrderModel.id.in_(chunk))
+                )
+            for order_id in ids:
+                if order_id in states:
+                    state = states[order_id]
+                    conflicts.append(StatusConflict(id=order_id, status=state.status, version=state.version))
+                elif order_id in missing:
+                    not_found.append(order_id)
         
-        return {
-            "message": f"Order {order_id} status updated to {status}", 
-            "order": db_order_to_schema(order, customer, items)
-        }
+        # Not timed for the kitchen's statistics: a bulk change says
+        # when someone caught up, not when each order was ready
+        if updated:
+            stats_cache.invalidate(db)
+            kitchen_cache.invalidate(db)
+        db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error updating order status: {str(e)}"
+            detail=f"Error updating order statuses: {str(e)}"
         )
+    
+    for order in updated:
+        audit_status_change(db, order, actor)
+    return BulkStatusResult(
+        status=change.status,
+        updated=load_orders(db, updated),
+        conflicts=conflicts,
+        notFound=not_found
+    )
 
-@app.put("/orders/{order_id}/rating")
-def update_order_rating(order_id: str, rating: int, db: Session = Depends(get_db)):
+@router.put("/orders/{order_id}/rating")
+def update_order_rating(order_id: str, rating: int, db: Session = Depends(get_db), actor: str = Depends(get_actor)):
     order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
     
     if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+        raise_order_not_found(db, order_id)
     
     if rating < 1 or rating > 5:
         raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
+    previous_rating = order.rating
     order.rating = rating
     
     try:
         db.commit()
         db.refresh(order)
+        audit_logs[db.get_bind()].record(
+            "order", order_id, "rating", audit.diff({"rating": previous_rating}, {"rating": rating}), actor
+        )
         
-        customer = db.query(CustomerInfoModel).filter(CustomerInfoModel.order_id == order_id).first()
-        items = db.query(OrderItemModel).filter(OrderItemModel.order_id == order_id).all()
-        
-        return db_order_to_schema(order, customer, items)
+        return load_orders(db, [order])[0]
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -497,7 +1261,451 @@ def update_order_rating(order_id: str, rating: int, db: Session = Depends(get_db
             detail=f"Error updating order rating: {str(e)}"
         )
 
+# Customer endpoints
+def find_customer(db, phone):
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+    customer = db.query(CustomerModel).filter(CustomerModel.phone == normalized).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer
+
+def db_customer_to_schema(customer):
+    return Customer(
+        phone=customer.phone,
+        name=customer.name,
+        address=customer.address,
+        orderCount=customer.order_count,
+        lastOrderId=customer.last_order_id,
+        lastOrderAt=customer.last_order_at
+    )
+
+def check_customers_token(request: Request):
+    if not CUSTOMERS_TOKEN:
+        raise HTTPException(status_code=403, detail="The customer directory is disabled; set CUSTOMERS_TOKEN")
+    if request.headers.get("x-customers-token") != CUSTOMERS_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid customers token")
+
+@router.get("/customers/{phone}", response_model=Customer, dependencies=[Depends(check_customers_token)])
+def get_customer(phone: str, db: Session = Depends(get_db)):
+    """The customer's latest details, to prefill checkout."""
+    return db_customer_to_schema(find_customer(db, phone))
+
+# Orders per page of a customer's history
+CUSTOMER_ORDERS_MAX_LIMIT = 100
+
+@router.get("/customers/{phone}/orders", response_model=List[Order], dependencies=[Depends(check_customers_token)])
+def get_customer_orders(
+    phone: str,
+    limit: int = 20,
+    before: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    The customer's orders, archived ones included, newest first. For the
+    next page, pass the createdAt of the last order as `before`.
+    """
+    if limit < 1 or limit > CUSTOMER_ORDERS_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {CUSTOMER_ORDERS_MAX_LIMIT}")
+    customer = find_customer(db, phone)
+    
+    # One index range scan each in the hot database and the archive
+    query = db.query(OrderModel).filter(OrderModel.customer_id == customer.id)
+    if before is not None:
+        query = query.filter(OrderModel.created_at < before)
+    recent = load_orders(db, query.order_by(OrderModel.created_at.desc()).limit(limit).all())
+    archived = archives[db.get_bind()].history(customer.phone, limit, before)
+    
+    # An order being archived can briefly be in both
+    orders = {order["id"]: Order.model_validate(order) for order in archived}
+    orders.update((order.id, order) for order in recent)
+    return sorted(orders.values(), key=lambda order: order.createdAt, reverse=True)[:limit]
+
+def new_order_id():
+    # Numeric like the web app's Date.now() ids, but in microseconds
+    return str(time.time_ns() // 1000)
+
+@router.post(
+    "/customers/{phone}/reorder",
+    response_model=Order,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(check_customers_token)]
+)
+async def reorder_last_order(phone: str, reorder: Optional[Reorder] = None, branch: Branch = Depends(get_branch)):
+    """Place the customer's last order again, at today's catalog prices."""
+    return await write(branch, lambda db: place_reorder(db, phone, reorder or Reorder()))
+
+def place_reorder(db, phone, reorder):
+    customer = find_customer(db, phone)
+    
+    if reorder.id is not None:
+        existing = db.query(OrderModel).filter(OrderModel.id == reorder.id).first()
+        if existing:
+            if existing.customer_id != customer.id:
+                raise HTTPException(status_code=409, detail="Order id is already taken")
+            return load_orders(db, [existing])[0]
+    
+    last = None
+    if customer.last_order_id is not None:
+        last_order = db.query(OrderModel).filter(OrderModel.id == customer.last_order_id).first()
+        if last_order:
+            last = load_orders(db, [last_order])[0]
+        else:
+            archived = archives[db.get_bind()].get(customer.last_order_id)
+            last = Order.model_validate(archived) if archived is not None else None
+    if last is None:
+        raise HTTPException(status_code=404, detail="Customer has no previous order")
+    
+    # Products no longer sold are left out
+    catalog = products_cache.get(db)
+    items = []
+    for item in last.items:
+        product = catalog.get(item.id)
+        if product is not None:
+            items.append(CartItem(
+                id=product.id,
+                name=product.name,
+                price=product.price,
+                quantity=item.quantity,
+                description=product.description,
+                image=product.image,
+                category=product.category
+            ))
+    if not items:
+        raise HTTPException(status_code=409, detail="None of the products of the last order are sold anymore")
+    
+    order = Order(
+        id=reorder.id or new_order_id(),
+        items=items,
+        customer=CustomerInfo(name=customer.name, phone=customer.phone, address=reorder.address or customer.address),
+        total=sum(item.price * item.quantity for item in items),
+        status=INITIAL_STATUS,
+        # UTC, like the web app's createdAt
+        createdAt=datetime.now(timezone.utc),
+        freeDelivery=False
+    )
+    return place_order(db, order)
+
+# Delivery endpoints
+@router.get("/delivery/zones", response_model=List[DeliveryZone])
+def get_delivery_zones(db: Session = Depends(get_db)):
+    return [db_zone_to_schema(zone) for zone in db.query(DeliveryZoneModel).all()]
+
+@router.post("/delivery/zones", response_model=DeliveryZone, status_code=status.HTTP_201_CREATED)
+def create_delivery_zone(zone: DeliveryZone, db: Session = Depends(get_db)):
+    if zone.fee < 0:
+        raise HTTPException(status_code=400, detail="Fee must not be negative")
+    
+    db_zone = DeliveryZoneModel(
+        name=zone.name.strip(),
+        districts=zone.districts,
+        fee=zone.fee,
+        free_threshold=zone.freeThreshold
+    )
+    
+    try:
+        db.add(db_zone)
+        delivery_cache.invalidate(db)
+        db.commit()
+        db.refresh(db_zone)
+        return db_zone_to_schema(db_zone)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error creating delivery zone: {str(e)}"
+        )
+
+@router.delete("/delivery/zones/{zone_id}")
+def delete_delivery_zone(zone_id: int, db: Session = Depends(get_db)):
+    zone = db.query(DeliveryZoneModel).filter(DeliveryZoneModel.id == zone_id).first()
+    
+    if not zone:
+        raise HTTPException(status_code=404, detail="Delivery zone not found")
+    
+    try:
+        db.delete(zone)
+        delivery_cache.invalidate(db)
+        db.commit()
+        return {"message": f"Delivery zone {zone_id} deleted"}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting delivery zone: {str(e)}"
+        )
+
+@router.get("/delivery/quote", response_model=DeliveryQuote)
+def get_delivery_quote(address: str, subtotal: float, db: Session = Depends(get_db)):
+    quote = delivery_cache.get(db).quote(address, to_som(subtotal))
+    return DeliveryQuote(zone=quote.zone, deliveryFee=quote.fee, freeDelivery=quote.free_delivery)
+
+def check_backup_token(request: Request):
+    if not BACKUP_TOKEN:
+        raise HTTPException(status_code=403, detail="Backups over HTTP are disabled; set BACKUP_TOKEN")
+    if request.headers.get("x-backup-token") != BACKUP_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid backup token")
+
+@router.post("/backups", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(check_backup_token)])
+def create_backup():
+    # Runs in the background thread; the snapshot appears in GET /backups
+    if not backup_scheduler.started:
+        backup_scheduler.start()
+    backup_scheduler.trigger()
+    return {"message": "Backup started"}
+
+@router.get("/backups", response_model=List[Snapshot], dependencies=[Depends(check_backup_token)])
+def get_backups():
+    return [
+        Snapshot(
+            name=os.path.basename(path),
+            size=os.path.getsize(path),
+            createdAt=datetime.fromtimestamp(os.path.getmtime(path))
+        )
+        for path in backup.list_snapshots(BACKUP_DIR)
+    ]
+
+def check_audit_token(request: Request):
+    if not AUDIT_TOKEN:
+        raise HTTPException(status_code=403, detail="The audit log over HTTP is disabled; set AUDIT_TOKEN")
+    if request.headers.get("x-audit-token") != AUDIT_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid audit token")
+
+# Path segment -> entity in the audit log
+AUDIT_ENTITIES = {"products": "product", "orders": "order"}
+
+@router.get(
+    "/audit/{entity}/{entity_id}/history",
+    response_model=List[AuditEvent],
+    dependencies=[Depends(check_audit_token)]
+)
+def get_audit_history(
+    entity: str,
+    entity_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Changes to a product or order, oldest first."""
+    if entity not in AUDIT_ENTITIES:
+        raise HTTPException(status_code=404, detail="Not found")
+    events = audit_logs[db.get_bind()].events(
+        AUDIT_ENTITIES[entity],
+        entity_id,
+        since=audit.to_utc(since) if since is not None else None,
+        until=audit.to_utc(until) if until is not None else None
+    )
+    return [AuditEvent(**event) for event in events]
+
+@router.get("/audit/products/{product_id}", response_model=ProductAtTime, dependencies=[Depends(check_audit_token)])
+def get_product_at(product_id: str, at: datetime, db: Session = Depends(get_db)):
+    """The product as it was at `at`."""
+    at = audit.to_utc(at)
+    product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+    current = db_product_to_schema(product).model_dump() if product else None
+    state = audit.state_at(current, audit_logs[db.get_bind()].events("product", product_id, since=at), at)
+    return ProductAtTime(at=at, product=Product(**state) if state is not None else None)
+
+@router.get("/audit/orders/{order_id}", response_model=OrderAtTime, dependencies=[Depends(check_audit_token)])
+def get_order_at(order_id: str, at: datetime, db: Session = Depends(get_db)):
+    """The order as it was at `at`: its status, version and rating then."""
+    at = audit.to_utc(at)
+    order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
+    if order is not None:
+        current = load_orders(db, [order])[0]
+    else:
+        archived = archives[db.get_bind()].get(order_id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        current = Order(**archived)
+    if audit.to_utc(current.createdAt) > at:
+        return OrderAtTime(at=at)
+    state = audit.state_at(current.model_dump(), audit_logs[db.get_bind()].events("order", order_id, since=at), at)
+    return OrderAtTime(at=at, order=Order(**state))
+
+@router.get("/branches", response_model=BranchList)
+def get_branches():
+    return BranchList(branches=list(branches.branches), default=branches.default.slug)
+
+@router.get("/stats", response_model=Stats)
+def get_stats(db: Session = Depends(get_db)):
+    return stats_cache.get(db)
+
+@router.get("/changes", response_model=Dict[str, int])
+def get_changes(db: Session = Depends(get_db)):
+    # Counters that move whenever the catalog changes, or an order is
+    # placed, changes status or is archived; clients keeping responses
+    # (the bot) compare them to know when to fetch again
+    versions = all_versions(db)
+    return {"products": versions.get("products", 0), "orders": versions.get("stats", 0)}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Startup of this worker, in seconds, for GET /ready
+startup = {"ready": False, "importSeconds": None, "initSeconds": None, "warmupSeconds": None}
+
+@router.get("/ready")
+def get_ready():
+    # For load balancers: route traffic to a new worker once its caches are warm
+    if not startup["ready"]:
+        return JSONResponse(status_code=503, content=dict(startup, status="starting"))
+    return dict(startup, status="ready")
+
+def warm_up():
+    """Load every branch's catalog and delivery zones into the caches."""
+    for branch in branches.branches.values():
+        db = branch.SessionLocal()
+        try:
+            products_cache.get(db)
+            delivery_cache.get(db)
+        finally:
+            db.close()
+
+@asynccontextmanager
+async def lifespan(app):
+    start = time.perf_counter()
+    # Blocking file and database work, kept off the event loop
+    await asyncio.to_thread(init)
+    startup["initSeconds"] = round(time.perf_counter() - start, 3)
+    if BACKUP_INTERVAL:
+        backup_scheduler.start()
+    
+    # Serve requests while warming up; they load what they need themselves
+    async def warm():
+        began = time.perf_counter()
+        try:
+            await asyncio.to_thread(warm_up)
+        except Exception:
+            logger.exception("Cache warm-up failed")
+            return
+        startup["warmupSeconds"] = round(time.perf_counter() - began, 3)
+        startup["ready"] = True
+        logger.info(
+            "Ready: import %.2fs, init %.2fs, warm-up %.2fs",
+            startup["importSeconds"], startup["initSeconds"], startup["warmupSeconds"]
+        )
+    
+    warm_up_task = asyncio.create_task(warm())
+    yield
+    warm_up_task.cancel()
+    # Commit what is still queued before closing the databases, and write
+    # the audit log's buffer
+    for writer in writers.values():
+        await writer.close()
+    for audit_log in audit_logs.values():
+        await asyncio.to_thread(audit_log.close)
+    for branch in branches.branches.values():
+        branch.engine.dispose()
+    for archive in archives.values():
+        archive.engine.dispose()
+
+def create_app():
+    """The API as an ASGI app; it opens the databases when it starts."""
+    app = FastAPI(title="Denov Baraka Somsa API", lifespan=lifespan)
+    
+    # Refuse orders and uploads with 429 when this worker cannot take
+    # more; inside CORS so browsers can read the refusal
+    app.add_middleware(
+        AdmissionMiddleware,
+        writes=WRITE_ROUTES,
+        writer_for=branch_writer,
+        limiter=write_limiter,
+        client_for=client_address,
+        exempt=RATE_LIMIT_EXEMPT
+    )
+    
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Compress JSON responses for clients that accept gzip/brotli
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+    
+    # Add Server-Timing query breakdowns to profiled requests
+    app.add_middleware(profiler.ProfilerMiddleware, enabled=PROFILE_QUERIES, token=PROFILE_TOKEN)
+    
+    # Record per-route request metrics; outermost so sizes are bytes on the wire
+    app.add_middleware(metrics.MetricsMiddleware)
+    
+    # Serve uploaded images with ETags, ranges and optional proxy offload;
+    # UPLOAD_DIR is created by init()
+    app.mount(
+        "/uploads",
+        ImageFiles(
+            directory=UPLOAD_DIR,
+            check_dir=False,
+            offload=IMAGE_OFFLOAD,
+            offload_prefix=IMAGE_OFFLOAD_PREFIX,
+            max_age=IMAGE_CACHE_MAX_AGE
+        ),
+        name="uploads"
+    )
+    
+    app.include_router(router)
+    return app
+
+app = create_app()
+startup["importSeconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+def serve(host, port, workers):
+    """
+    Run `workers` worker processes forked from this one.
+
+    Importing the app opens nothing, so forked workers share the
+    imported code and only open their own databases and warm up, instead
+    of each importing FastAPI and SQLAlchemy again. A worker that dies is
+    replaced.
+    """
+    import signal
+    import socket
+    import uvicorn
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    
+    children = {}  # pid -> time forked
+    stopping = False
+    
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                uvicorn.Server(uvicorn.Config(app, host=host, port=port)).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        fork_worker()
+    while children:
+        pid, _ = os.wait()
+        forked = children.pop(pid, None)
+        if not stopping and forked is not None:
+            # Do not spin if workers die right after starting
+            if time.monotonic() - forked < 1:
+                time.sleep(1)
+            fork_worker()
+
 # Run the server
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="192.168.1.3", port=8000)
\ No newline at end of file
+    serve(API_HOST, API_PORT, API_WORKERS)
\ No newline at end of file
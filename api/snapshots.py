@@ -0,0 +1,102 @@
+"""
+Deduplicated product snapshots for order lines
+
+An order line needs the product as it was when the order was placed, but
+copying name, description, image and category into every line multiplies
+the size of order_items. Instead each distinct version of those fields is
+stored once in product_snapshots, keyed by a fingerprint, and order
+lines reference it.
+
+Snapshots are immutable, so every worker can cache them forever: reads
+only query the ids they have not seen yet, and writes only insert a
+snapshot the first time a product version is ordered. A snapshot is
+inserted in the order's own transaction, which may still be rolled back,
+alone or with the other orders of its batch (see admission.py), and its
+id then reused for another snapshot. So only snapshots committed before
+the session inserted anything of its own are cached: a cached id always
+exists. Snapshot ids are per database, so the cache is kept per branch
+database (session bind).
+"""
+
+import hashlib
+import json
+import threading
+
+from sqlalchemy import insert
+
+
+def fingerprint(product_id, name, description, image, category) -> str:
+    data = json.dumps([product_id, name, description, image, category], ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class SnapshotStore:
+    """Per-worker cache in front of the product_snapshots table."""
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._shards = {}  # bind -> (fields by id, id by fingerprint)
+
+    def _maps(self, db):
+        bind = db.get_bind()
+        maps = self._shards.get(bind)
+        if maps is None:
+            with self._lock:
+                maps = self._shards.setdefault(bind, ({}, {}))
+        return maps
+
+    def _remember(self, db, snapshot):
+        # Keep plain values, not rows that expire when their session commits
+        values = {
+            "product_id": snapshot.product_id,
+            "name": snapshot.name,
+            "description": snapshot.description,
+            "image": snapshot.image,
+            "category": snapshot.category,
+        }
+        by_id, id_by_fingerprint = self._maps(db)
+        with self._lock:
+            by_id[snapshot.id] = values
+            id_by_fingerprint[snapshot.fingerprint] = snapshot.id
+
+    def get_many(self, db, snapshot_ids):
+        """Map snapshot ids to their fields, querying only unknown ids."""
+        by_id = self._maps(db)[0]
+        missing = {snapshot_id for snapshot_id in snapshot_ids if snapshot_id not in by_id}
+        if missing:
+            for snapshot in db.query(self.model).filter(self.model.id.in_(missing)):
+                self._remember(db, snapshot)
+        return by_id
+
+    def get_or_create(self, db, product_id, name, description, image, category) -> int:
+        """Id of the snapshot with these fields, inserting it in `db` if needed."""
+        key = fingerprint(product_id, name, description, image, category)
+        snapshot_id = self._maps(db)[1].get(key)
+        if snapshot_id is not None:
+            return snapshot_id
+
+        # Fingerprints this session inserted, committed or not
+        inserted = db.info.setdefault("inserted_snapshots", set())
+        snapshot = db.query(self.model).filter(self.model.fingerprint == key).first()
+        if snapshot is not None:
+            if key not in inserted:
+                self._remember(db, snapshot)
+            return snapshot.id
+
+        # Another worker may insert the same snapshot concurrently
+        db.execute(
+            insert(self.model)
+            .values(
+                fingerprint=key,
+                product_id=product_id,
+                name=name,
+                description=description,
+                image=image,
+                category=category,
+            )
+            .prefix_with("OR IGNORE")
+        )
+        # Not cached: the insert is only visible to this transaction
+        inserted.add(key)
+        return db.query(self.model.id).filter(self.model.fingerprint == key).scalar()
@@ -0,0 +1,36 @@
+"""
+Fixtures for the API tests: a fresh server module with its data in a
+temporary directory, never the database under api/.
+
+Run from the repository root: python -m pytest api/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """server.py imported with DATA_DIR in `tmp_path`, before init()."""
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setenv("BACKUP_DIR", str(tmp_path / "backups"))
+    sys.modules.pop("server", None)
+    import server
+
+    yield server
+    sys.modules.pop("server", None)
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
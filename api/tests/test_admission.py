@@ -0,0 +1,18 @@
+"""
+Per-client rate limiting of writes is opt-in.
+"""
+
+from admission import RateLimiter
+
+
+def test_writes_are_not_rate_limited_by_default(server):
+    assert all(server.write_limiter.acquire("203.0.113.7") == 0 for _ in range(1000))
+
+
+def test_token_bucket():
+    limiter = RateLimiter(rate=0.5, burst=2)
+    assert limiter.acquire("client", now=0) == 0
+    assert limiter.acquire("client", now=0) == 0
+    assert limiter.acquire("client", now=0) == 2
+    assert limiter.acquire("other", now=0) == 0
+    assert limiter.acquire("client", now=2) == 0
@@ -0,0 +1,27 @@
+"""
+Rotation only counts and deletes the snapshots of its own database.
+"""
+
+import backup
+
+
+def touch(directory, *names):
+    for name in names:
+        (directory / name).write_bytes(b"")
+
+
+def test_rotate_ignores_branches_sharing_a_prefix(tmp_path):
+    touch(
+        tmp_path,
+        "denov_baraka_x-20260101-030000.db", "denov_baraka_x-20260102-030000.db",
+        # Branch "x-y", its archive and a pre-restore copy
+        "denov_baraka_x-y-20260103-030000.db", "denov_baraka_x-y-20260104-030000.db",
+        "denov_baraka_x_archive-20260103-030000.db", "pre-restore-denov_baraka_x-20260103-030000.db",
+    )
+    database = str(tmp_path / "denov_baraka_x.db")
+
+    assert [path.rsplit("/", 1)[1] for path in backup.list_snapshots(str(tmp_path), database)] == [
+        "denov_baraka_x-20260101-030000.db", "denov_baraka_x-20260102-030000.db"
+    ]
+    assert backup.rotate(str(tmp_path), database, keep=1) == [str(tmp_path / "denov_baraka_x-20260101-030000.db")]
+    assert len(backup.list_snapshots(str(tmp_path))) == 5
@@ -0,0 +1,17 @@
+"""
+Branch names cannot name another branch's databases.
+"""
+
+import pytest
+
+from branches import parse_branches
+
+
+def test_branch_names():
+    assert parse_branches("denov, Termiz ,sherobod-2") == ["denov", "termiz", "sherobod-2"]
+
+
+@pytest.mark.parametrize("value", ["denov,archive", "denov,audit", "archive", "denov,x_archive", "denov,denov", ""])
+def test_invalid_branch_names(value):
+    with pytest.raises(ValueError):
+        parse_branches(value)
@@ -0,0 +1,31 @@
+"""
+Versioned caches are filled from committed data only.
+"""
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from cache import VersionedCache, bump_version
+
+
+def test_rolled_back_write_does_not_fill_the_cache(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE cache_versions (name TEXT PRIMARY KEY, version INTEGER)")
+        conn.exec_driver_sql("CREATE TABLE items (name TEXT)")
+    Session = sessionmaker(bind=engine)
+    cache = VersionedCache("items", lambda db: [name for name, in db.execute(text("SELECT name FROM items"))])
+
+    db = Session()
+    db.execute(text("BEGIN IMMEDIATE"))
+    db.execute(text("INSERT INTO items VALUES ('pending')"))
+    bump_version(db, "items")
+    # The batch sees its own write...
+    assert cache.get(db) == ["pending"]
+    db.rollback()
+    db.close()
+
+    # ...but nobody else does once it rolls back
+    db = Session()
+    assert cache.get(db) == []
+    db.close()
@@ -0,0 +1,25 @@
+"""
+The customer directory needs the customers token.
+"""
+
+import pytest
+
+REQUESTS = [
+    ("GET", "/customers/+998901234567"),
+    ("GET", "/customers/+998901234567/orders"),
+    ("POST", "/customers/+998901234567/reorder"),
+]
+
+
+@pytest.mark.parametrize("method, path", REQUESTS)
+def test_disabled_without_a_token(client, method, path):
+    assert client.request(method, path).status_code == 403
+
+
+@pytest.mark.parametrize("method, path", REQUESTS)
+def test_needs_the_token(server, client, monkeypatch, method, path):
+    monkeypatch.setattr(server, "CUSTOMERS_TOKEN", "secret")
+    assert client.request(method, path).status_code == 403
+    assert client.request(method, path, headers={"X-Customers-Token": "wrong"}).status_code == 403
+    # Let through, to a customer who has not ordered yet
+    assert client.request(method, path, headers={"X-Customers-Token": "secret"}).status_code == 404
@@ -0,0 +1,53 @@
+"""
+Byte ranges of uploaded images: an invalid Range header is ignored.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from media import ImageResponse, parse_single_range
+
+
+def get(path, http_range):
+    """(status, Content-Length, Content-Range) of a GET with `http_range`."""
+    response = ImageResponse(str(path), stat_result=os.stat(path))
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"range", http_range.encode())]}
+    messages = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    return messages[0]["status"], headers.get(b"content-length"), headers.get(b"content-range")
+
+
+@pytest.mark.parametrize("http_range, expected", [
+    ("bytes=0-9", (0, 10)),
+    ("bytes=90-", (90, 100)),
+    ("bytes=-5", (95, 100)),
+    ("bytes=5-3", None),
+    ("bytes=-", None),
+    ("items=0-9", None),
+])
+def test_parse_single_range(http_range, expected):
+    assert parse_single_range(http_range, 100) == expected
+
+
+@pytest.mark.parametrize("http_range", ["bytes=100-", "bytes=-0"])
+def test_unsatisfiable_range(http_range):
+    with pytest.raises(ValueError):
+        parse_single_range(http_range, 100)
+
+
+def test_responses(tmp_path):
+    path = tmp_path / "p.jpg"
+    path.write_bytes(bytes(range(100)))
+    assert get(path, "bytes=0-9") == (206, b"10", b"bytes 0-9/100")
+    assert get(path, "bytes=5-3") == (200, b"100", None)
+    assert get(path, "bytes=100-")[0] == 416
@@ -0,0 +1,133 @@
+"""
+A migration that fails halfway leaves the database as it was, and the
+next start migrates it completely.
+"""
+
+import pytest
+from sqlalchemy import create_engine, event
+
+import migrations
+
+
+def database(tmp_path, server):
+    """A current database, its URL and engine."""
+    url = f"sqlite:///{tmp_path / 'migrate.db'}"
+    engine = create_engine(url)
+    migrations.ensure_schema(engine, server.Base.metadata)
+    return url, engine
+
+
+def forget_migrations(conn, since):
+    conn.exec_driver_sql("DELETE FROM schema_migrations WHERE name >= ?", (since,))
+
+
+def fail_on(engine, prefix):
+    """Fail the first statement starting with `prefix`, as if the process died there."""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith(prefix):
+            raise RuntimeError("Interrupted")
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def restart(url, engine, server):
+    engine.dispose()
+    engine = create_engine(url)
+    migrations.migrate(engine, server.Base.metadata)
+    return engine
+
+
+def test_interrupted_integer_money_keeps_the_catalog(tmp_path, server):
+    url, engine = database(tmp_path, server)
+    with engine.begin() as conn:
+        # products as before 0004: price REAL
+        conn.exec_driver_sql("DROP TABLE products")
+        conn.exec_driver_sql(
+            "CREATE TABLE products (id VARCHAR PRIMARY KEY, name VARCHAR, description VARCHAR, price FLOAT, "
+            "category VARCHAR, image VARCHAR, popular BOOLEAN)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO products VALUES ('p1', 'Somsa', 'Go''shtli', 9000.4, 'classic', NULL, 1)"
+        )
+        forget_migrations(conn, "0004")
+
+    fail_on(engine, "INSERT INTO products (")
+    with pytest.raises(RuntimeError):
+        migrations.migrate(engine, server.Base.metadata)
+
+    engine = restart(url, engine, server)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT id, price, typeof(price) FROM products").fetchall() == [
+            ("p1", 9000, "integer")
+        ]
+        assert conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE name = 'products_old'").first() is None
+
+
+def old_order_items(conn):
+    """order_items as before 0003, with the product fields in every line, and one order with two lines."""
+    conn.exec_driver_sql(
+        "INSERT INTO orders (id, total, status, created_at, free_delivery, price_mismatch, version) "
+        "VALUES ('o1', 27000, 'completed', '2026-01-01 12:00:00', 0, 0, 0)"
+    )
+    conn.exec_driver_sql("DROP TABLE order_items")
+    conn.exec_driver_sql(
+        "CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_id VARCHAR, product_id VARCHAR, name VARCHAR, "
+        "description VARCHAR, image VARCHAR, category VARCHAR, price FLOAT, quantity INTEGER)"
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO order_items VALUES "
+        "(1, 'o1', 'p1', 'Somsa', 'Go''shtli', NULL, 'classic', 9000.0, 2), "
+        "(2, 'o1', 'p2', 'Choy', 'Ko''k', NULL, 'drinks', 9000.4, 1)"
+    )
+
+
+def order_lines(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT i.order_id, s.name, i.price, typeof(i.price), i.quantity "
+            "FROM order_items i JOIN product_snapshots s ON s.id = i.snapshot_id ORDER BY s.name, i.order_id"
+        ).fetchall()
+
+
+def test_interrupted_normalize_order_items_keeps_the_lines(tmp_path, server):
+    url, engine = database(tmp_path, server)
+    with engine.begin() as conn:
+        old_order_items(conn)
+        forget_migrations(conn, "0003")
+
+    fail_on(engine, "INSERT INTO order_items (")
+    with pytest.raises(RuntimeError):
+        migrations.migrate(engine, server.Base.metadata)
+
+    engine = restart(url, engine, server)
+    assert order_lines(engine) == [("o1", "Choy", 9000, "integer", 1), ("o1", "Somsa", 9000, "integer", 2)]
+
+
+def test_stranded_order_items_are_finished(tmp_path, server):
+    # As an interrupted run left a database before migrations began their
+    # transactions: lines in order_items_old, 0003 recorded, and a new
+    # order whose line took id 1 since
+    url, engine = database(tmp_path, server)
+    with engine.begin() as conn:
+        old_order_items(conn)
+        conn.exec_driver_sql("ALTER TABLE order_items RENAME TO order_items_old")
+        server.Base.metadata.tables["order_items"].create(conn)
+        conn.exec_driver_sql(
+            "INSERT INTO orders (id, total, status, created_at, free_delivery, price_mismatch, version) "
+            "VALUES ('o2', 9000, 'processing', '2026-02-01 12:00:00', 0, 0, 0)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO product_snapshots (id, fingerprint, product_id, name, description, image, category) "
+            "VALUES (100, 'new', 'p1', 'Somsa', 'Go''shtli', NULL, 'classic')"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO order_items (id, order_id, product_id, snapshot_id, price, quantity) "
+            "VALUES (1, 'o2', 'p1', 100, 9000, 1)"
+        )
+        forget_migrations(conn, "0010")
+
+    engine = restart(url, engine, server)
+    assert order_lines(engine) == [
+        ("o1", "Choy", 9000, "integer", 1), ("o1", "Somsa", 9000, "integer", 2), ("o2", "Somsa", 9000, "integer", 1)
+    ]
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE name = 'order_items_old'").first() is None
@@ -0,0 +1,27 @@
+"""
+Statement timing survives statements that fail.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from profiler import current_profile, instrument_engine
+
+
+def test_failed_statements_leave_nothing_behind(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'profiler.db'}")
+    instrument_engine(engine, slow_query_ms=1000)
+    profile = []
+    token = current_profile.set(profile)
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.exec_driver_sql("SELECT * FROM missing")
+            conn.exec_driver_sql("SELECT 1")
+            info = dict(conn.info)
+    finally:
+        current_profile.reset(token)
+    assert [statement for statement, _ in profile] == ["SELECT 1"]
+    assert info == {}
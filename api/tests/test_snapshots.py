@@ -0,0 +1,55 @@
+"""
+Order lines keep the product version they were ordered at, even after
+an order that inserted a snapshot was rolled back.
+"""
+
+
+def add_product(client, name, category):
+    response = client.post(
+        "/products", data={"name": name, "description": name, "price": 10000, "category": category}
+    )
+    assert response.status_code == 201
+    return next(product for product in client.get("/products").json() if product["name"] == name)
+
+
+def order_payload(order_id, *products):
+    items = [
+        {key: product[key] for key in ("id", "name", "price", "description", "image", "category")} | {"quantity": 1}
+        for product in products
+    ]
+    return {
+        "id": order_id,
+        "items": items,
+        "customer": {"name": "Test", "phone": "+998901234567", "address": "Denov"},
+        "total": sum(item["price"] for item in items),
+        "status": "processing",
+        "createdAt": "2026-01-01T12:00:00",
+        "freeDelivery": False,
+    }
+
+
+def test_rolled_back_snapshot_is_not_reused(server, client):
+    p = add_product(client, "Somsa", "classic")
+    q = add_product(client, "Choy", "drinks")
+    assert client.post("/orders", json=order_payload("1001", p)).status_code == 200
+
+    # A new version of P, inserted by an order that fails (duplicate id)
+    # and is rolled back; two lines of it, so the second one finds it
+    assert client.put(f"/products/{p['id']}", data={"name": "Somsa tandir"}).status_code == 200
+    p = next(product for product in client.get("/products").json() if product["id"] == p["id"])
+    assert client.post("/orders", json=order_payload("1001", p, p)).status_code >= 400
+
+    # Q's new version may now take the rolled-back snapshot's id
+    assert client.put(f"/products/{q['id']}", data={"name": "Choy green"}).status_code == 200
+    q = next(product for product in client.get("/products").json() if product["id"] == q["id"])
+    assert client.post("/orders", json=order_payload("1002", q)).status_code == 200
+
+    assert client.post("/orders", json=order_payload("1003", p)).status_code == 200
+    db = server.SessionLocal()
+    try:
+        item = db.query(server.OrderItemModel).filter(server.OrderItemModel.order_id == "1003").one()
+        snapshot_id = item.snapshot_id
+        snapshot = db.query(server.ProductSnapshotModel).filter(server.ProductSnapshotModel.id == snapshot_id).one()
+    finally:
+        db.close()
+    assert (snapshot.product_id, snapshot.name, snapshot.category) == (p["id"], "Somsa tandir", "classic")
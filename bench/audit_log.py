@@ -0,0 +1,169 @@
+"""
+Size and cost of the audit log
+
+Storage: writes --events synthetic changes (status changes of orders,
+ratings, product edits) into a scratch audit database, once per segment
+size in --segment-events, and reports bytes per event next to the same
+events as plain JSON lines.
+
+Cost: fills the benchmark database with --orders orders and, in process,
+times buffering one event (what a request pays), PUT /orders/{id} status
+changes, and GET /audit/orders/{id}?at= reconstructions in a log that
+holds the --events changes as well.
+
+Usage:
+    python bench/audit_log.py [--events 100000] [--segment-events 1 10 100 500] [--orders 10000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from common import DEFAULT_WORKDIR, load_server, percentile
+from datagen import generate
+
+import audit
+
+STATUS_PATH = (("processing", "delivering"), ("delivering", "completed"))
+
+
+def synthetic_events(rng, count, start):
+    """(entity, id, action, changes, actor, at) of a shop's day-to-day changes."""
+    at = start
+    products = [f"p{index:07x}" for index in range(40)]
+    for index in range(count):
+        at += timedelta(seconds=rng.expovariate(1 / 20))
+        actor = f"telegram:{rng.choice((5846982343, 6012345678, 7123456789))}"
+        kind = rng.random()
+        if kind < 0.9:
+            order_id = f"order-{index // 2}"
+            before, after = STATUS_PATH[index % 2]
+            version = index % 2
+            yield "order", order_id, "status", {"status": [before, after], "version": [version, version + 1]}, actor, at
+        elif kind < 0.95:
+            yield "order", f"order-{rng.randrange(index + 1)}", "rating", {"rating": [None, rng.randint(1, 5)]}, actor, at
+        else:
+            price = rng.randrange(5, 40) * 1000
+            changes = {"price": [price, price + 1000]}
+            if rng.random() < 0.3:
+                changes["popular"] = [False, True]
+            yield "product", rng.choice(products), "update", changes, actor, at
+
+
+def fill(log, events, segment_events):
+    for index, (entity, entity_id, action, changes, actor, at) in enumerate(events, 1):
+        log.record(entity, entity_id, action, changes, actor, at)
+        if index % segment_events == 0:
+            log.flush()
+    log.flush()
+
+
+def measure_storage(args, workdir):
+    start = datetime(2026, 1, 1)
+    events = list(synthetic_events(random.Random(args.seed), args.events, start))
+    raw = sum(
+        len(json.dumps({"at": at.isoformat(), "actor": actor, "entity": entity, "id": entity_id,
+                        "action": action, "changes": changes})) + 1
+        for entity, entity_id, action, changes, actor, at in events
+    )
+    print(f"Audit log of {args.events} changes, plain JSON lines: {raw / args.events:6.1f} bytes/event")
+    for segment_events in args.segment_events:
+        path = os.path.join(workdir, f"audit-{segment_events}.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        log = audit.AuditLog(f"sqlite:///{path}", flush_interval=3600, segment_events=10 ** 9)
+        began = time.perf_counter()
+        fill(log, events, segment_events)
+        seconds = time.perf_counter() - began
+        size = log.size()
+        log.close()
+        file_size = os.path.getsize(path)
+        print(
+            f"  {segment_events:4} events/segment: {size['bytes'] / args.events:6.1f} bytes/event compressed, "
+            f"{file_size / args.events:6.1f} with indexes, written at {args.events / seconds:8.0f} events/s"
+        )
+
+
+async def measure_cost(server, args):
+    catalog = generate(server, orders=args.orders, seed=args.seed)
+    log = server.audit_logs[server.engine]
+    # History for the reconstructions to look through
+    fill(log, synthetic_events(random.Random(args.seed), args.events, datetime(2026, 1, 1)), 500)
+
+    timings = []
+    for index in range(10000):
+        began = time.perf_counter()
+        log.record("order", f"bench-{index}", "rating", {"rating": [None, 5]}, "bench")
+        timings.append((time.perf_counter() - began) * 1e6)
+    log.flush()
+    timings.sort()
+    print(f"Buffering one event: p50 {percentile(timings, 0.5):5.1f} us  p99 {percentile(timings, 0.99):5.1f} us")
+
+    db = server.SessionLocal()
+    try:
+        order_ids = [
+            order_id for (order_id,) in
+            db.query(server.OrderModel.id).filter(server.OrderModel.status == "processing").limit(args.requests)
+        ]
+    finally:
+        db.close()
+
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app),
+        base_url="http://bench",
+        headers={"X-Audit-Token": server.AUDIT_TOKEN, "X-Actor": "telegram:1"},
+        timeout=30
+    )
+    async with client:
+        # Every order below was still processing then
+        before = server.utcnow().isoformat()
+        changes = []
+        for order_id in order_ids:
+            began = time.perf_counter()
+            (await client.put(f"/orders/{order_id}", params={"status": "delivering"})).raise_for_status()
+            changes.append((time.perf_counter() - began) * 1000)
+        changes.sort()
+        print(
+            f"PUT /orders/{{id}} status change: p50 {percentile(changes, 0.5):6.2f} ms  "
+            f"p99 {percentile(changes, 0.99):6.2f} ms"
+        )
+
+        lookups = []
+        for order_id in order_ids:
+            began = time.perf_counter()
+            response = await client.get(f"/audit/orders/{order_id}", params={"at": before})
+            lookups.append((time.perf_counter() - began) * 1000)
+            response.raise_for_status()
+            assert response.json()["order"]["status"] == "processing"
+        lookups.sort()
+        print(
+            f"GET /audit/orders/{{id}}?at= with {args.events} events logged: "
+            f"p50 {percentile(lookups, 0.5):6.2f} ms  p99 {percentile(lookups, 0.99):6.2f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the audit log's size and cost")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--segment-events", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AUDIT_TOKEN", "bench")
+    server = load_server(args.workdir)
+    measure_storage(args, os.path.abspath(args.workdir))
+    asyncio.run(measure_cost(server, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Order latency while an online backup runs
+
+Fills the benchmark database with orders, pads it to --size-mb with a
+filler table, then times POST /orders from concurrent clients in
+process: first with nothing else running, then while backup.py copies
+the database in a background thread.
+
+Usage:
+    python bench/backup_impact.py [--size-mb 1024] [--orders 100000] [--clients 8]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+import httpx
+
+from common import DB_NAME, DEFAULT_WORKDIR, load_server, percentile
+from datagen import generate, make_order_payload
+
+FILLER_ROW = 64 * 1024
+
+
+def pad(database, size_mb):
+    """Grow `database` to about `size_mb` with a table of random blobs."""
+    conn = sqlite3.connect(database)
+    conn.execute("DROP TABLE IF EXISTS bench_filler")
+    conn.execute("CREATE TABLE bench_filler (id INTEGER PRIMARY KEY, data BLOB)")
+    missing = size_mb * 1024 * 1024 - os.path.getsize(database)
+    rows = max(missing // FILLER_ROW, 0)
+    with conn:
+        conn.executemany(
+            "INSERT INTO bench_filler (data) VALUES (?)",
+            ((os.urandom(FILLER_ROW),) for _ in range(rows))
+        )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+async def post_orders(client, catalog, seconds, clients, seed):
+    """POST /orders from `clients` concurrent clients for `seconds`; latencies in ms."""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            payload = make_order_payload(rng, catalog, f"b{seed}-{index}-{len(latencies)}-{rng.random()}")
+            start = time.perf_counter()
+            response = await client.post("/orders", json=payload)
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker(index) for index in range(clients)))
+    latencies.sort()
+    return latencies
+
+
+def report(name, latencies, seconds):
+    print(
+        f"{name:<20} {len(latencies) / seconds:8.1f} {percentile(latencies, 0.5):8.2f} "
+        f"{percentile(latencies, 0.95):8.2f} {percentile(latencies, 0.99):8.2f} {latencies[-1]:8.2f}"
+    )
+
+
+async def main_async(args):
+    import backup
+
+    server = load_server(args.workdir)
+    catalog = generate(server, orders=args.orders, seed=args.seed)
+    pad(DB_NAME, args.size_mb)
+    print(f"Database: {os.path.getsize(DB_NAME) / 1024 / 1024:.0f} MB")
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=60)
+    target = os.path.join(args.workdir, "backups")
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+
+    print(f"{'phase':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    report("baseline", await post_orders(client, catalog, args.seconds, args.clients, 1), args.seconds)
+
+    done = threading.Event()
+    result = []
+
+    def run_backup():
+        result.append(backup.backup(DB_NAME, os.path.join(target, backup.snapshot_name(DB_NAME))))
+        done.set()
+
+    thread = threading.Thread(target=run_backup)
+    thread.start()
+    start = time.perf_counter()
+    latencies = []
+    rounds = 0
+    while not done.is_set():
+        latencies.extend(await post_orders(client, catalog, 1.0, args.clients, 2 + rounds))
+        rounds += 1
+    thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    report("during backup", latencies, elapsed)
+
+    copy = result[0]
+    print(f"Backup: {copy.pages} pages in {copy.seconds:.1f}s, {os.path.getsize(copy.path) / 1024 / 1024:.0f} MB")
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order latency during an online backup")
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the baseline phase")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Replay harness for the Telegram bot
+
+Feeds recorded or synthetic updates into the Dispatcher of telegram_bot.py
+at a controlled rate, with the bot talking to a local fake Bot API
+(fake_bot_api.py) and the real REST API running in-process on a scratch
+database. Reports handler latency, outbound Bot API calls per update,
+the bot's REST API cache (hit rates and calls saved; --no-cache turns it
+off) and peak Python memory, so bot performance can be worked on offline.
+
+Scenarios:
+    orders     orders arriving as JSON messages from the web app
+    callbacks  a flood of status-button presses from admins
+    status     customers asking /status <id>
+    mixed      all of the above
+    closing    an admin tapping "complete" on every delivering order
+    closing-bulk  the same done with one "complete all delivering" action
+    panel      admins opening orders, products and stats in the admin panel
+
+Usage:
+    python bench/bot_replay.py --scenario callbacks --updates 500 --rate 100
+    python bench/bot_replay.py --record updates.ndjson --updates 200
+    python bench/bot_replay.py --updates-file updates.ndjson
+    python bench/bot_replay.py --api-url http://127.0.0.1:8000
+    python bench/bot_replay.py --scenario closing-bulk --orders 1000
+    python bench/bot_replay.py --scenario panel --no-cache
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+from common import BENCH_DIR, DEFAULT_WORKDIR, free_port, load_server, percentile
+from datagen import generate, make_order_payload
+from fake_bot_api import FakeBotAPI
+
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+CUSTOMER_ID = 700000001
+
+
+def start_api(workdir, orders):
+    """Run the REST API on a fresh scratch database in a background thread."""
+    import uvicorn
+
+    server = load_server(workdir)
+    catalog = generate(server, orders=orders)
+    db = server.SessionLocal()
+    try:
+        order_ids = [row[0] for row in db.query(server.OrderModel.id).limit(1000)]
+        delivering_ids = [
+            row[0] for row in db.query(server.OrderModel.id).filter(server.OrderModel.status == "delivering")
+        ]
+    finally:
+        db.close()
+
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=free_port(), log_level="warning")
+    api_server = uvicorn.Server(config)
+    threading.Thread(target=api_server.run, daemon=True).start()
+    while not api_server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{config.port}", catalog, order_ids, delivering_ids
+
+
+class UpdateFactory:
+    """Builds raw Telegram update dicts like the ones the bot receives."""
+
+    def __init__(self, catalog, order_ids, admin_id, channel_id, branch, seed=1, delivering_ids=()):
+        self.catalog = catalog
+        self.branch = branch
+        self.order_ids = list(order_ids)
+        self.delivering_ids = list(delivering_ids)
+        self.admin_id = admin_id
+        self.channel_id = int(channel_id)
+        self.rng = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+    def _message(self, chat_id, user_id, text, chat_type="private"):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Replay"},
+            "text": text,
+        }
+
+    def order(self):
+        payload = make_order_payload(self.rng, self.catalog, f"replay-{next(self.update_ids)}")
+        del payload["status"]
+        self.order_ids.append(payload["id"])
+        message = self._message(CUSTOMER_ID, CUSTOMER_ID, json.dumps(payload))
+        return {"update_id": next(self.update_ids), "message": message}
+
+    def _callback(self, message, data):
+        return {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.update_ids)),
+                "from": {"id": self.admin_id, "is_bot": False, "first_name": "Admin"},
+                "chat_instance": "replay",
+                "message": message,
+                "data": data,
+            },
+        }
+
+    def callback(self):
+        order_id = self.rng.choice(self.order_ids)
+        action = self.rng.choice(["deliver", "complete", "cancel"])
+        message = self._message(self.channel_id, self.admin_id, "Buyurtma", chat_type="supergroup")
+        return self._callback(message, f"{action}_{self.branch}_{order_id}")
+
+    def closing(self):
+        """Taps "complete" under the channel message of the next delivering order."""
+        order_id = self.delivering_ids.pop(0)
+        message = self._message(self.channel_id, self.admin_id, "Buyurtma", chat_type="supergroup")
+        return self._callback(message, f"complete_{self.branch}_{order_id}")
+
+    def closing_bulk(self):
+        """Confirms "complete all delivering" in the admin's chat with the bot."""
+        message = self._message(self.admin_id, self.admin_id, "Ommaviy amallar")
+        return self._callback(message, f"bulkok_complete_{self.branch}")
+
+    def panel(self):
+        """An admin opening one of the lists in the admin panel."""
+        message = self._message(self.admin_id, self.admin_id, "Administrator paneli")
+        action = self.rng.choice(["orders", "products", "stats"])
+        return self._callback(message, f"admin_{action}_{self.branch}")
+
+    def status(self):
+        order_id = self.rng.choice(self.order_ids)
+        message = self._message(CUSTOMER_ID, CUSTOMER_ID, f"/status {order_id}")
+        return {"update_id": next(self.update_ids), "message": message}
+
+    def make(self, scenario, count):
+        kinds = {
+            "orders": [self.order],
+            "callbacks": [self.callback],
+            "status": [self.status],
+            "mixed": [self.order, self.callback, self.callback, self.status],
+            "closing": [self.closing],
+            "closing-bulk": [self.closing_bulk],
+            "panel": [self.panel],
+        }[scenario]
+        return [self.rng.choice(kinds)() for _ in range(count)]
+
+
+async def replay(dp, bot, updates, rate):
+    """Feed `updates` at `rate` per second, each in its own task like polling does."""
+    from aiogram import types
+
+    latencies = []
+    lags = []
+    errors = 0
+    start = time.perf_counter()
+
+    async def feed(index, raw):
+        nonlocal errors
+        scheduled = start + index / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        began = time.perf_counter()
+        lags.append(began - scheduled)
+        try:
+            update = types.Update.model_validate(raw, context={"bot": bot})
+            await dp.feed_update(bot, update)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - began)
+
+    await asyncio.gather(*(feed(index, raw) for index, raw in enumerate(updates)))
+    elapsed = time.perf_counter() - start
+    return latencies, lags, errors, elapsed
+
+
+async def main_async(args):
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    import telegram_bot
+
+    if args.api_url:
+        api_url, catalog, order_ids, delivering_ids = args.api_url, None, [], []
+    else:
+        api_url, catalog, order_ids, delivering_ids = start_api(args.workdir, args.orders)
+    telegram_bot.API_URL = api_url
+    telegram_bot.api_cache.enabled = not args.no_cache
+    if catalog is None:
+        import requests
+        catalog = requests.get(f"{api_url}/products").json()
+        orders = requests.get(f"{api_url}/orders").json()
+        order_ids = [order["id"] for order in orders[:1000]]
+        delivering_ids = [order["id"] for order in orders if order["status"] == "delivering"]
+
+    if args.updates_file:
+        with open(args.updates_file) as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        branch = telegram_bot.DEFAULT_BRANCH
+        factory = UpdateFactory(
+            catalog, order_ids, telegram_bot.BRANCH_ADMINS[branch][0], telegram_bot.BRANCH_CHANNELS[branch],
+            branch=branch, seed=args.seed, delivering_ids=delivering_ids
+        )
+        count = {"closing": len(delivering_ids), "closing-bulk": 1}.get(args.scenario, args.updates)
+        updates = factory.make(args.scenario, count)
+        if args.scenario == "closing-bulk":
+            # Every delivering order was posted to the channel when it came in
+            for message_id, order_id in enumerate(delivering_ids, start=1):
+                telegram_bot.remember_order_message(branch, order_id, int(factory.channel_id), message_id)
+    if args.record:
+        with open(args.record, "w") as f:
+            for update in updates:
+                f.write(json.dumps(update) + "\n")
+
+    fake_api = FakeBotAPI(latency_ms=args.latency_ms)
+    fake_url = await fake_api.start()
+    bot = Bot(
+        token=telegram_bot.BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(fake_url)),
+    )
+    telegram_bot.bot = bot
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(telegram_bot.router)
+
+    # The fake Bot API has no flood limits; report what Telegram would take instead
+    queued_edits = 0
+    paced = (telegram_bot.EditQueue.GROUP_INTERVAL, telegram_bot.EditQueue.CHAT_INTERVAL)
+    telegram_bot.edit_queue.GROUP_INTERVAL = telegram_bot.edit_queue.CHAT_INTERVAL = 0
+    telegram_bot.edit_queue.GLOBAL_INTERVAL = 0
+
+    tracemalloc.start()
+    try:
+        latencies, lags, errors, elapsed = await replay(dp, bot, updates, args.rate)
+        queued_edits = len(telegram_bot.edit_queue)
+        drain_start = time.perf_counter()
+        await telegram_bot.edit_queue.join()
+        drained = time.perf_counter() - drain_start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        await bot.session.close()
+        await fake_api.stop()
+
+    latencies.sort()
+    lags.sort()
+    calls = sum(fake_api.calls.values())
+    print(f"updates:        {len(updates)} in {elapsed:.2f}s ({len(updates) / elapsed:.1f}/s, target {args.rate}/s)")
+    print(f"errors:         {errors}")
+    print(
+        f"handler ms:     p50 {percentile(latencies, 0.5) * 1000:.2f}  "
+        f"p95 {percentile(latencies, 0.95) * 1000:.2f}  p99 {percentile(latencies, 0.99) * 1000:.2f}"
+    )
+    print(f"start lag ms:   p50 {percentile(lags, 0.5) * 1000:.2f}  max {lags[-1] * 1000:.2f}")
+    print(f"Bot API calls:  {calls} ({calls / len(updates):.2f} per update)")
+    for method, count in fake_api.calls.most_common():
+        print(f"  {method:<22} {count:>6} ({count / len(updates):.2f} per update)")
+    if queued_edits:
+        print(
+            f"queued edits:   {queued_edits}, sent in {drained:.2f}s here, "
+            f"about {queued_edits * paced[0]:.0f}s in a Telegram group (background)"
+        )
+    print("REST API cache:" + (" off" if args.no_cache else ""))
+    for line in telegram_bot.api_cache.report():
+        print(f"  {line}")
+    print(f"peak memory:    {peak / 1024 / 1024:.1f} MB (tracemalloc)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Telegram updates into the bot offline")
+    parser.add_argument(
+        "--scenario", choices=["orders", "callbacks", "status", "mixed", "closing", "closing-bulk", "panel"],
+        default="mixed"
+    )
+    parser.add_argument("--updates", type=int, default=200, help="number of synthetic updates")
+    parser.add_argument("--updates-file", help="replay recorded updates (NDJSON) instead")
+    parser.add_argument("--record", help="write the replayed updates to this NDJSON file")
+    parser.add_argument("--rate", type=float, default=50, help="updates per second")
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated Bot API round trip")
+    parser.add_argument("--api-url", help="use a running REST API instead of an in-process one")
+    parser.add_argument("--no-cache", action="store_true", help="fetch every API response the bot needs")
+    parser.add_argument("--orders", type=int, default=200, help="orders in the scratch database")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Shared helpers for the benchmark suite
+
+Benchmarks point the API's DATA_DIR at a scratch work directory
+(bench/.work by default) and run inside it, so they never touch the
+database under api/.
+"""
+
+import os
+import socket
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BENCH_DIR), "api")
+DEFAULT_WORKDIR = os.path.join(BENCH_DIR, ".work")
+DB_NAME = "denov_baraka.db"
+
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+def enter_workdir(workdir=DEFAULT_WORKDIR):
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    return workdir
+
+
+def load_server(workdir=DEFAULT_WORKDIR):
+    """Import the API module with `workdir` as its data directory, and open its databases."""
+    workdir = os.path.abspath(enter_workdir(workdir))
+    # Always: a DATA_DIR from the environment could be the real one
+    os.environ["DATA_DIR"] = workdir
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["BACKUP_DIR"] = os.path.join(workdir, "backups")
+    # Keep slow-query logging (and its EXPLAIN) out of the measurements
+    os.environ.setdefault("SLOW_QUERY_MS", "10000")
+    import server
+    server.init()
+    return server
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,104 @@
+"""
+Customer lookups as the number of orders grows
+
+For each --orders size, fills the benchmark database and times, in
+process, for random customers: GET /customers/{phone},
+GET /customers/{phone}/orders and POST /customers/{phone}/reorder. For
+comparison it also times finding a customer's orders without the
+directory, by phone in the per-order customers table, which is a scan.
+Times that stay flat from 10k to 1M orders are index lookups.
+
+Usage:
+    python bench/customer_lookup.py [--orders 10000 100000 1000000] [--requests 200]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from common import DEFAULT_WORKDIR, load_server, percentile
+from datagen import generate
+
+
+async def time_requests(client, method, paths, **kwargs):
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    latencies.sort()
+    return latencies
+
+
+def time_scan(server, phones):
+    """The customer's orders found by the phone typed in each order."""
+    latencies = []
+    with server.engine.connect() as conn:
+        for phone in phones:
+            start = time.perf_counter()
+            conn.exec_driver_sql(
+                "SELECT o.id FROM customers c JOIN orders o ON o.id = c.order_id "
+                "WHERE c.phone = ? ORDER BY o.created_at DESC LIMIT 20",
+                (phone,)
+            ).fetchall()
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies
+
+
+def report(orders, name, latencies):
+    print(
+        f"{orders:>9} {name:<34} {percentile(latencies, 0.5):8.2f} "
+        f"{percentile(latencies, 0.95):8.2f} {percentile(latencies, 0.99):8.2f}"
+    )
+
+
+async def main_async(args):
+    server = load_server(args.workdir)
+    server.CUSTOMERS_TOKEN = "bench"
+    rng = random.Random(args.seed)
+
+    print(f"{'orders':>9} {'request':<34} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for orders in args.orders:
+        generate(server, orders=orders, products=args.products, seed=args.seed)
+        with server.engine.connect() as conn:
+            directory = conn.exec_driver_sql("SELECT phone FROM customer_directory").fetchall()
+            typed = [phone for phone, in conn.exec_driver_sql("SELECT DISTINCT phone FROM customers")]
+        phones = [phone for phone, in rng.sample(directory, min(args.requests, len(directory)))]
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=server.app),
+            base_url="http://bench",
+            headers={"X-Customers-Token": server.CUSTOMERS_TOKEN},
+            timeout=30
+        )
+        async with client:
+            report(orders, "GET /customers/{phone}", await time_requests(
+                client, "GET", [f"/customers/{phone}" for phone in phones]
+            ))
+            report(orders, "GET /customers/{phone}/orders", await time_requests(
+                client, "GET", [f"/customers/{phone}/orders" for phone in phones]
+            ))
+            report(orders, "POST /customers/{phone}/reorder", await time_requests(
+                client, "POST", [f"/customers/{phone}/reorder" for phone in phones]
+            ))
+        report(orders, "orders by typed phone (scan)", time_scan(server, rng.sample(typed, len(phones))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure customer lookups at growing order counts")
+    parser.add_argument("--orders", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=200, help="customers looked up per size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Seeded synthetic data generator for the somsa shop
+
+Fills a benchmark database with products, orders, customers and order
+items at a configurable scale. The same seed always produces the same
+data, so benchmark runs are comparable.
+
+Usage:
+    python bench/datagen.py --orders 100000 [--products 40] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import DB_NAME, DEFAULT_WORKDIR, load_server
+from customers import normalize_phone
+from snapshots import fingerprint
+
+CATEGORIES = ["classic", "meat", "vegetable", "special", "shashlik"]
+
+BASE_NAMES = {
+    "classic": ["Klassik somsa", "Tandir somsa", "Qatlama somsa"],
+    "meat": ["Kosa somsa", "Go'shtli somsa", "Qo'y go'shtli somsa"],
+    "vegetable": ["Kartoshkali somsa", "Qovoqli somsa", "Ko'katli somsa"],
+    "special": ["Maxsus somsa", "Pishloqli somsa", "Tovuqli somsa"],
+    "shashlik": ["Shashlik", "Tovuq shashlik", "Jigar shashlik"],
+}
+
+DESCRIPTIONS = [
+    "Mol go'shti, piyoz va ziravorlar bilan an'anaviy somsa",
+    "Mol go'shti va aromatik ziravorlar bilan suvli somsa",
+    "O'zgacha uslubdagi somsa, ichida mol go'shti, bedana tuxumi va ziravorlar bor",
+    "Tovuq go'shtli va sabzavotli shashlik",
+]
+
+FIRST_NAMES = ["Asliddin", "Bekhruz", "Dilnoza", "Sardor", "Malika", "Jasur", "Nodira", "Otabek", "Zarina", "Aziz"]
+LAST_NAMES = ["Bozorov", "Karimov", "Rahimova", "Tursunov", "Yusupova", "Aliyev", "Ergasheva", "Nazarov"]
+STREETS = ["Mustaqillik", "Navoiy", "Amir Temur", "Bobur", "Ulug'bek", "Sharq", "Bog'ishamol"]
+
+# Order status mix of a shop that has been running for a while
+STATUS_WEIGHTS = [("completed", 80), ("cancelled", 6), ("processing", 8), ("delivering", 6)]
+
+# Relative order volume per hour of the day, peaking at lunch
+HOURLY_WEIGHTS = [0, 0, 0, 0, 0, 0, 1, 2, 4, 5, 7, 14, 20, 16, 8, 5, 5, 7, 9, 8, 5, 3, 1, 0]
+
+
+def make_products(rng, count):
+    products = []
+    for index in range(count):
+        category = CATEGORIES[index % len(CATEGORIES)]
+        base = rng.choice(BASE_NAMES[category])
+        size = rng.choice(["katta", "kichkina", "o'rta"])
+        products.append({
+            "id": f"p{index:07d}",
+            "name": f"{base} ({size}) #{index}",
+            "description": rng.choice(DESCRIPTIONS),
+            "price": rng.randrange(8, 60) * 1000,
+            "category": category,
+            "image": f"/uploads/p{index:07d}.jpg",
+            "popular": rng.random() < 0.2,
+        })
+    return products
+
+
+def make_customer(rng):
+    return {
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "phone": f"9{rng.randrange(10, 99)}{rng.randrange(1000000, 9999999)}",
+        "address": f"Surxondaryo, Denov, {rng.choice(STREETS)} ko'chasi {rng.randrange(1, 200)}",
+    }
+
+
+def make_order_payload(rng, products, order_id, created_at=None, status="processing"):
+    """An order in the API's wire format, as the web app posts it."""
+    # Popular products sell far more often
+    weights = [5 if product["popular"] else 1 for product in products]
+    lines = {}
+    for product in rng.choices(products, weights=weights, k=rng.randint(1, 4)):
+        lines[product["id"]] = product
+    items = [
+        {
+            "id": product["id"],
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": rng.randint(1, 6),
+            "description": product["description"],
+            "image": product["image"],
+            "category": product["category"],
+        }
+        for product in lines.values()
+    ]
+    total = sum(item["price"] * item["quantity"] for item in items)
+    return {
+        "id": order_id,
+        "items": items,
+        "customer": make_customer(rng),
+        "total": total,
+        "status": status,
+        "createdAt": (created_at or datetime.now()).isoformat(),
+        "freeDelivery": total >= 100000,
+    }
+
+
+def random_created_at(rng, start, days):
+    day = start + timedelta(days=rng.randrange(days))
+    hour = rng.choices(range(24), weights=HOURLY_WEIGHTS)[0]
+    return day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+
+
+def generate(server, orders=1000, products=40, seed=1, days=365, batch_size=5000):
+    """Replace the contents of the server's database with synthetic data."""
+    rng = random.Random(seed)
+    catalog = make_products(rng, products)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    statuses, status_weights = zip(*STATUS_WEIGHTS)
+
+    db = server.SessionLocal()
+    try:
+        for model in (
+            server.OrderItemModel, server.CustomerInfoModel, server.OrderModel, server.CustomerModel,
+            server.ProductSnapshotModel, server.ProductModel
+        ):
+            db.query(model).delete()
+        db.execute(server.ProductModel.__table__.insert(), catalog)
+
+        # Products never change here, so each has exactly one snapshot
+        snapshot_ids = {}
+        for index, product in enumerate(catalog, start=1):
+            fields = [product[name] for name in ("id", "name", "description", "image", "category")]
+            db.execute(
+                server.ProductSnapshotModel.__table__.insert(),
+                dict(zip(("product_id", "name", "description", "image", "category"), fields),
+                     id=index, fingerprint=fingerprint(*fields))
+            )
+            snapshot_ids[product["id"]] = index
+
+        # Regulars: about four orders per customer, one per phone number. A
+        # separate generator keeps the orders themselves the same as before
+        customer_rng = random.Random(seed + 1)
+        regulars = list({
+            normalize_phone(customer["phone"]): customer
+            for customer in (make_customer(customer_rng) for _ in range(max(orders // 4, 1)))
+        }.values())
+        # Directory row of each regular: [orders, last order id, last order time]
+        directory = [[0, None, None] for _ in regulars]
+
+        order_rows, customer_rows, item_rows = [], [], []
+        for index in range(orders):
+            payload = make_order_payload(
+                rng, catalog, f"{1700000000000 + index}",
+                created_at=random_created_at(rng, start, days),
+                status=rng.choices(statuses, weights=status_weights)[0]
+            )
+            regular = customer_rng.randrange(len(regulars))
+            order_rows.append({
+                "id": payload["id"],
+                "total": payload["total"],
+                "status": payload["status"],
+                "created_at": datetime.fromisoformat(payload["createdAt"]),
+                "placed_at": datetime.fromisoformat(payload["createdAt"]),
+                "free_delivery": payload["freeDelivery"],
+                "rating": rng.choice([None, None, None, 4, 5]),
+                "customer_id": regular + 1,
+            })
+            customer_rows.append(dict(regulars[regular], order_id=payload["id"]))
+            entry = directory[regular]
+            entry[0] += 1
+            if entry[2] is None or order_rows[-1]["created_at"] > entry[2]:
+                entry[1], entry[2] = payload["id"], order_rows[-1]["created_at"]
+            item_rows.extend(
+                {
+                    "order_id": payload["id"],
+                    "product_id": item["id"],
+                    "snapshot_id": snapshot_ids[item["id"]],
+                    "price": item["price"],
+                    "quantity": item["quantity"],
+                }
+                for item in payload["items"]
+            )
+
+            if len(order_rows) >= batch_size or index == orders - 1:
+                db.execute(server.OrderModel.__table__.insert(), order_rows)
+                db.execute(server.CustomerInfoModel.__table__.insert(), customer_rows)
+                db.execute(server.OrderItemModel.__table__.insert(), item_rows)
+                order_rows, customer_rows, item_rows = [], [], []
+
+        customer_directory = [
+            {
+                "id": index + 1,
+                "phone": normalize_phone(customer["phone"]),
+                "name": customer["name"],
+                "address": customer["address"],
+                "order_count": count,
+                "last_order_id": last_order_id,
+                "last_order_at": last_order_at,
+            }
+            for index, (customer, (count, last_order_id, last_order_at)) in enumerate(zip(regulars, directory))
+            if count
+        ]
+        if customer_directory:
+            db.execute(server.CustomerModel.__table__.insert(), customer_directory)
+
+        server.products_cache.invalidate(db)
+        server.stats_cache.invalidate(db)
+        db.commit()
+    finally:
+        db.close()
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the benchmark database with synthetic somsa-shop data")
+    parser.add_argument("--orders", type=int, default=1000, help="number of orders (1k to 1M)")
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--days", type=int, default=365, help="spread orders over this many days")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+
+    server = load_server(args.workdir)
+    start = time.perf_counter()
+    generate(server, orders=args.orders, products=args.products, seed=args.seed, days=args.days)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(DB_NAME) / 1024 / 1024
+    print(f"Generated {args.orders} orders and {args.products} products in {elapsed:.1f}s ({size:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Local stand-in for the Telegram Bot API
+
+An aiohttp server answering `/bot<token>/<method>` like api.telegram.org
+does, with just enough of a result for aiogram to parse. It counts every
+call per method and can add an artificial delay to mimic the round trip
+to Telegram. Point a bot at it with:
+
+    Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+
+Usage (standalone):
+    python bench/fake_bot_api.py [--port 8081] [--latency-ms 0]
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.calls = Counter()
+        self.message_ids = itertools.count(1000)
+        self.runner = None
+        self.url = None
+
+    def _message(self, params, **extra):
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message = {
+            "message_id": int(params.get("message_id") or next(self.message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if str(chat_id).startswith("-") else "private"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        message.update(extra)
+        return message
+
+    def result(self, method: str, params):
+        method = method.lower()
+        if method in ("sendmessage", "editmessagetext"):
+            return self._message(params)
+        if method == "sendphoto":
+            photo = {"file_id": "photo", "file_unique_id": "photo", "width": 800, "height": 600}
+            return self._message(params, photo=[photo], caption=params.get("caption"))
+        if method == "getfile":
+            file_id = params.get("file_id", "file")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_path": f"photos/{file_id}.jpg"}
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+        return True
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    async def handle_file(self, request):
+        self.calls["file"] += 1
+        return web.Response(body=b"\xff\xd8\xff" + b"\0" * 20000, content_type="image/jpeg")
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+async def serve(port, latency_ms):
+    api = FakeBotAPI(latency_ms)
+    url = await api.start(port=port)
+    print(f"Fake Bot API listening on {url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.latency_ms))
@@ -0,0 +1,180 @@
+"""
+Accuracy and cost of the kitchen's delivery estimates
+
+Accuracy: simulates --days of a kitchen that works through orders one at
+a time, where each product takes its own time per item, lunch has more
+staff and evening deliveries are slower. Statuses change as the
+simulated kitchen and couriers finish, feeding kitchen.py's statistics,
+and every new order gets an estimate from the queue at that moment. The
+error against the simulated arrival is reported after the first day,
+next to the error of the built-in defaults alone.
+
+Cost: fills the benchmark database with --orders orders of history, adds
+--active orders placed now, and times GET /orders/{id} (with its ETA)
+in process, both with the kitchen queue cached and right after a status
+change, when the worker rebuilds it.
+
+Usage:
+    python bench/kitchen_eta.py [--days 14] [--orders-per-day 120] [--orders 100000] [--active 40]
+"""
+
+import argparse
+import asyncio
+import heapq
+import random
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from common import DEFAULT_WORKDIR, load_server, percentile
+from datagen import HOURLY_WEIGHTS, generate, make_order_payload, make_products
+
+import kitchen
+
+# Simulated kitchen seconds per item, and the slower evening delivery
+ITEM_SECONDS = {"classic": 12, "meat": 18, "vegetable": 14, "special": 22, "shashlik": 45}
+STAFF = {hour: 0.7 if 11 <= hour <= 13 else 1.0 for hour in range(24)}
+DELIVERY_MINUTES = {hour: 28 if 17 <= hour <= 19 else 18 for hour in range(24)}
+
+
+def simulate_orders(rng, catalog, days, per_day):
+    """(placed_at, order_id, items, ready_at, delivered_at) of a FIFO kitchen, by placement time."""
+    start = datetime(2026, 1, 1)
+    products = {product["id"]: product for product in catalog}
+    placements = []
+    for day in range(days):
+        for _ in range(per_day):
+            hour = rng.choices(range(24), weights=HOURLY_WEIGHTS)[0]
+            placements.append(start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600)))
+    placements.sort()
+
+    orders = []
+    kitchen_free = start
+    for index, placed_at in enumerate(placements):
+        payload = make_order_payload(rng, catalog, f"sim{index}")
+        items = [(item["id"], item["quantity"]) for item in payload["items"]]
+        work = sum(quantity * ITEM_SECONDS[products[product_id]["category"]] for product_id, quantity in items)
+        began = max(placed_at, kitchen_free)
+        ready_at = began + timedelta(seconds=work * STAFF[began.hour] * rng.lognormvariate(0, 0.25))
+        kitchen_free = ready_at
+        delivered_at = ready_at + timedelta(minutes=DELIVERY_MINUTES[ready_at.hour] * rng.lognormvariate(0, 0.2))
+        orders.append((placed_at, f"sim{index}", items, ready_at, delivered_at))
+    return orders
+
+
+def run_simulation(server, orders):
+    """Estimate every order when it is placed; returns (learned, default) errors in minutes."""
+    events = []
+    for placed_at, order_id, items, ready_at, delivered_at in orders:
+        heapq.heappush(events, (placed_at, 0, order_id))
+        heapq.heappush(events, (ready_at, 1, order_id))
+        heapq.heappush(events, (delivered_at, 2, order_id))
+    by_id = {order[1]: order for order in orders}
+    warm_up_until = orders[0][0] + timedelta(days=1)
+
+    active = {}  # order id -> [status, placed_at, delivering_at, items], in placement order
+    learned, default = [], []
+    db = server.SessionLocal()
+    try:
+        db.query(server.KitchenStatModel).delete()
+        db.commit()
+        while events:
+            at, kind, order_id = heapq.heappop(events)
+            placed_at, _, items, ready_at, delivered_at = by_id[order_id]
+            if kind == 0:
+                active[order_id] = ["processing", placed_at, None, items]
+                queued = [(key, *value) for key, value in active.items()]
+                if at >= warm_up_until:
+                    for stats, errors in ((kitchen.KitchenStats.load(db), learned), (kitchen.KitchenStats([]), default)):
+                        estimate = kitchen.KitchenQueue(stats, queued).estimate(order_id, at)
+                        errors.append(abs((estimate.arrives_at - delivered_at).total_seconds()) / 60)
+            elif kind == 1:
+                active[order_id][0], active[order_id][2] = "delivering", ready_at
+                kitchen.record_ready(db, placed_at, ready_at, items)
+                db.commit()
+            else:
+                del active[order_id]
+                kitchen.record_delivered(db, ready_at, delivered_at)
+                db.commit()
+    finally:
+        db.close()
+    learned.sort()
+    default.sort()
+    return learned, default
+
+
+async def time_gets(client, order_ids, before=None):
+    latencies = []
+    for index, order_id in enumerate(order_ids):
+        if before is not None:
+            await before(index)
+        start = time.perf_counter()
+        response = await client.get(f"/orders/{order_id}")
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    latencies.sort()
+    return latencies
+
+
+async def measure_cost(server, args):
+    catalog = generate(server, orders=args.orders, seed=args.seed)
+    rng = random.Random(args.seed)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=30)
+    async with client:
+        order_ids = []
+        for index in range(args.active):
+            payload = make_order_payload(rng, catalog, f"active{index}")
+            (await client.post("/orders", json=payload)).raise_for_status()
+            order_ids.append(payload["id"])
+
+        await client.get(f"/orders/{order_ids[0]}")
+        cached = await time_gets(client, order_ids * 5)
+
+        async def change_status(index):
+            # Bump the kitchen version, as any order placed or changed does
+            (await client.put(f"/orders/{order_ids[index]}", params={"status": "delivering"})).raise_for_status()
+
+        # Every other order: one goes out, the next one is looked up
+        changed = await time_gets(client, order_ids[1::2], lambda index: change_status(index * 2))
+
+    db = server.SessionLocal()
+    try:
+        start = time.perf_counter()
+        queue = server.load_kitchen(db)
+        rebuild = (time.perf_counter() - start) * 1000
+    finally:
+        db.close()
+
+    print(f"GET /orders/{{id}} with ETA, {args.orders} orders of history, {args.active} active:")
+    print(f"  queue cached          p50 {percentile(cached, 0.5):6.2f} ms  p99 {percentile(cached, 0.99):6.2f} ms")
+    print(f"  after a status change p50 {percentile(changed, 0.5):6.2f} ms  p99 {percentile(changed, 0.99):6.2f} ms")
+    print(f"  rebuilding the queue ({len(queue)} in the kitchen): {rebuild:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the kitchen's delivery estimates")
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--orders-per-day", type=int, default=120)
+    parser.add_argument("--orders", type=int, default=100000, help="order history for the cost measurement")
+    parser.add_argument("--active", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+
+    server = load_server(args.workdir)
+    rng = random.Random(args.seed)
+    orders = simulate_orders(rng, make_products(rng, 40), args.days, args.orders_per_day)
+    learned, default = run_simulation(server, orders)
+    print(f"Arrival estimate error over {len(learned)} orders (minutes, after the first day):")
+    for name, errors in (("learned", learned), ("defaults only", default)):
+        print(
+            f"  {name:<14} mean {sum(errors) / len(errors):5.1f}  p50 {percentile(errors, 0.5):5.1f}  "
+            f"p90 {percentile(errors, 0.9):5.1f}"
+        )
+
+    asyncio.run(measure_cost(server, args))
+
+
+if __name__ == "__main__":
+    main()
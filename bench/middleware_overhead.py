@@ -0,0 +1,81 @@
+"""
+Per-request overhead of the API's ASGI middleware
+
+Calls a trivial ASGI app directly, with and without each middleware, and
+reports the added time per request. The metrics middleware has a budget
+of 50us per request.
+
+Usage:
+    python bench/middleware_overhead.py [--requests 200000]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import common  # noqa: F401 - puts api/ on sys.path
+import metrics
+import profiler
+
+BUDGET_US = 50
+
+
+class Route:
+    path = "/orders/{order_id}"
+
+
+async def app(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}" * 250})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def time_app(asgi_app, requests):
+    scope = {"type": "http", "method": "GET", "path": "/orders/1", "headers": []}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await asgi_app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def main_async(requests):
+    candidates = {
+        "metrics": metrics.MetricsMiddleware(app),
+        "profiler (off)": profiler.ProfilerMiddleware(app),
+        "profiler (on)": profiler.ProfilerMiddleware(app, enabled=True),
+    }
+    # Warm up
+    for candidate in [app, *candidates.values()]:
+        await time_app(candidate, 1000)
+
+    base = await time_app(app, requests)
+    print(f"{'bare app':<16} {base * 1e6:8.2f} us/request")
+    overheads = {}
+    for name, candidate in candidates.items():
+        overheads[name] = (await time_app(candidate, requests) - base) * 1e6
+        print(f"{name:<16} {overheads[name]:+8.2f} us/request")
+    return overheads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ASGI middleware overhead")
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    overheads = asyncio.run(main_async(args.requests))
+    if overheads["metrics"] > BUDGET_US:
+        print(f"metrics middleware exceeds its {BUDGET_US}us budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
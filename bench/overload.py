@@ -0,0 +1,300 @@
+"""
+Orders under overload, with and without admission control
+
+Starts the API over HTTP (server.py, --workers worker processes) on a
+fresh benchmark database, once per mode:
+
+- direct: WRITE_QUEUE_SIZE=0, every order commits on its own in a
+  threadpool thread, as before admission.py
+- group: the group-commit writer with its bounded queue
+
+In each mode it first measures how many orders per second the API
+sustains with --clients closed-loop clients. Then customers arrive
+open-loop at --overload times what the first mode sustained (or
+--capacity) for --duration seconds, each from its own address
+(X-Forwarded-For), while shoppers browse the catalog at --browse-rate
+requests per second.
+Latencies are counted from when a request was due, so a client stuck
+behind a slow server is not hidden. Reports orders/s committed, 429s,
+failures and p50/p99 latency of each kind of request.
+
+Usage:
+    python bench/overload.py [--workers 2] [--overload 5] [--duration 15] [--orders 10000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from common import API_DIR, BENCH_DIR, DEFAULT_WORKDIR, free_port, percentile
+from datagen import make_order_payload
+
+MODES = {
+    "direct": {"WRITE_QUEUE_SIZE": "0"},
+    "group": {},
+}
+
+
+def start_server(workdir, port, workers, settings):
+    env = dict(
+        os.environ,
+        DATA_DIR=workdir,
+        SLOW_QUERY_MS="10000",
+        API_HOST="127.0.0.1",
+        API_PORT=str(port),
+        API_WORKERS=str(workers),
+        # Every simulated customer has its own address, taken by uvicorn
+        # from X-Forwarded-For as from a reverse proxy on this host, and
+        # is rate limited
+        RATE_LIMIT_EXEMPT="",
+        WRITE_RATE="0.5",
+        WRITE_BURST="10",
+        **settings
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(API_DIR, "server.py")],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.perf_counter() + 120
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=5).status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    process.terminate()
+    raise TimeoutError("API not ready after 120s")
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait()
+
+
+def customer_address(rng):
+    return f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+
+# A kept-alive connection the server had closed
+CLOSED = object()
+
+
+class Connections:
+    """
+    Keep-alive HTTP/1.1 connections to the API, at most `limit` at once.
+
+    Much cheaper per request than httpx, so that on a small machine the
+    load generator does not become the bottleneck it is measuring.
+    """
+
+    def __init__(self, port, limit, timeout):
+        self.port = port
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(limit)
+
+    async def request(self, method, path, body=b"", headers=""):
+        """The response status, or None if the request failed or timed out."""
+        async with self._slots:
+            if self._idle:
+                status = await self._send(self._idle.pop(), method, path, body, headers)
+                if status is not CLOSED:
+                    return status
+                # The server closed it while it was idle: once more on a new one
+            try:
+                connection = await asyncio.open_connection("127.0.0.1", self.port)
+            except OSError:
+                return None
+            status = await self._send(connection, method, path, body, headers)
+            return None if status is CLOSED else status
+
+    async def _send(self, connection, method, path, body, headers):
+        try:
+            status, keep = await asyncio.wait_for(self._exchange(connection, method, path, body, headers), self.timeout)
+        except ConnectionResetError:
+            connection[1].close()
+            return CLOSED
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            connection[1].close()
+            return None
+        if keep:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+        return status
+
+    @staticmethod
+    async def _exchange(connection, method, path, body, headers):
+        reader, writer = connection
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n{headers}\r\n"
+        )
+        writer.write(head.encode() + body)
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        status = int(status_line.split()[1])
+        length, keep = 0, True
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"connection":
+                keep = value.strip().lower() != b"close"
+        await reader.readexactly(length)
+        return status, keep
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+
+
+def order_requests(catalog, rng, prefix):
+    """Endless (body, headers) of new orders, each from its own customer address."""
+    index = 0
+    while True:
+        payload = make_order_payload(rng, catalog, f"{prefix}-{index}")
+        yield json.dumps(payload).encode(), f"X-Forwarded-For: {customer_address(rng)}\r\n"
+        index += 1
+
+
+async def closed_loop(connections, catalog, clients, seconds, seed):
+    """Orders per second committed by `clients` clients placing orders back to back."""
+    done = 0
+    deadline = time.perf_counter() + seconds
+    orders = order_requests(catalog, random.Random(seed), f"cap{seed}")
+
+    async def customer():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            body, headers = next(orders)
+            status = await connections.request("POST", "/orders", body, headers)
+            done += status == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(customer() for _ in range(clients)))
+    return done / (time.perf_counter() - start)
+
+
+async def open_loop(connections, catalog, rate, browse_rate, seconds, seed):
+    """Orders arriving at `rate` per second and catalog reads at `browse_rate`; latencies per kind."""
+    results = {"ok": [], "rejected": [], "failed": [], "browse": []}
+    tasks = []
+
+    # Prepared up front, so arrivals are not held up by building them
+    rng = random.Random(seed)
+    orders = order_requests(catalog, rng, f"load{seed}")
+    bodies = [next(orders) for _ in range(int(rate * seconds * 1.2) + 10)]
+    paths = ["/products" if rng.random() < 0.7 else f"/products/{rng.choice(catalog)['id']}" for _ in range(1000)]
+
+    async def order(due, index):
+        body, headers = bodies[index % len(bodies)]
+        status = await connections.request("POST", "/orders", body, headers)
+        kind = "ok" if status == 200 else "rejected" if status == 429 else "failed"
+        results[kind].append((time.perf_counter() - due) * 1000)
+
+    async def browse(due, index):
+        status = await connections.request("GET", paths[index % len(paths)])
+        results["browse" if status == 200 else "failed"].append((time.perf_counter() - due) * 1000)
+
+    async def arrivals(rate, spawn, rng):
+        start = time.perf_counter()
+        due = start
+        index = 0
+        while due - start < seconds:
+            due += rng.expovariate(rate)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(spawn(due, index)))
+            index += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        arrivals(rate, order, random.Random(seed + 1)),
+        arrivals(browse_rate, browse, random.Random(seed + 2)),
+    )
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    for latencies in results.values():
+        latencies.sort()
+    return results, elapsed
+
+
+def report(mode, rate, results, elapsed):
+    line = f"{mode:<7} offered {rate:6.0f}/s  committed {len(results['ok']) / elapsed:6.1f}/s"
+    line += f"  429 {len(results['rejected']) / elapsed:6.1f}/s  failed {len(results['failed']):5}"
+    print(line)
+    for kind, name in (("ok", "committed orders"), ("rejected", "429 responses"), ("browse", "catalog reads")):
+        latencies = results[kind]
+        if latencies:
+            print(
+                f"        {name:<17} p50 {percentile(latencies, 0.5):8.1f} ms  "
+                f"p99 {percentile(latencies, 0.99):8.1f} ms  max {latencies[-1]:8.1f} ms"
+            )
+
+
+async def run_mode(port, seed, args, rate=None):
+    catalog = httpx.get(f"http://127.0.0.1:{port}/products", timeout=30).json()
+    connections = Connections(port, args.max_connections, args.timeout)
+    try:
+        if rate is None:
+            return await closed_loop(connections, catalog, args.clients, args.duration, seed)
+        return await open_loop(connections, catalog, rate, args.browse_rate, args.duration, seed)
+    finally:
+        connections.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure order throughput and latency under overload")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--orders", type=int, default=10000, help="order history in the database")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per measurement")
+    parser.add_argument("--overload", type=float, default=5.0, help="offered load, in multiples of the capacity")
+    parser.add_argument("--capacity", type=float, help="orders/s taken as the capacity, instead of the first mode's")
+    parser.add_argument("--clients", type=int, default=16, help="closed-loop clients measuring the capacity")
+    parser.add_argument("--browse-rate", type=float, default=20.0, help="catalog reads per second")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--mode", action="append", choices=sorted(MODES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    capacity = args.capacity
+    for mode in args.mode or list(MODES):
+        subprocess.run(
+            [sys.executable, os.path.join(BENCH_DIR, "datagen.py"), "--orders", str(args.orders),
+             "--seed", str(args.seed), "--workdir", workdir],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        port = free_port()
+        process = start_server(workdir, port, args.workers, MODES[mode])
+        try:
+            sustained = asyncio.run(run_mode(port, args.seed, args))
+            print(f"{mode:<7} sustained {sustained:6.1f} orders/s ({args.clients} clients, {args.workers} workers)")
+            # The same offered load for every mode: a multiple of what the first one sustains
+            capacity = capacity or sustained
+            rate = capacity * args.overload
+            results, elapsed = asyncio.run(run_mode(port, args.seed, args, rate))
+            report(mode, rate, results, elapsed)
+        finally:
+            stop_server(process)
+
+
+if __name__ == "__main__":
+    main()
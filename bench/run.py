@@ -0,0 +1,166 @@
+"""
+Load-test runner for the Denov Baraka Somsa API
+
+Runs the scenarios from scenarios.py against the FastAPI app in-process
+(default, on a freshly generated database) or against a running server
+over HTTP (--url, seed its database with datagen.py first), reports
+throughput and p50/p95/p99 latency, and compares them with a stored
+baseline.
+
+Usage:
+    python bench/run.py [--orders 1000] [--duration 5] [--scenario lunch_rush]
+    python bench/run.py --url http://127.0.0.1:8000
+    python bench/run.py --save-baseline
+
+Exits with status 1 when a scenario regressed by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+from common import BENCH_DIR, DEFAULT_WORKDIR, load_server, percentile
+from datagen import generate
+from scenarios import SCENARIOS, Context
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+async def run_scenario(client, scenario, ctx, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, ctx)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result["throughput"] < reference["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.0f}/s < baseline {reference['throughput']:.0f}/s"
+            )
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']:.1f}ms > baseline {reference['p95_ms']:.1f}ms"
+            )
+    return regressions
+
+
+def print_results(results):
+    print(f"{'scenario':<18} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<18} {result['requests']:>9} {result['errors']:>7} {result['throughput']:>9.1f} "
+            f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+        )
+
+
+async def main_async(args):
+    if args.url:
+        mode = "http"
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        order_ids = []
+    else:
+        mode = "inprocess"
+        server = load_server(args.workdir)
+        generate(server, orders=args.orders, products=args.products, seed=args.seed)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=30
+        )
+        db = server.SessionLocal()
+        try:
+            order_ids = [row[0] for row in db.query(server.OrderModel.id).limit(10000)]
+        finally:
+            db.close()
+
+    names = args.scenario or list(SCENARIOS)
+    results = {}
+    async with client:
+        products = (await client.get("/products")).json()
+        for name in names:
+            scenario, concurrency = SCENARIOS[name]
+            ctx = Context(products, list(order_ids), seed=args.seed)
+            results[name] = await run_scenario(
+                client, scenario, ctx, args.concurrency or concurrency, args.duration
+            )
+    return mode, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Denov Baraka Somsa API")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, help="override the per-scenario concurrency")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    mode, results = asyncio.run(main_async(args))
+    print_results(results)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = f"{mode}-{args.orders}"
+
+    if args.save_baseline:
+        baselines.setdefault(key, {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline {key} to {args.baseline}")
+        return
+
+    regressions = compare(results, baselines.get(key, {}), args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    elif key in baselines:
+        print(f"\nNo regressions against baseline {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark scenarios
+
+Each scenario is an async callable performing one operation against the
+API through an httpx.AsyncClient and returning the response. The runner
+calls it repeatedly from `concurrency` workers and times every call.
+"""
+
+import itertools
+import os
+import random
+
+from datagen import make_order_payload
+
+
+class Context:
+    """State shared by the workers of one run: catalog, ids and a seeded RNG."""
+
+    def __init__(self, products, order_ids, seed=1):
+        self.products = products
+        self.order_ids = order_ids
+        self.rng = random.Random(seed)
+        self.counter = itertools.count()
+        self.image = os.urandom(60 * 1024)
+
+    def new_order_id(self):
+        return f"bench-{os.getpid()}-{next(self.counter)}"
+
+
+async def lunch_rush(client, ctx):
+    """A burst of customers placing orders at the same time."""
+    payload = make_order_payload(ctx.rng, ctx.products, ctx.new_order_id())
+    ctx.order_ids.append(payload["id"])
+    return await client.post("/orders", json=payload)
+
+
+async def admin_polling(client, ctx):
+    """Admins refreshing the dashboard: statistics, an order, the order list."""
+    choice = ctx.rng.random()
+    if choice < 0.5:
+        return await client.get("/stats")
+    if choice < 0.9 and ctx.order_ids:
+        return await client.get(f"/orders/{ctx.rng.choice(ctx.order_ids)}")
+    return await client.get("/orders")
+
+
+async def catalog_browsing(client, ctx):
+    """Customers opening the web app and looking at products."""
+    if ctx.rng.random() < 0.7:
+        return await client.get("/products")
+    return await client.get(f"/products/{ctx.rng.choice(ctx.products)['id']}")
+
+
+async def image_uploads(client, ctx):
+    """Admins adding products with a photo."""
+    return await client.post(
+        "/products",
+        data={
+            "name": f"Bench somsa {next(ctx.counter)}",
+            "description": "Benchmark product",
+            "price": "15000",
+            "category": "special",
+        },
+        files={"image": ("somsa.jpg", ctx.image, "image/jpeg")},
+    )
+
+
+# name -> (scenario, default concurrency)
+SCENARIOS = {
+    "lunch_rush": (lunch_rush, 32),
+    "admin_polling": (admin_polling, 4),
+    "catalog_browsing": (catalog_browsing, 16),
+    "image_uploads": (image_uploads, 2),
+}
@@ -0,0 +1,83 @@
+"""
+Latency of product search at a large catalog size
+
+Fills the benchmark database with 10k products (no orders) and times
+GET /products/search for typical queries, in process. For comparison it
+also times what the web app does without search: downloading the whole
+catalog from GET /products and filtering it on the client.
+
+Usage:
+    python bench/search_latency.py [--products 10000] [--requests 200]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import DEFAULT_WORKDIR, load_server, percentile
+from datagen import generate
+
+QUERIES = [
+    {"q": "somsa"},
+    {"q": "go'shtli somsa"},
+    {"q": "tov"},
+    {"q": "shashlik", "category": "shashlik"},
+    {"category": "meat"},
+    {"popular": "true", "limit": 20},
+    {"q": "zzz"},
+]
+
+
+def label(params):
+    return "&".join(f"{key}={value}" for key, value in params.items())
+
+
+async def time_requests(client, url, params, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(url, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    latencies.sort()
+    return latencies, response
+
+
+def report(name, latencies, size):
+    print(
+        f"{name:<32} {percentile(latencies, 0.5):8.2f} {percentile(latencies, 0.95):8.2f} "
+        f"{percentile(latencies, 0.99):8.2f} {size:>10}"
+    )
+
+
+async def main_async(args):
+    server = load_server(args.workdir)
+    generate(server, orders=0, products=args.products, seed=args.seed)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=30)
+
+    print(f"{'query':<32} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'bytes':>10}")
+    async with client:
+        for params in QUERIES:
+            await client.get("/products/search", params=params)
+            latencies, response = await time_requests(client, "/products/search", params, args.requests)
+            report(label(params) or "(all)", latencies, len(response.content))
+
+        # Without search: the whole catalog, filtered client-side
+        latencies, response = await time_requests(client, "/products", None, max(args.requests // 10, 1))
+        report("GET /products (full catalog)", latencies, len(response.content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure product search latency")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per query")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Time from spawning API workers to their being ready
+
+Fills the benchmark database, then starts --workers uvicorn processes at
+once, as a scale-out or a restart does, and polls each one until the
+probe path answers 200. Reports the time from spawn to ready per worker,
+and the import / init / warm-up split the workers report in GET /ready.
+
+With --fork the benchmark imports the API once and forks the workers
+from itself, as server.py does when run directly, so the time measured
+is what a forked worker still has to do: open its databases and warm up.
+
+Usage:
+    python bench/startup.py [--workers 4] [--orders 100000] [--products 2000]
+    python bench/startup.py --fork --skip-datagen
+    python bench/startup.py --skip-datagen --api-dir /path/to/old/api --probe /products
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from common import API_DIR, BENCH_DIR, DEFAULT_WORKDIR, free_port, percentile
+
+
+class Forked:
+    """A forked worker, stopped like a subprocess.Popen."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def terminate(self):
+        os.kill(self.pid, signal.SIGTERM)
+
+    def wait(self):
+        os.waitpid(self.pid, 0)
+
+
+def spawn(api_dir, workdir, port):
+    env = dict(os.environ, DATA_DIR=workdir, SLOW_QUERY_MS="10000")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--app-dir", api_dir,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def fork(server, port):
+    import uvicorn
+
+    pid = os.fork()
+    if pid == 0:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        try:
+            uvicorn.Server(uvicorn.Config(server.app, port=port, log_level="warning")).run()
+        finally:
+            os._exit(0)
+    return Forked(pid)
+
+
+def wait_ready(port, probe, started, timeout=120):
+    """Seconds from `started` until GET `probe` answers 200, and its body."""
+    url = f"http://127.0.0.1:{port}{probe}"
+    while time.perf_counter() - started < timeout:
+        try:
+            response = httpx.get(url, timeout=5)
+            if response.status_code == 200:
+                return time.perf_counter() - started, response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"Worker on port {port} not ready after {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time API workers from spawn to ready")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--skip-datagen", action="store_true", help="reuse the database in --workdir")
+    parser.add_argument("--api-dir", default=API_DIR, help="API to start, e.g. a checkout of an older version")
+    parser.add_argument("--probe", default="/ready", help="path answering 200 once a worker is ready")
+    parser.add_argument("--fork", action="store_true", help="fork workers from an imported API instead of spawning them")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    if not args.skip_datagen:
+        # In another process, so the databases are not open here when forking
+        subprocess.run(
+            [sys.executable, os.path.join(BENCH_DIR, "datagen.py"), "--orders", str(args.orders),
+             "--products", str(args.products), "--workdir", workdir],
+            check=True
+        )
+
+    server = None
+    if args.fork:
+        os.environ["DATA_DIR"] = workdir
+        os.environ.setdefault("SLOW_QUERY_MS", "10000")
+        sys.path.insert(0, os.path.abspath(args.api_dir))
+        import server
+
+    times = []
+    for round_number in range(args.rounds):
+        ports = [free_port() for _ in range(args.workers)]
+        started = time.perf_counter()
+        if server is not None:
+            workers = [fork(server, port) for port in ports]
+        else:
+            workers = [spawn(args.api_dir, workdir, port) for port in ports]
+        try:
+            results = [wait_ready(port, args.probe, started) for port in ports]
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.wait()
+        round_times = sorted(seconds for seconds, _ in results)
+        times.extend(round_times)
+        line = f"round {round_number + 1}: ready after {round_times[0]:.2f}s .. {round_times[-1]:.2f}s"
+        body = results[-1][1].json() if args.probe == "/ready" else None
+        if body:
+            line += (
+                f" (last worker: import {body['importSeconds']:.2f}s, init {body['initSeconds']:.2f}s, "
+                f"warm-up {body['warmupSeconds']:.2f}s)"
+            )
+        print(line)
+
+    times.sort()
+    mode = "fork" if args.fork else "spawn"
+    print(f"{args.workers} workers, {mode} to ready: p50 {percentile(times, 0.5):.2f}s  max {times[-1]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
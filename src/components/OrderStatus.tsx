@@ -134,8 +134,8 @@ const OrderStatus = () => {
 
         <div className="mt-4 space-y-4 max-h-[60vh] overflow-y-auto pr-2">
           {orders.map((order) => {
-            const deliveryCost = order.freeDelivery ? 0 : 10000;
-            const totalWithDelivery = order.total + deliveryCost;
+            const deliveryCost = order.deliveryFee ?? (order.freeDelivery ? 0 : 10000);
+            const totalWithDelivery = order.totalWithDelivery ?? order.total + deliveryCost;
             
             return (
               <div key={order.id} className="border rounded-md p-4 space-y-3">
@@ -167,7 +167,7 @@ const OrderStatus = () => {
                   <div className="flex justify-between text-sm">
                     <span>Yetkazib berish:</span>
                     <span className={order.freeDelivery ? "text-green-600 dark:text-green-400 font-medium" : "font-medium"}>
-                      {order.freeDelivery ? "Bepul" : "10,000 so'm"}
+                      {order.freeDelivery ? "Bepul" : `${deliveryCost.toLocaleString()} so'm`}
                     </span>
                   </div>
                   <div className="flex justify-between text-sm font-medium mt-1">
@@ -1,7 +1,7 @@
 import { Product } from "@/data/products";
 import { createContext, useContext, useEffect, useState, ReactNode } from "react";
 import { sendTelegramNotification, updateOrderStatusViaTelegram } from "@/utils/telegram";
-import { createOrder as apiCreateOrder, updateOrderStatus as apiUpdateOrderStatus, fetchOrders } from "@/utils/api";
+import { createOrder as apiCreateOrder, updateOrderStatus as apiUpdateOrderStatus, fetchOrders, OrderStatusConflictError } from "@/utils/api";
 import { toast } from "@/hooks/use-toast";
 
 export type CartItem = Product & {
@@ -20,6 +20,11 @@ export type Order = {
   status: "processing" | "delivering" | "completed" | "cancelled";
   createdAt: Date;
   freeDelivery: boolean;
+  // Set by the API when the order is saved
+  deliveryFee?: number | null;
+  totalWithDelivery?: number | null;
+  // Bumped by every status change; sent back so a stale change is refused
+  version?: number | null;
 };
 
 interface CartContextType {
@@ -191,7 +196,8 @@ export function CartProvider({ children }: { children: ReactNode }) {
   const updateOrderStatus = async (orderId: string, status: Order["status"]) => {
     try {
       // Update via API
-      const updatedOrder = await apiUpdateOrderStatus(orderId, status);
+      const current = orders.find(order => order.id === orderId);
+      const updatedOrder = await apiUpdateOrderStatus(orderId, status, current?.version);
       
       // Update local state
       setOrders(prevOrders => 
@@ -222,6 +228,24 @@ export function CartProvider({ children }: { children: ReactNode }) {
     } catch (error) {
       console.error("Failed to update order status:", error);
       
+      if (error instanceof OrderStatusConflictError) {
+        // Someone else changed the order first: show its real status
+        setOrders(prevOrders => 
+          prevOrders.map(order => 
+            order.id === orderId 
+              ? { ...order, status: error.status, version: error.version } 
+              : order
+          )
+        );
+        toast({
+          title: "Buyurtma holati o'zgarmadi",
+          description: `Buyurtma #${orderId.slice(-5)} allaqachon boshqa holatda. Ro'yxat yangilandi.`,
+          variant: "destructive",
+          duration: 3000,
+        });
+        return;
+      }
+      
       // Fallback: update local state only
       setOrders(prevOrders => 
         prevOrders.map(order => 
@@ -11,6 +11,27 @@ import { Button } from "@/components/ui/button";
 import { ShoppingCart, Settings } from "lucide-react";
 import OrderStatus from "@/components/OrderStatus";
 import { ThemeToggle } from "@/components/theme-toggle";
+import { searchProducts } from "@/utils/api";
+
+const filterLocally = (searchTerm: string, selectedCategory: ProductCategory | null) => {
+  let results = products;
+
+  // Filter by category
+  if (selectedCategory) {
+    results = results.filter(product => product.category === selectedCategory);
+  }
+
+  // Filter by search term
+  if (searchTerm) {
+    const term = searchTerm.toLowerCase();
+    results = results.filter(product =>
+      product.name.toLowerCase().includes(term) ||
+      product.description.toLowerCase().includes(term)
+    );
+  }
+
+  return results;
+};
 
 const Index = () => {
   const [searchTerm, setSearchTerm] = useState("");
@@ -20,23 +41,23 @@ const Index = () => {
 
   // Apply filters when search term or category changes
   useEffect(() => {
-    let results = products;
-
-    // Filter by category
-    if (selectedCategory) {
-      results = results.filter(product => product.category === selectedCategory);
-    }
+    let cancelled = false;
 
-    // Filter by search term
-    if (searchTerm) {
-      const term = searchTerm.toLowerCase();
-      results = results.filter(product =>
-        product.name.toLowerCase().includes(term) ||
-        product.description.toLowerCase().includes(term)
-      );
-    }
+    // Search on the server; filter the built-in menu if it is unreachable
+    // or has no products yet (facets ignore the category filter)
+    searchProducts({ q: searchTerm, category: selectedCategory ?? undefined })
+      .then(result => {
+        if (cancelled) return;
+        const catalogEmpty = !searchTerm && Object.keys(result.facets).length === 0;
+        setFilteredProducts(catalogEmpty ? filterLocally(searchTerm, selectedCategory) : result.results);
+      })
+      .catch(() => {
+        if (!cancelled) setFilteredProducts(filterLocally(searchTerm, selectedCategory));
+      });
 
-    setFilteredProducts(results);
+    return () => {
+      cancelled = true;
+    };
   }, [searchTerm, selectedCategory]);
 
   return (
@@ -29,6 +29,41 @@ export async function fetchProducts(): Promise<Product[]> {
   }
 }
 
+export interface ProductSearchParams {
+  q?: string;
+  category?: string;
+  popular?: boolean;
+  limit?: number;
+}
+
+export interface ProductSearchResult {
+  results: Product[];
+  facets: Record<string, number>; // matches per category, ignoring the category filter
+  total: number;
+}
+
+/**
+ * Search products on the server, ranked, with per-category counts
+ */
+export async function searchProducts(params: ProductSearchParams): Promise<ProductSearchResult> {
+  const query = new URLSearchParams();
+  if (params.q) query.set("q", params.q);
+  if (params.category) query.set("category", params.category);
+  if (params.popular !== undefined) query.set("popular", String(params.popular));
+  if (params.limit !== undefined) query.set("limit", String(params.limit));
+
+  try {
+    const response = await fetch(`${API_URL}/products/search?${query}`);
+    if (!response.ok) {
+      throw new Error(`Error searching products: ${response.statusText}`);
+    }
+    return await response.json();
+  } catch (error) {
+    console.error("Error searching products:", error);
+    throw error;
+  }
+}
+
 /**
  * Fetch a single product by ID
  */
@@ -203,14 +238,37 @@ export async function createOrder(orderData: Order): Promise<Order> {
 }
 
 /**
- * Update order status
+ * Thrown when the server refuses a status change because the order moved
+ * on (another admin changed it, or the transition is not allowed)
+ */
+export class OrderStatusConflictError extends Error {
+  constructor(message: string, public status: Order["status"], public version: number) {
+    super(message);
+    this.name = "OrderStatusConflictError";
+  }
+}
+
+/**
+ * Update order status; pass the version the order was shown at to
+ * refuse the change if someone changed it in the meantime
  */
-export async function updateOrderStatus(id: string, status: string): Promise<Order> {
+export async function updateOrderStatus(id: string, status: string, version?: number | null): Promise<Order> {
   try {
-    const response = await fetch(`${API_URL}/orders/${id}?status=${status}`, {
+    const params = new URLSearchParams({ status });
+    if (version !== undefined && version !== null) {
+      params.set("version", String(version));
+    }
+    const response = await fetch(`${API_URL}/orders/${id}?${params}`, {
       method: 'PUT',
     });
     
+    if (response.status === 409) {
+      const { detail } = await response.json();
+      if (typeof detail === "object") {
+        throw new OrderStatusConflictError(detail.message, detail.status, detail.version);
+      }
+    }
+    
     if (!response.ok) {
       throw new Error(`Error updating order status: ${response.statusText}`);
     }
@@ -258,3 +316,94 @@ export async function updateOrderRating(id: string, rating: number): Promise<Ord
     throw error;
   }
 }
+
+export interface Customer {
+  phone: string; // normalized, e.g. +998901234567
+  name: string;
+  address: string;
+  orderCount: number;
+  lastOrderId?: string | null;
+  lastOrderAt?: string | null;
+}
+
+/**
+ * The customer directory is for staff tools: every request needs the
+ * server's CUSTOMERS_TOKEN
+ */
+function customersHeaders(token: string): Record<string, string> {
+  return { 'X-Customers-Token': token };
+}
+
+/**
+ * Fetch a returning customer's latest details by phone, or null if the
+ * phone has not ordered before
+ */
+export async function fetchCustomer(phone: string, token: string): Promise<Customer | null> {
+  try {
+    const response = await fetch(`${API_URL}/customers/${encodeURIComponent(phone)}`, {
+      headers: customersHeaders(token),
+    });
+    if (response.status === 404 || response.status === 400) {
+      return null;
+    }
+    if (!response.ok) {
+      throw new Error(`Error fetching customer: ${response.statusText}`);
+    }
+    return await response.json();
+  } catch (error) {
+    console.error(`Error fetching customer ${phone}:`, error);
+    throw error;
+  }
+}
+
+/**
+ * Fetch a customer's latest orders, newest first
+ */
+export async function fetchCustomerOrders(phone: string, token: string, limit = 20): Promise<Order[]> {
+  try {
+    const response = await fetch(`${API_URL}/customers/${encodeURIComponent(phone)}/orders?limit=${limit}`, {
+      headers: customersHeaders(token),
+    });
+    if (!response.ok) {
+      throw new Error(`Error fetching customer orders: ${response.statusText}`);
+    }
+    const orders = await response.json();
+    return orders.map((order: any) => ({
+      ...order,
+      createdAt: new Date(order.createdAt)
+    }));
+  } catch (error) {
+    console.error(`Error fetching orders of ${phone}:`, error);
+    throw error;
+  }
+}
+
+/**
+ * Place the customer's last order again at today's prices; `id` makes a
+ * retried request return the same order instead of a second one
+ */
+export async function reorderLastOrder(phone: string, token: string, id?: string, address?: string): Promise<Order> {
+  try {
+    const response = await fetch(`${API_URL}/customers/${encodeURIComponent(phone)}/reorder`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...customersHeaders(token),
+      },
+      body: JSON.stringify({ id, address }),
+    });
+
+    if (!response.ok) {
+      throw new Error(`Error reordering: ${response.statusText}`);
+    }
+
+    const order = await response.json();
+    return {
+      ...order,
+      createdAt: new Date(order.createdAt)
+    };
+  } catch (error) {
+    console.error(`Error reordering for ${phone}:`, error);
+    throw error;
+  }
+}
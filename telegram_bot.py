@@ -8,6 +8,11 @@ To run this bot:
 1. Install requirements: pip install aiogram python-dotenv requests
 2. Create a .env file with BOT_TOKEN, CHANNEL_ID, and API_URL
 3. Run this script: python telegram_bot.py
+
+Every branch of the shop has its own order channel and admins (see
+BRANCH_CHANNELS and BRANCH_ADMINS). Requests to the API name the branch
+in the X-Branch header, and changes name the admin making them in
+X-Actor, for the API's audit log.
 """
 
 import asyncio
@@ -15,9 +20,12 @@ import json
 import logging
 import os
 import requests
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, Router, types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
 from aiogram.fsm.context import FSMContext
@@ -33,14 +41,253 @@ logging.basicConfig(level=logging.INFO)
 # Bot token from @BotFather
 BOT_TOKEN = "7800150423:AAHGggsUXgUmZxLZY7MnSv0f9X0vD6GBx2Y"
 
-# Channel/group ID where orders will be sent
-CHANNEL_ID = "-1002388351836"
+# Channel/group ID where each branch's orders will be sent. The first
+# branch is the default one, for orders that do not name a branch
+BRANCH_CHANNELS = {
+    "denov": "-1002388351836",
+}
 
 # REST API URL
 API_URL = "http://localhost:8000"
 
-# Admin IDs who can access admin commands
-ADMIN_IDS = [int(id) for id in "5846982343".split(",") if id]
+# Admin IDs who can manage each branch
+BRANCH_ADMINS = {
+    "denov": [int(id) for id in "5846982343".split(",") if id],
+}
+
+DEFAULT_BRANCH = next(iter(BRANCH_CHANNELS))
+
+# Admins of any branch
+ADMIN_IDS = sorted({admin_id for admin_ids in BRANCH_ADMINS.values() for admin_id in admin_ids})
+
+def admin_branches(user_id):
+    """Branches `user_id` administers, in BRANCH_CHANNELS order."""
+    return [branch for branch in BRANCH_CHANNELS if user_id in BRANCH_ADMINS.get(branch, [])]
+
+def branch_headers(branch, admin_id=None):
+    headers = {"X-Branch": branch}
+    if admin_id is not None:
+        headers["X-Actor"] = f"telegram:{admin_id}"
+    return headers
+
+def branch_title(branch, user_id):
+    """Branch name to prefix messages with, only for admins of several branches."""
+    return f"🏪 {branch}\n" if len(admin_branches(user_id)) > 1 else ""
+
+# Messages showing each order with its status buttons, so bulk changes can
+# update them; the oldest are forgotten first
+ORDER_MESSAGES_LIMIT = 5000
+order_messages = OrderedDict()  # (branch, order_id) -> {(chat_id, message_id)}
+
+def remember_order_message(branch, order_id, chat_id, message_id):
+    key = (branch, order_id)
+    order_messages.setdefault(key, set()).add((chat_id, message_id))
+    order_messages.move_to_end(key)
+    while len(order_messages) > ORDER_MESSAGES_LIMIT:
+        order_messages.popitem(last=False)
+
+class EditQueue:
+    """
+    Message edits paced under Telegram's flood limits.
+
+    Telegram allows about one message a second per chat, 20 a minute per
+    group and 30 a second overall, and edits count. Bulk changes queue
+    their edits here and answer the admin at once; a background task
+    sends them, only the newest text per message, and backs off when
+    Telegram asks it to.
+    """
+    GROUP_INTERVAL = 3.0
+    CHAT_INTERVAL = 1.0
+    GLOBAL_INTERVAL = 1 / 30
+
+    def __init__(self):
+        self._pending = OrderedDict()  # (chat_id, message_id) -> (text, reply_markup)
+        self._next_at = {}  # chat_id -> time.monotonic() of its next allowed edit
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def edit(self, chat_id, message_id, text, reply_markup=None):
+        # A newer edit of a queued message replaces it, keeping its place
+        self._pending[(chat_id, message_id)] = (text, reply_markup)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def join(self):
+        """Wait until every queued edit was sent."""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    def _interval(self, chat_id):
+        return self.GROUP_INTERVAL if int(chat_id) < 0 else self.CHAT_INTERVAL
+
+    async def _run(self):
+        while self._pending:
+            now = time.monotonic()
+            ready = next(
+                (key for key in self._pending if self._next_at.get(key[0], 0) <= now), None
+            )
+            if ready is None:
+                await asyncio.sleep(min(self._next_at[chat_id] for chat_id, _ in self._pending) - now)
+                continue
+            
+            chat_id, message_id = ready
+            text, reply_markup = self._pending.pop(ready)
+            self._next_at[chat_id] = now + self._interval(chat_id)
+            try:
+                await bot.edit_message_text(
+                    text=text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+                )
+            except TelegramRetryAfter as e:
+                # Flood limit hit anyway: wait as told, unless a newer edit came in
+                self._next_at[chat_id] = time.monotonic() + e.retry_after
+                self._pending.setdefault(ready, (text, reply_markup))
+            except TelegramBadRequest:
+                pass  # deleted, or already showing this text
+            except Exception as e:
+                logging.error(f"Error editing message {message_id} in {chat_id}: {e}")
+            await asyncio.sleep(self.GLOBAL_INTERVAL)
+
+edit_queue = EditQueue()
+
+class ApiCache:
+    """
+    API responses the bot reuses for a few seconds.
+
+    Admins opening the panel together would each fetch the same /orders
+    and /products. Responses are kept per (branch, path) for the TTL of
+    their kind (CACHE_TTL), and callers asking for a key that is being
+    fetched wait for that fetch instead of starting their own (single
+    flight). Fetches run in a thread, as requests blocks.
+
+    The bot's own changes drop the entries they affect. Changes made
+    elsewhere (the web app, the web admin) come from the API's change
+    counters, GET /changes: an expired entry whose counter has not moved
+    is kept for another TTL instead of fetched again, and /changes itself
+    is fetched at most once per CACHE_TTL["/changes"] for all of them.
+    Only 200 responses are kept, at most `limit` of them: the least
+    recently used go first. Callers must not modify what they get.
+    """
+
+    def __init__(self, fetch, ttl, limit):
+        self.fetch = fetch  # (branch, path) -> (status code, JSON body or None), blocking
+        self.ttl = ttl  # kind -> seconds
+        self.limit = limit
+        self.enabled = True
+        self._entries = OrderedDict()  # (branch, path) -> (status, body, expires, counter, version)
+        self._flights = {}  # (branch, path) -> task fetching it
+        self.stats = {name: Counter() for name in ("hits", "revalidated", "coalesced", "fetched")}  # by kind
+
+    async def get(self, branch, path, kind=None, counter=None):
+        """
+        (status code, JSON body) of GET `path`; `kind` names the path
+        for TTLs and stats (default: the path), and `counter` is the
+        API change counter the response depends on.
+        """
+        kind = kind or path
+        key = (branch, path)
+        if not self.enabled:
+            self.stats["fetched"][kind] += 1
+            return await asyncio.to_thread(self.fetch, branch, path)
+        
+        entry = self._entries.get(key)
+        if entry is not None:
+            status, body, expires, entry_counter, version = entry
+            if time.monotonic() < expires:
+                self.stats["hits"][kind] += 1
+                self._entries.move_to_end(key)
+                return status, body
+            # Expired, but nothing it depends on changed since
+            if version is not None and (await self._versions(branch)).get(entry_counter) == version:
+                self.stats["revalidated"][kind] += 1
+                self._store(key, (status, body, time.monotonic() + self.ttl[kind], entry_counter, version))
+                return status, body
+        
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._load(key, kind, counter))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._flights.pop(key) if self._flights.get(key) is done else None)
+        else:
+            self.stats["coalesced"][kind] += 1
+        # A caller giving up does not cancel the fetch for the others
+        return await asyncio.shield(flight)
+
+    async def _load(self, key, kind, counter):
+        branch, path = key
+        # Counters read before the response, so it is never older than them
+        version = (await self._versions(branch)).get(counter) if counter is not None else None
+        self.stats["fetched"][kind] += 1
+        status, body = await asyncio.to_thread(self.fetch, branch, path)
+        # Not if our own change dropped the key while it was in flight
+        if status == 200 and self._flights.get(key) is asyncio.current_task():
+            self._store(key, (status, body, time.monotonic() + self.ttl[kind], counter, version))
+        return status, body
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.limit:
+            self._entries.popitem(last=False)
+
+    async def _versions(self, branch):
+        """The API's change counters; empty if it has none."""
+        try:
+            status, versions = await self.get(branch, "/changes")
+        except Exception as e:
+            logging.error(f"Error fetching API changes: {e}")
+            return {}
+        return versions if status == 200 else {}
+
+    def invalidate(self, branch, *paths):
+        """Forget `paths` of `branch` after a change the bot made."""
+        for path in (*paths, "/changes"):
+            key = (branch, path)
+            self._entries.pop(key, None)
+            # Its fetch may have started before the change: not stored
+            self._flights.pop(key, None)
+
+    def report(self):
+        """Lines of hit rates per kind and the API calls saved."""
+        lines = []
+        lookups_total = fetched_total = 0
+        for kind in sorted(set().union(*self.stats.values())):
+            counts = {name: counter[kind] for name, counter in self.stats.items()}
+            lookups = sum(counts.values())
+            # Change checks are made by the cache, not asked for by handlers
+            if kind != "/changes":
+                lookups_total += lookups
+            fetched_total += counts["fetched"]
+            lines.append(
+                f"{kind}: {lookups} lookups, {counts['hits']} hits, {counts['revalidated']} revalidated, "
+                f"{counts['coalesced']} coalesced, {counts['fetched']} fetched "
+                f"({1 - counts['fetched'] / lookups:.0%} saved)"
+            )
+        if lookups_total:
+            lines.append(
+                f"API calls: {fetched_total} (change checks included) for {lookups_total} lookups, "
+                f"{lookups_total - fetched_total} saved ({1 - fetched_total / lookups_total:.0%})"
+            )
+        return lines
+
+# API responses kept at most, e.g. one per order looked up with /status
+API_CACHE_LIMIT = 1000
+
+# Seconds an API response is reused, by kind of path
+CACHE_TTL = {
+    "/products": 60,
+    "/orders": 10,
+    "/stats": 10,
+    "/orders/{id}": 5,  # the ETA counts down
+    "/changes": 1,
+}
+
+def fetch_from_api(branch, path):
+    response = requests.get(f"{API_URL}{path}", headers=branch_headers(branch))
+    return response.status_code, response.json() if response.status_code == 200 else None
+
+api_cache = ApiCache(fetch_from_api, CACHE_TTL, API_CACHE_LIMIT)
 
 # Main router
 router = Router()
@@ -54,33 +301,96 @@ class ProductStates(StatesGroup):
     waiting_for_image = State()
     waiting_for_popular = State()
 
+# Order actions the API accepts in each status; final orders have none.
+# Orders are accepted when placed, so there is no "accept" button
+STATUS_ACTIONS = {
+    "processing": ("deliver", "cancel"),
+    "delivering": ("complete", "cancel"),
+}
+
 # Keyboard for order status actions
-def get_order_keyboard(order_id):
+def get_order_keyboard(order_id, branch=DEFAULT_BRANCH, status="processing"):
+    actions = STATUS_ACTIONS.get(status, ())
     keyboard = [
         [
-            InlineKeyboardButton(text="✅ Qabul qilish", callback_data=f"accept_{order_id}"),
+            InlineKeyboardButton(text="🚚 Yetkazish", callback_data=f"deliver_{branch}_{order_id}"),
+            InlineKeyboardButton(text="✓ Yakunlash", callback_data=f"complete_{branch}_{order_id}")
         ],
         [
-            InlineKeyboardButton(text="🚚 Yetkazish", callback_data=f"deliver_{order_id}"),
-            InlineKeyboardButton(text="✓ Yakunlash", callback_data=f"complete_{order_id}")
+            InlineKeyboardButton(text="❌ Bekor qilish", callback_data=f"cancel_{branch}_{order_id}")
+        ]
+    ]
+    keyboard = [
+        [button for button in row if button.callback_data.split("_", 1)[0] in actions]
+        for row in keyboard
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in keyboard if row])
+
+# Keyboard for admin actions
+def get_admin_keyboard(branch=DEFAULT_BRANCH):
+    keyboard = [
+        [
+            InlineKeyboardButton(text="📊 Buyurtmalar", callback_data=f"admin_orders_{branch}"),
+            InlineKeyboardButton(text="🛒 Mahsulotlar", callback_data=f"admin_products_{branch}")
         ],
         [
-            InlineKeyboardButton(text="❌ Bekor qilish", callback_data=f"cancel_{order_id}")
+            InlineKeyboardButton(text="📈 Statistika", callback_data=f"admin_stats_{branch}"),
+            InlineKeyboardButton(text="⚡ Ommaviy amallar", callback_data=f"admin_bulk_{branch}")
         ]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-# Keyboard for admin actions
-def get_admin_keyboard():
+# Bulk actions on every order in one status: action -> (from status, to status)
+BULK_ACTIONS = {
+    "deliver": ("processing", "delivering"),
+    "complete": ("delivering", "completed"),
+}
+
+# Keyboard for bulk status actions
+def get_bulk_keyboard(branch=DEFAULT_BRANCH):
     keyboard = [
         [
-            InlineKeyboardButton(text="📊 Buyurtmalar", callback_data="admin_orders"),
-            InlineKeyboardButton(text="🛒 Mahsulotlar", callback_data="admin_products")
+            InlineKeyboardButton(text="🚚 Barcha yangilarini yetkazishga", callback_data=f"bulk_deliver_{branch}")
+        ],
+        [
+            InlineKeyboardButton(text="✓ Barcha yetkazilayotganlarni yakunlash", callback_data=f"bulk_complete_{branch}")
         ],
         [
-            InlineKeyboardButton(text="📈 Statistika", callback_data="admin_stats")
+            InlineKeyboardButton(text="☑ Tanlab o'zgartirish", callback_data=f"select_{branch}")
+        ]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Keyboard confirming a bulk action
+def get_bulk_confirm_keyboard(action, branch=DEFAULT_BRANCH):
+    keyboard = [
+        [
+            InlineKeyboardButton(text="✅ Ha", callback_data=f"bulkok_{action}_{branch}"),
+            InlineKeyboardButton(text="✖ Yo'q", callback_data=f"bulkno_{branch}")
+        ]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Most orders one selection message lists (Telegram allows 100 buttons)
+SELECTION_LIMIT = 40
+
+# Keyboard for picking several orders, then one action for all of them
+def get_selection_keyboard(branch, orders, picked):
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                text=f"{'☑' if order['id'] in picked else '☐'} #{order['id'][-5:]} "
+                     f"{get_status_text(order['status'])} · {order['total']} so'm",
+                callback_data=f"pick_{branch}_{order['id']}"
+            )
         ]
+        for order in orders
     ]
+    keyboard.append([
+        InlineKeyboardButton(text=f"🚚 Yetkazish ({len(picked)})", callback_data=f"picked_deliver_{branch}"),
+        InlineKeyboardButton(text=f"✓ Yakunlash ({len(picked)})", callback_data=f"picked_complete_{branch}"),
+        InlineKeyboardButton(text=f"❌ Bekor ({len(picked)})", callback_data=f"picked_cancel_{branch}")
+    ])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 # Keyboard for product categories
@@ -97,39 +407,78 @@ def get_category_keyboard():
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-# Helper function to get products from API
-def get_products_from_api():
+# Helper function to get products from API, through the cache
+async def get_products_from_api(branch=DEFAULT_BRANCH):
     try:
-        response = requests.get(f"{API_URL}/products")
-        if response.status_code == 200:
-            return response.json()
+        status_code, products = await api_cache.get(branch, "/products", counter="products")
+        if status_code == 200:
+            return products
         return []
     except Exception as e:
         logging.error(f"Error fetching products from API: {e}")
         return []
 
-# Helper function to get orders from API
-def get_orders_from_api():
+# Helper function to get orders from API, through the cache
+async def get_orders_from_api(branch=DEFAULT_BRANCH):
     try:
-        response = requests.get(f"{API_URL}/orders")
-        if response.status_code == 200:
-            return response.json()
+        status_code, orders = await api_cache.get(branch, "/orders", counter="orders")
+        if status_code == 200:
+            return orders
         return []
     except Exception as e:
         logging.error(f"Error fetching orders from API: {e}")
         return []
 
-# Helper function to update order status
-def update_order_status_api(order_id, status):
+# Helper function to get order statistics from API, through the cache
+async def get_stats_from_api(branch=DEFAULT_BRANCH):
     try:
-        response = requests.put(f"{API_URL}/orders/{order_id}", params={"status": status})
-        if response.status_code == 200:
+        status_code, stats = await api_cache.get(branch, "/stats", counter="orders")
+        if status_code == 200:
+            return stats
+        return None
+    except Exception as e:
+        logging.error(f"Error fetching stats from API: {e}")
+        return None
+
+# Helper function to update order status; a 409 (another admin was first,
+# or the order cannot move there) returns the API's detail with the
+# order's current status instead of the updated order
+def update_order_status_api(order_id, status, branch=DEFAULT_BRANCH, admin_id=None):
+    try:
+        response = requests.put(
+            f"{API_URL}/orders/{order_id}", params={"status": status}, headers=branch_headers(branch, admin_id)
+        )
+        api_cache.invalidate(branch, "/orders", "/stats", f"/orders/{order_id}")
+        if response.status_code in (200, 409):
             return response.json()
         return None
     except Exception as e:
         logging.error(f"Error updating order status: {e}")
         return None
 
+# Helper function to change the status of many orders in one request: the
+# orders in `ids`, or every order in `from_status`
+def bulk_update_status_api(status, branch=DEFAULT_BRANCH, ids=None, from_status=None, admin_id=None):
+    payload = {"status": status}
+    if ids is not None:
+        payload["ids"] = ids
+    if from_status is not None:
+        payload["fromStatus"] = from_status
+    try:
+        response = requests.put(
+            f"{API_URL}/orders/status/bulk", json=payload, headers=branch_headers(branch, admin_id)
+        )
+        api_cache.invalidate(branch, "/orders", "/stats", *(f"/orders/{order_id}" for order_id in ids or ()))
+        if response.status_code == 200:
+            result = response.json()
+            api_cache.invalidate(branch, *(f"/orders/{order['id']}" for order in result["updated"]))
+            return result
+        logging.error(f"Error updating order statuses: {response.text}")
+        return None
+    except Exception as e:
+        logging.error(f"Error updating order statuses: {e}")
+        return None
+
 # Start command handler
 @router.message(Command("start"))
 async def cmd_start(message: types.Message):
@@ -137,7 +486,7 @@ async def cmd_start(message: types.Message):
         await message.answer(
             "Salom, administrator! Men Denov Baraka Somsa buyurtmalarini boshqarish botiman. "
             "Administrator paneliga kirish uchun /admin buyrug'ini ishlatishingiz mumkin.",
-            reply_markup=get_admin_keyboard()
+            reply_markup=get_admin_keyboard(admin_branches(message.from_user.id)[0])
         )
     else:
         await message.answer(
@@ -149,10 +498,12 @@ async def cmd_start(message: types.Message):
 @router.message(Command("admin"))
 async def cmd_admin(message: types.Message):
     if message.from_user.id in ADMIN_IDS:
-        await message.answer(
-            "Denov Baraka Somsa administrator paneli",
-            reply_markup=get_admin_keyboard()
-        )
+        # One panel per branch the admin manages
+        for branch in admin_branches(message.from_user.id):
+            await message.answer(
+                f"{branch_title(branch, message.from_user.id)}Denov Baraka Somsa administrator paneli",
+                reply_markup=get_admin_keyboard(branch)
+            )
     else:
         await message.answer("Sizda administrator paneliga kirish huquqi yo'q.")
 
@@ -168,6 +519,8 @@ Administrator uchun mavjud buyruqlar:
 /orders - Faol buyurtmalarni ko'rsatish
 /products - Mahsulotlar ro'yxatini ko'rsatish
 /stats - Buyurtmalar statistikasini ko'rsatish
+/bulk - Ko'p buyurtma holatini birdaniga o'zgartirish
+/cache - API keshi statistikasi
 
 Siz administrator paneli orqali buyurtmalar va mahsulotlarni boshqarishingiz mumkin.
 """
@@ -189,7 +542,11 @@ async def cmd_orders(message: types.Message):
         await message.answer("Sizda ushbu buyruqqa kirish huquqi yo'q.")
         return
     
-    orders = get_orders_from_api()
+    for branch in admin_branches(message.from_user.id):
+        await send_orders(message, branch, branch_title(branch, message.from_user.id))
+
+async def send_orders(message: types.Message, branch, title=""):
+    orders = await get_orders_from_api(branch)
     if not orders:
         await message.answer("Faol buyurtmalar yo'q yoki API bilan aloqa o'rnatishda xatolik.")
         return
@@ -202,16 +559,23 @@ async def cmd_orders(message: types.Message):
         return
     
     for order in active_orders:
-        order_id = order["id"]
-        order_text = f"""
-Buyurtma #{order_id[-5:] if len(order_id) > 5 else order_id}
+        sent = await message.answer(
+            order_summary_text(order, title),
+            reply_markup=get_order_keyboard(order["id"], branch, order["status"])
+        )
+        remember_order_message(branch, order["id"], sent.chat.id, sent.message_id)
+
+# Short text of an order next to its status buttons
+def order_summary_text(order, title=""):
+    order_id = order["id"]
+    return f"""
+{title}Buyurtma #{order_id[-5:] if len(order_id) > 5 else order_id}
 Holat: {get_status_text(order["status"])}
 Mijoz: {order["customer"]["name"]}
 Telefon: {order["customer"]["phone"]}
 Manzil: {order["customer"]["address"]}
 Jami: {order["total"]} so'm
 """
-        await message.answer(order_text, reply_markup=get_order_keyboard(order_id))
 
 # Products command handler
 @router.message(Command("products"))
@@ -220,14 +584,18 @@ async def cmd_products(message: types.Message):
         await message.answer("Sizda ushbu buyruqqa kirish huquqi yo'q.")
         return
     
-    products = get_products_from_api()
+    for branch in admin_branches(message.from_user.id):
+        await send_products(message, branch, branch_title(branch, message.from_user.id))
+
+async def send_products(message: types.Message, branch, title=""):
+    products = await get_products_from_api(branch)
     if not products:
         await message.answer("Mahsulotlar ro'yxati bo'sh yoki API bilan aloqa o'rnatishda xatolik.")
         return
     
     for product in products:
         product_text = f"""
-🍽 {product["name"]}
+{title}🍽 {product["name"]}
 📝 {product["description"]}
 💰 {product["price"]} so'm
 🏷 Kategoriya: {product["category"]}
@@ -254,30 +622,37 @@ async def cmd_stats(message: types.Message):
         await message.answer("Sizda ushbu buyruqqa kirish huquqi yo'q.")
         return
     
-    orders = get_orders_from_api()
-    if not orders:
+    for branch in admin_branches(message.from_user.id):
+        await send_stats(message, branch, branch_title(branch, message.from_user.id))
+
+async def send_stats(message: types.Message, branch, title=""):
+    # Counted and summed by the API in SQL, exact in whole so'm
+    stats = await get_stats_from_api(branch)
+    if not stats or not stats["totalOrders"]:
         await message.answer("Buyurtmalar haqida ma'lumot yo'q yoki API bilan aloqa o'rnatishda xatolik.")
         return
     
-    total_orders = len(orders)
-    completed_orders = len([o for o in orders if o["status"] == "completed"])
-    cancelled_orders = len([o for o in orders if o["status"] == "cancelled"])
-    active_orders = total_orders - completed_orders - cancelled_orders
-    
-    total_revenue = sum([o["total"] for o in orders if o["status"] == "completed"])
-    
     stats_text = f"""
-📊 Buyurtmalar statistikasi:
+{title}📊 Buyurtmalar statistikasi:
 
-Jami buyurtmalar: {total_orders}
-Faol buyurtmalar: {active_orders}
-Yakunlangan buyurtmalar: {completed_orders}
-Bekor qilingan buyurtmalar: {cancelled_orders}
+Jami buyurtmalar: {stats["totalOrders"]}
+Faol buyurtmalar: {stats["activeOrders"]}
+Yakunlangan buyurtmalar: {stats["completedOrders"]}
+Bekor qilingan buyurtmalar: {stats["cancelledOrders"]}
 
-💰 Umumiy daromad: {total_revenue} so'm
+💰 Umumiy daromad: {stats["totalRevenue"]} so'm
 """
     await message.answer(stats_text)
 
+# Hit rates of the API cache, and the requests it saved
+@router.message(Command("cache"))
+async def cmd_cache(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Sizda ushbu buyruqqa kirish huquqi yo'q.")
+        return
+    
+    await message.answer("\n".join(api_cache.report()) or "API keshi hali ishlatilmagan.")
+
 # Status command handler
 @router.message(Command("status"))
 async def cmd_status(message: types.Message):
@@ -289,11 +664,13 @@ async def cmd_status(message: types.Message):
     
     order_id = command_parts[1]
     
-    # Try to get order from API
+    # Try to get order from API; customers do not know the branch, so ask each
     try:
-        response = requests.get(f"{API_URL}/orders/{order_id}")
-        if response.status_code == 200:
-            order = response.json()
+        for branch in BRANCH_CHANNELS:
+            status_code, order = await api_cache.get(branch, f"/orders/{order_id}", kind="/orders/{id}")
+            if status_code != 404:
+                break
+        if status_code == 200:
             
             status_texts = {
                 "processing": "qabul qilingan",
@@ -305,6 +682,9 @@ async def cmd_status(message: types.Message):
             status_text = status_texts.get(order["status"], "noma'lum")
             
             response_text = f"Buyurtma #{order_id} holati: {status_text}"
+            eta = order.get("eta")
+            if eta:
+                response_text += "\n" + eta_text(eta)
             await message.answer(response_text)
         else:
             await message.answer(f"Buyurtma #{order_id} topilmadi.")
@@ -312,6 +692,26 @@ async def cmd_status(message: types.Message):
         logging.error(f"Error getting order status: {e}")
         await message.answer("Buyurtma holatini olishda xatolik yuz berdi. Iltimos, keyinroq qayta urinib ko'ring.")
 
+def eta_text(eta):
+    """The API's estimate for an active order, for customers."""
+    lines = []
+    if eta.get("queuePosition"):
+        lines.append(f"Oshxonada navbat: {eta['queuePosition']}-o'rin")
+    minutes = eta["minutes"]
+    if minutes <= 1:
+        lines.append("Taxminan hozir yetib keladi")
+    else:
+        lines.append(f"Taxminan {minutes} daqiqada yetib keladi")
+    return "\n".join(lines)
+
+# What happened to an order, after a status change
+STATUS_CHANGED_TEXT = {
+    "processing": "qabul qilindi",
+    "delivering": "yetkazilmoqda",
+    "completed": "yetkazildi",
+    "cancelled": "bekor qilindi"
+}
+
 # Helper function to get status text
 def get_status_text(status):
     status_map = {
@@ -323,12 +723,15 @@ def get_status_text(status):
     return status_map.get(status, status)
 
 # Add product handler
-@router.callback_query(lambda c: c.data == "add_product")
+@router.callback_query(lambda c: c.data == "add_product" or c.data.startswith("add_product_"))
 async def add_product_start(callback: types.CallbackQuery, state: FSMContext):
-    if callback.from_user.id not in ADMIN_IDS:
+    branches = admin_branches(callback.from_user.id)
+    branch = callback.data[len("add_product_"):] or (branches[0] if branches else DEFAULT_BRANCH)
+    if branch not in branches:
         await callback.answer("Sizda ushbu funksiyaga kirish huquqi yo'q.")
         return
         
+    await state.update_data(branch=branch)
     await callback.message.answer("Mahsulot nomini kiriting:")
     await state.set_state(ProductStates.waiting_for_name)
     await callback.answer()
@@ -444,7 +847,8 @@ async def process_popular(message: types.Message, state: FSMContext):
             response = requests.post(
                 f"{API_URL}/products", 
                 data=product_data,
-                files=files
+                files=files,
+                headers=branch_headers(data.get("branch", DEFAULT_BRANCH), message.from_user.id)
             )
             
             # Remove temp file
@@ -458,13 +862,19 @@ async def process_popular(message: types.Message, state: FSMContext):
     else:
         # Send to API without image
         try:
-            response = requests.post(f"{API_URL}/products", data=product_data)
+            response = requests.post(
+                f"{API_URL}/products",
+                data=product_data,
+                headers=branch_headers(data.get("branch", DEFAULT_BRANCH), message.from_user.id)
+            )
         except Exception as e:
             logging.error(f"Error uploading product: {e}")
             await message.answer(f"Mahsulotni yuklashda xatolik: {e}")
             await state.clear()
             return
     
+    api_cache.invalidate(data.get("branch", DEFAULT_BRANCH), "/products")
+    
     # Check response
     if response.status_code == 200:
         new_product = response.json()
@@ -492,19 +902,38 @@ async def process_popular(message: types.Message, state: FSMContext):
 # Callback query handler for order actions
 @router.callback_query(lambda c: c.data.startswith(("accept_", "deliver_", "complete_", "cancel_")))
 async def order_actions(callback: types.CallbackQuery):
-    if callback.from_user.id not in ADMIN_IDS:
-        await callback.answer("У вас нет доступа к этой функции.")
-        return
-        
     data = callback.data
     
-    # Parse action and order_id from callback data
+    # Parse action, branch and order_id from callback data; buttons sent
+    # before branches existed have no branch and belong to the default one
     if "_" in data:
         action, order_id = data.split("_", 1)
+        branch = DEFAULT_BRANCH
+        if "_" in order_id:
+            branch, order_id = order_id.split("_", 1)
+        
+        if callback.from_user.id not in BRANCH_ADMINS.get(branch, []):
+            await callback.answer("У вас нет доступа к этой функции.")
+            return
+        
+        short_id = order_id[-5:] if len(order_id) > 5 else order_id
+        if action == "accept":
+            # A button left on an older message: orders are accepted when
+            # placed, so there is nothing to change; show where it is now
+            status_code, order = await api_cache.get(branch, f"/orders/{order_id}", kind="/orders/{id}")
+            current = order["status"] if status_code == 200 else None
+            if current:
+                await callback.answer(f"Buyurtma #{short_id} allaqachon: {get_status_text(current)}")
+            else:
+                await callback.answer(f"Buyurtma #{short_id} arxivlangan, holatini o'zgartirib bo'lmaydi.")
+            try:
+                await callback.message.edit_reply_markup(reply_markup=get_order_keyboard(order_id, branch, current))
+            except TelegramBadRequest:
+                pass  # the keyboard already matches
+            return
         
         # Map actions to statuses
         status_mapping = {
-            "accept": "processing",
             "deliver": "delivering",
             "complete": "completed",
             "cancel": "cancelled"
@@ -516,34 +945,163 @@ async def order_actions(callback: types.CallbackQuery):
             return
         
         # Update order status in API
-        result = update_order_status_api(order_id, status)
+        result = update_order_status_api(order_id, status, branch, callback.from_user.id)
         
-        if result:
-            status_text_mapping = {
-                "processing": "qabul qilindi",
-                "delivering": "yetkazilmoqda",
-                "completed": "yetkazildi",
-                "cancelled": "bekor qilindi"
-            }
-            
-            status_text = status_text_mapping.get(status, status)
-            
-            await callback.answer(f"Buyurtma #{order_id[-5:] if len(order_id) > 5 else order_id} {status_text}")
+        if result and "detail" in result:
+            # Someone else changed it first, or it was archived: show where it is now
+            detail = result["detail"]
+            current = detail["status"] if isinstance(detail, dict) else None
+            if current:
+                await callback.answer(f"Buyurtma #{short_id} allaqachon: {get_status_text(current)}")
+            else:
+                await callback.answer(f"Buyurtma #{short_id} arxivlangan, holatini o'zgartirib bo'lmaydi.")
+            try:
+                await callback.message.edit_reply_markup(reply_markup=get_order_keyboard(order_id, branch, current))
+            except TelegramBadRequest:
+                pass  # the keyboard already matches
+        elif result:
+            await callback.answer(f"Buyurtma #{short_id} {STATUS_CHANGED_TEXT.get(status, status)}")
             
             # Update message text
-            order = result.get("order", {})
-            order_text = f"""
-Buyurtma #{order_id[-5:] if len(order_id) > 5 else order_id}
-Holat: {get_status_text(status)}
-Mijoz: {order["customer"]["name"]}
-Telefon: {order["customer"]["phone"]}
-Manzil: {order["customer"]["address"]}
-Jami: {order["total"]} so'm
-"""
-            await callback.message.edit_text(order_text, reply_markup=get_order_keyboard(order_id))
+            remember_order_message(branch, order_id, callback.message.chat.id, callback.message.message_id)
+            await callback.message.edit_text(
+                order_summary_text(result["order"]), reply_markup=get_order_keyboard(order_id, branch, status)
+            )
         else:
             await callback.answer("Buyurtma holatini yangilashda xatolik.")
 
+# Bulk actions command handler
+@router.message(Command("bulk"))
+async def cmd_bulk(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Sizda ushbu buyruqqa kirish huquqi yo'q.")
+        return
+    
+    for branch in admin_branches(message.from_user.id):
+        await message.answer(
+            f"{branch_title(branch, message.from_user.id)}Ommaviy amallar:", reply_markup=get_bulk_keyboard(branch)
+        )
+
+def bulk_result_text(result):
+    """Summary of a bulk status change for the admin."""
+    status = result["status"]
+    lines = [f"{len(result['updated'])} ta buyurtma {STATUS_CHANGED_TEXT.get(status, status)}."]
+    if result["conflicts"]:
+        lines.append(f"{len(result['conflicts'])} tasi allaqachon boshqa holatda.")
+    if result["notFound"]:
+        lines.append(f"{len(result['notFound'])} tasi topilmadi.")
+    return "\n".join(lines)
+
+def queue_order_edits(branch, orders):
+    """Update every remembered message of `orders` in the background."""
+    for order in orders:
+        for chat_id, message_id in order_messages.get((branch, order["id"]), ()):
+            edit_queue.edit(
+                chat_id, message_id, order_summary_text(order),
+                reply_markup=get_order_keyboard(order["id"], branch, order["status"])
+            )
+
+# Callback query handlers for bulk actions: pick, confirm, run
+@router.callback_query(lambda c: c.data.startswith("bulk_"))
+async def bulk_action_confirm(callback: types.CallbackQuery):
+    _, action, branch = callback.data.split("_", 2)
+    if callback.from_user.id not in BRANCH_ADMINS.get(branch, []) or action not in BULK_ACTIONS:
+        await callback.answer("Sizda ushbu funksiyaga kirish huquqi yo'q.")
+        return
+    
+    from_status, to_status = BULK_ACTIONS[action]
+    await callback.message.edit_text(
+        f"Barcha \"{get_status_text(from_status)}\" buyurtmalar \"{get_status_text(to_status)}\" bo'lsinmi?",
+        reply_markup=get_bulk_confirm_keyboard(action, branch)
+    )
+    await callback.answer()
+
+@router.callback_query(lambda c: c.data.startswith("bulkno_"))
+async def bulk_action_cancel(callback: types.CallbackQuery):
+    branch = callback.data.split("_", 1)[1]
+    await callback.message.edit_text("Ommaviy amallar:", reply_markup=get_bulk_keyboard(branch))
+    await callback.answer()
+
+@router.callback_query(lambda c: c.data.startswith("bulkok_"))
+async def bulk_action_run(callback: types.CallbackQuery):
+    _, action, branch = callback.data.split("_", 2)
+    if callback.from_user.id not in BRANCH_ADMINS.get(branch, []) or action not in BULK_ACTIONS:
+        await callback.answer("Sizda ushbu funksiyaga kirish huquqi yo'q.")
+        return
+    
+    from_status, to_status = BULK_ACTIONS[action]
+    result = bulk_update_status_api(to_status, branch, from_status=from_status, admin_id=callback.from_user.id)
+    if result is None:
+        await callback.answer("Buyurtma holatini yangilashda xatolik.")
+        return
+    
+    queue_order_edits(branch, result["updated"])
+    await callback.message.edit_text(bulk_result_text(result))
+    await callback.answer()
+
+# Open selections: (chat_id, message_id) -> {"branch", "orders", "picked"}
+selections = {}
+
+@router.callback_query(lambda c: c.data.startswith("select_"))
+async def selection_start(callback: types.CallbackQuery):
+    branch = callback.data.split("_", 1)[1]
+    if callback.from_user.id not in BRANCH_ADMINS.get(branch, []):
+        await callback.answer("Sizda ushbu funksiyaga kirish huquqi yo'q.")
+        return
+    
+    orders = await get_orders_from_api(branch) or []
+    active_orders = [order for order in orders if order["status"] not in ["completed", "cancelled"]]
+    if not active_orders:
+        await callback.answer("Faol buyurtmalar yo'q.")
+        return
+    
+    # Oldest first: those are the ones to close
+    active_orders = active_orders[:SELECTION_LIMIT]
+    sent = await callback.message.answer(
+        f"Buyurtmalarni tanlang ({len(active_orders)} ta):",
+        reply_markup=get_selection_keyboard(branch, active_orders, set())
+    )
+    selections[(sent.chat.id, sent.message_id)] = {"branch": branch, "orders": active_orders, "picked": set()}
+    await callback.answer()
+
+@router.callback_query(lambda c: c.data.startswith("pick_"))
+async def selection_toggle(callback: types.CallbackQuery):
+    _, branch, order_id = callback.data.split("_", 2)
+    selection = selections.get((callback.message.chat.id, callback.message.message_id))
+    if selection is None or callback.from_user.id not in BRANCH_ADMINS.get(branch, []):
+        await callback.answer("Ro'yxat eskirgan, /bulk orqali qayta oching.")
+        return
+    
+    selection["picked"] ^= {order_id}
+    await callback.message.edit_reply_markup(
+        reply_markup=get_selection_keyboard(branch, selection["orders"], selection["picked"])
+    )
+    await callback.answer()
+
+@router.callback_query(lambda c: c.data.startswith("picked_"))
+async def selection_run(callback: types.CallbackQuery):
+    _, action, branch = callback.data.split("_", 2)
+    key = (callback.message.chat.id, callback.message.message_id)
+    selection = selections.get(key)
+    if selection is None or callback.from_user.id not in BRANCH_ADMINS.get(branch, []):
+        await callback.answer("Ro'yxat eskirgan, /bulk orqali qayta oching.")
+        return
+    if not selection["picked"]:
+        await callback.answer("Hech narsa tanlanmagan.")
+        return
+    
+    status = {"deliver": "delivering", "complete": "completed", "cancel": "cancelled"}[action]
+    ids = [order["id"] for order in selection["orders"] if order["id"] in selection["picked"]]
+    result = bulk_update_status_api(status, branch, ids=ids, admin_id=callback.from_user.id)
+    if result is None:
+        await callback.answer("Buyurtma holatini yangilashda xatolik.")
+        return
+    
+    del selections[key]
+    queue_order_edits(branch, result["updated"])
+    await callback.message.edit_text(bulk_result_text(result))
+    await callback.answer()
+
 # Callback query handler for admin menu
 @router.callback_query(lambda c: c.data.startswith("admin_"))
 async def admin_menu_actions(callback: types.CallbackQuery):
@@ -551,14 +1109,23 @@ async def admin_menu_actions(callback: types.CallbackQuery):
         await callback.answer("Sizda ushbu funksiyaga kirish huquqi yo'q.")
         return
         
-    action = callback.data.split("_")[1]
+    parts = callback.data.split("_", 2)
+    action = parts[1]
+    branch = parts[2] if len(parts) > 2 else DEFAULT_BRANCH
+    if callback.from_user.id not in BRANCH_ADMINS.get(branch, []):
+        await callback.answer("Sizda ushbu funksiyaga kirish huquqi yo'q.")
+        return
     
+    # callback.message was sent by the bot, so check access here, not in cmd_*
+    title = branch_title(branch, callback.from_user.id)
     if action == "orders":
-        await cmd_orders(callback.message)
+        await send_orders(callback.message, branch, title)
     elif action == "products":
-        await cmd_products(callback.message)
+        await send_products(callback.message, branch, title)
     elif action == "stats":
-        await cmd_stats(callback.message)
+        await send_stats(callback.message, branch, title)
+    elif action == "bulk":
+        await callback.message.answer(f"{title}Ommaviy amallar:", reply_markup=get_bulk_keyboard(branch))
     else:
         await callback.answer("Funksiya ishlab chiqilmoqda")
     
@@ -582,17 +1149,46 @@ async def handle_webhook_data(message: types.Message):
         
         order_id = order_data["id"][-5:] if len(order_data["id"]) > 5 else order_data["id"]
         
+        branch = order_data.get("branch") or DEFAULT_BRANCH
+        if branch not in BRANCH_CHANNELS:
+            logging.error(f"Order for unknown branch {branch}")
+            await message.answer("Filial topilmadi.")
+            return
+        
+        # Save order to API first: it prices delivery and returns the totals
+        try:
+            # Add createdAt if not present
+            if "createdAt" not in order_data:
+                order_data["createdAt"] = datetime.now().isoformat()
+            
+            # Add status if not present
+            if "status" not in order_data:
+                order_data["status"] = "processing"
+                
+            response = requests.post(f"{API_URL}/orders", json=order_data, headers=branch_headers(branch))
+            api_cache.invalidate(branch, "/orders", "/stats")
+            if response.status_code == 200:
+                order_data = response.json()
+            else:
+                logging.error(f"Error saving order to API: {response.text}")
+        except Exception as e:
+            logging.error(f"Error saving order to API: {e}")
+        
         # Format items text
         items_text = "\n".join([
             f"- {item['name']} x {item['quantity']} = {item['price'] * item['quantity']} сум"
             for item in order_data["items"]
         ])
         
-        # Calculate delivery
-        delivery_text = "Bepul" if order_data.get("freeDelivery") else "15,000 so'm"
-        total_with_delivery = order_data["total"]
-        if not order_data.get("freeDelivery"):
-            total_with_delivery += 15000
+        # Delivery as priced by the API; unknown if the order could not be saved
+        delivery_fee = order_data.get("deliveryFee")
+        if order_data.get("freeDelivery"):
+            delivery_text = "Bepul"
+        elif delivery_fee is not None:
+            delivery_text = f"{delivery_fee:,.0f} so'm"
+        else:
+            delivery_text = "noma'lum"
+        total_with_delivery = order_data.get("totalWithDelivery") or order_data["total"]
         
         # Format order message
         order_text = f"""
@@ -609,29 +1205,15 @@ async def handle_webhook_data(message: types.Message):
 🚚 Yetkazib berish: {delivery_text}
 💵 Jami: {total_with_delivery} so'm
 """
-        # Send to channel/group
-        if CHANNEL_ID:
-            await bot.send_message(
-                CHANNEL_ID,
+        # Send to the branch's channel/group
+        channel_id = BRANCH_CHANNELS[branch]
+        if channel_id:
+            sent = await bot.send_message(
+                channel_id,
                 order_text,
-                reply_markup=get_order_keyboard(order_data["id"])
+                reply_markup=get_order_keyboard(order_data["id"], branch)
             )
-        
-        # Save order to API
-        try:
-            # Add createdAt if not present
-            if "createdAt" not in order_data:
-                order_data["createdAt"] = datetime.now().isoformat()
-            
-            # Add status if not present
-            if "status" not in order_data:
-                order_data["status"] = "processing"
-                
-            response = requests.post(f"{API_URL}/orders", json=order_data)
-            if response.status_code != 200:
-                logging.error(f"Error saving order to API: {response.text}")
-        except Exception as e:
-            logging.error(f"Error saving order to API: {e}")
+            remember_order_message(branch, order_data["id"], sent.chat.id, sent.message_id)
         
         # Reply to the webhook
         await message.answer(f"Buyurtma #{order_id} qabul qilindi.")